@@ -1,6 +1,8 @@
-import os
+import asyncio, json, os, time
+import asyncpg
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from ..metrics import DB_POOL_ACQUIRE_SECONDS, DB_POOL_IDLE, DB_POOL_SIZE, DB_QUERY_SECONDS, timed
 
 raw = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/transit")
 # psycopg2 does not understand the "+psycopg2" dialect suffix
@@ -8,6 +10,95 @@ DATABASE_URL = raw.replace("postgresql+psycopg2://", "postgresql://").replace(
     "postgres+psycopg2://", "postgres://"
 )
 
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "10"))
+
+_pool: asyncpg.Pool | None = None
+_pool_lock = asyncio.Lock()
+
 
 def conn():
+    # Blocking connection for scripts and one-off jobs; request handlers use the pool
     return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+
+
+async def _init_connection(con: asyncpg.Connection):
+    # Return json/jsonb as Python objects, like RealDictCursor did
+    for typ in ("json", "jsonb"):
+        await con.set_type_codec(typ, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+async def get_pool() -> asyncpg.Pool:
+    """The shared asyncpg pool, created on first use so the API starts without a database.
+
+    Queries run through the pool hit asyncpg's per-connection statement cache, so each
+    hot query is parsed and planned once per pooled connection rather than per request.
+    """
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    DATABASE_URL,
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    command_timeout=DB_COMMAND_TIMEOUT,
+                    init=_init_connection,
+                )
+                DB_POOL_SIZE.set_function(lambda: _pool.get_size() if _pool else 0)
+                DB_POOL_IDLE.set_function(lambda: _pool.get_idle_size() if _pool else 0)
+    return _pool
+
+
+async def init_pool():
+    try:
+        await get_pool()
+    except Exception as e:
+        # DB not up yet; the pool is retried on the first query
+        print("database pool init failed:", e)
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+class _Acquire:
+    """`async with acquire() as con:` that records time spent waiting for a connection."""
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        pool = await get_pool()
+        t0 = time.perf_counter()
+        self._pool = pool
+        self._con = await pool.acquire()
+        DB_POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - t0)
+        return self._con
+
+    async def __aexit__(self, *exc):
+        await self._pool.release(self._con)
+
+
+def acquire() -> _Acquire:
+    return _Acquire()
+
+
+@timed(DB_QUERY_SECONDS)
+async def fetch(sql: str, *args) -> list[dict]:
+    async with acquire() as con:
+        return [dict(row) for row in await con.fetch(sql, *args)]
+
+
+@timed(DB_QUERY_SECONDS)
+async def fetchrow(sql: str, *args) -> dict | None:
+    async with acquire() as con:
+        row = await con.fetchrow(sql, *args)
+        return dict(row) if row is not None else None
+
+
+@timed(DB_QUERY_SECONDS)
+async def fetchval(sql: str, *args):
+    async with acquire() as con:
+        return await con.fetchval(sql, *args)
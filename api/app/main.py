@@ -1,12 +1,28 @@
-import os
+import asyncio, os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import health, routes, stops, vehicles, replay
-from .metrics import metrics_app
+from .routers import analytics, health, routes, stops, vehicles, replay, tiles
+from .metrics import RequestTimer, metrics_app
+from .db.connection import close_pool, init_pool
+from .services.gauges import run_collector
+from .services.stop_index import stops as stop_index
 
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:4200").split(",")
 
-app = FastAPI(title="Baltimore Transit API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_pool()
+    # Warm the nearest-stop index; /stops/near uses PostGIS until it is loaded
+    await stop_index.refresh()
+    collector = asyncio.create_task(run_collector())
+    yield
+    collector.cancel()
+    await close_pool()
+
+
+app = FastAPI(title="Baltimore Transit API", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,12 +31,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so the latency covers every other middleware
+app.add_middleware(RequestTimer)
 
 app.include_router(health.router, prefix="/healthz", tags=["health"])
 app.include_router(routes.router, prefix="/routes", tags=["routes"])
 app.include_router(stops.router, prefix="/stops", tags=["stops"])
 app.include_router(vehicles.router, prefix="/vehicles", tags=["vehicles"])
 app.include_router(replay.router, prefix="/replay", tags=["replay"])
+app.include_router(tiles.router, prefix="/tiles", tags=["tiles"])
+app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 
 # Expose Prometheus metrics at /metrics
 app.mount("/metrics", metrics_app)
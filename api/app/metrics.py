@@ -1,4 +1,5 @@
-from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, Counter, Gauge, generate_latest
+import functools, inspect, time
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
 from starlette.applications import Starlette
 from starlette.responses import Response
 from starlette.routing import Route
@@ -6,6 +7,82 @@ from starlette.routing import Route
 registry = CollectorRegistry()
 INGEST_LAG_SECONDS = Gauge("ingest_lag_seconds", "Age of last GTFS-RT payload", registry=registry)
 VEHICLE_COUNT = Gauge("vehicle_count", "Current vehicles in cache", registry=registry)
+DB_POOL_SIZE = Gauge("db_pool_size", "Open connections in the API database pool", registry=registry)
+DB_POOL_IDLE = Gauge("db_pool_idle", "Idle connections in the API database pool", registry=registry)
+_FAST = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_seconds", "Time spent waiting for a pooled database connection", buckets=_FAST, registry=registry
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "Request latency by route template (streams count until the client disconnects)",
+    ["method", "route", "status"],
+    buckets=_FAST + (5, 10),
+    registry=registry,
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds", "Database call time including pool acquire, by helper", ["op"], buckets=_FAST, registry=registry
+)
+REDIS_CALL_SECONDS = Histogram(
+    "redis_call_seconds", "Redis helper call time, by helper", ["op"], buckets=_FAST, registry=registry
+)
+
+
+def timed(histogram: Histogram):
+    """Decorator observing each call of a sync or async function, labelled by its name."""
+
+    def wrap(fn):
+        child = histogram.labels(fn.__name__)
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - t0)
+
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - t0)
+
+        return run
+
+    return wrap
+
+
+class RequestTimer:
+    """ASGI middleware timing each HTTP request under its route template (e.g.
+    /stops/{stop_id}/arrivals), so per-ID paths do not explode the label set."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        t0 = time.perf_counter()
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # The router records the matched route on the (shared) scope
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - t0)
+
 
 async def metrics_endpoint(request):
     data = generate_latest(registry)
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, HTTPException, Query
+from ..services.analytics import bunching_hotspots, route_speeds
+
+router = APIRouter()
+
+# Bounds what one request can scan
+MAX_RANGE = timedelta(days=93)
+
+
+def _range_or_400(start: datetime, end: datetime):
+    if end <= start or end - start > MAX_RANGE:
+        raise HTTPException(status_code=400, detail=f"end must be after start and at most {MAX_RANGE.days} days later")
+
+
+@router.get("/routes/{route_id}/speed")
+async def speed(
+    route_id: str,
+    start: datetime,
+    end: datetime,
+    hour_from: int = Query(default=0, ge=0, le=23, description="Local hour, inclusive"),
+    hour_to: int = Query(default=24, ge=1, le=24, description="Local hour, exclusive"),
+):
+    """Average reported vehicle speed on a route, e.g. 4-6pm over a month."""
+    _range_or_400(start, end)
+    return await route_speeds(route_id, start, end, hour_from, hour_to)
+
+
+@router.get("/routes/{route_id}/bunching")
+async def bunching(
+    route_id: str,
+    start: datetime,
+    end: datetime,
+    gap: float = Query(default=400, gt=0, description="Meters between consecutive vehicles that count as bunched"),
+    limit: int = Query(default=20, ge=1, le=200),
+):
+    """Where on the route vehicles bunch: shape stretches ranked by bunching events."""
+    _range_or_400(start, end)
+    return await bunching_hotspots(route_id, start, end, gap_meters=gap, limit=limit)
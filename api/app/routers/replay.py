@@ -1,9 +1,40 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from ..services.replay import REPLAY_MAX_MINUTES, decode_frames, minute_blob, parse_minute, stream_frames
 
 router = APIRouter()
 
 
+def _minute_or_400(value: str) -> int:
+    try:
+        return parse_minute(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="minutes must be YYYYMMDDHHmm (UTC)")
+
+
 @router.get("/vehicles")
-def vehicles_replay(minute: str = Query(..., description="YYYYMMDDHHmm")):
-    # Placeholder: would fetch compressed snapshot from Redis positions:minute:{minute}
-    return []
+async def vehicles_replay(
+    minute: str | None = Query(default=None, description="YYYYMMDDHHmm (UTC)"),
+    start: str | None = Query(default=None, description="YYYYMMDDHHmm (UTC), first minute of a range"),
+    end: str | None = Query(default=None, description="YYYYMMDDHHmm (UTC), last minute of a range (default: start)"),
+    route_id: str | None = None,
+):
+    """Recorded vehicle positions.
+
+    `minute` returns that minute's frames as one JSON document. `start`/`end` stream the
+    range as newline-delimited JSON, one frame ({"ts", "vehicles"}) per line, decoding
+    one minute at a time.
+    """
+    if minute is not None:
+        m = _minute_or_400(minute)
+        blob = await minute_blob(m)
+        if blob is None:
+            raise HTTPException(status_code=404, detail="no positions recorded for that minute")
+        return {"minute": minute, "frames": decode_frames(blob, route_id)}
+    if start is None:
+        raise HTTPException(status_code=400, detail="pass minute, or start (and end)")
+    lo = _minute_or_400(start)
+    hi = _minute_or_400(end) if end is not None else lo
+    if hi < lo or (hi - lo) // 60 >= REPLAY_MAX_MINUTES:
+        raise HTTPException(status_code=400, detail=f"range must be 1..{REPLAY_MAX_MINUTES} minutes")
+    return StreamingResponse(stream_frames(lo, hi, route_id), media_type="application/x-ndjson")
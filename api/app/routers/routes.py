@@ -1,27 +1,39 @@
-from fastapi import APIRouter, Response
-from ..db.connection import conn
-from ..services.redis_client import get_derived_routes
+import asyncio, json
+from fastapi import APIRouter, Request, Response
+from redis.exceptions import RedisError
+from ..db.connection import fetch, fetchrow
+from ..services.redis_client import aget_alerts, aget_seed_version, get_derived_routes
+from ..services.response_cache import CachedBody, cache, cached_response
+from ..services.tiles import route_tile
 
 router = APIRouter()
 
 
 @router.get("")
-def list_routes():
-    # Primary: Postgres
+async def list_routes(request: Request):
+    # Primary: Postgres, encoded once per seed version; without Redis there is no
+    # version to cache by, so every request reads Postgres
     try:
-        with conn() as c, c.cursor() as cur:
-            cur.execute(
-                "SELECT route_id, short_name, long_name, color, text_color, type FROM routes ORDER BY route_id"
-            )
-            rows = cur.fetchall()
-            if rows:
-                return rows
+        version = await aget_seed_version()
+    except RedisError:
+        version = None
+    body = cache.get("routes", version) if version is not None else None
+    if body is not None:
+        return cached_response(request, body)
+    try:
+        rows = await fetch(
+            "SELECT route_id, short_name, long_name, color, text_color, type FROM routes ORDER BY route_id"
+        )
+        if rows:
+            raw = json.dumps(rows, separators=(",", ":")).encode()
+            body = cache.put("routes", version, raw) if version is not None else CachedBody(None, raw)
+            return cached_response(request, body)
     except Exception:
         # DB not ready or schema not loaded
         pass
 
     # Fallback: derive from realtime vehicles stored in Redis
-    derived = get_derived_routes()
+    derived = await asyncio.to_thread(get_derived_routes)
     return [
         {
             "route_id": rid,
@@ -35,8 +47,16 @@ def list_routes():
     ]
 
 
+@router.get("/{route_id}/alerts")
+async def route_alerts(route_id: str, request: Request):
+    """Service alerts active now for a route, including those on single trips of it and
+    agency-wide ones of its feed."""
+    body = CachedBody(None, await aget_alerts("route", route_id))
+    return cached_response(request, body, cache_control="public, max-age=30")
+
+
 @router.get("/{route_id}/shape")
-def route_shape(route_id: str):
+async def route_shape(route_id: str):
     sql = """
       SELECT json_build_object(
         'type','FeatureCollection',
@@ -50,16 +70,14 @@ def route_shape(route_id: str):
       ) AS fc
       FROM shapes s
       JOIN trips t ON t.shape_id = s.shape_id
-      WHERE t.route_id = %s
+      WHERE t.route_id = $1
     """
-    with conn() as c, c.cursor() as cur:
-        cur.execute(sql, (route_id,))
-        row = cur.fetchone()
-        return row["fc"] or {"type": "FeatureCollection", "features": []}
+    row = await fetchrow(sql, route_id)
+    return row["fc"] or {"type": "FeatureCollection", "features": []}
 
 
 @router.get("/{route_id}/streets")
-def route_streets(route_id: str):
+async def route_streets(route_id: str):
     sql = """
       SELECT json_build_object(
         'type','FeatureCollection',
@@ -68,16 +86,14 @@ def route_streets(route_id: str):
         ) END
       ) AS fc
       FROM route_streets_geom
-      WHERE route_id = %s
+      WHERE route_id = $1
     """
-    with conn() as c, c.cursor() as cur:
-        cur.execute(sql, (route_id,))
-        row = cur.fetchone()
-        return (row and row["fc"]) or {"type": "FeatureCollection", "features": []}
+    row = await fetchrow(sql, route_id)
+    return (row and row["fc"]) or {"type": "FeatureCollection", "features": []}
 
 
 @router.get("/{route_id}/bbox")
-def route_bbox(route_id: str):
+async def route_bbox(route_id: str):
     """Return [minLon, minLat, maxLon, maxLat] for the route streets geometry.
     Fast to compute and useful to fit map view before loading tiles.
     """
@@ -90,45 +106,27 @@ def route_bbox(route_id: str):
       FROM (
         SELECT ST_Extent(geom) AS ext
         FROM route_streets_geom
-        WHERE route_id = %s
+        WHERE route_id = $1
       ) t
     """
-    with conn() as c, c.cursor() as cur:
-        cur.execute(sql, (route_id,))
-        row = cur.fetchone()
-        if not row or row["minx"] is None:
-            return None
-        return [row["minx"], row["miny"], row["maxx"], row["maxy"]]
+    row = await fetchrow(sql, route_id)
+    if not row or row["minx"] is None:
+        return None
+    return [row["minx"], row["miny"], row["maxx"], row["maxy"]]
 
 
 @router.get("/{route_id}/streets.mvt/{z}/{x}/{y}")
-def route_streets_mvt(route_id: str, z: int, x: int, y: int):
+async def route_streets_mvt(route_id: str, z: int, x: int, y: int, request: Request):
     """Serve vector tiles (MVT) for a single route's streets geometry.
-    Uses PostGIS ST_AsMVT with ST_TileEnvelope for clipping and transform to web mercator.
-    """
-    sql = """
-      WITH bounds AS (
-        SELECT ST_TileEnvelope(%s,%s,%s) AS env
-      ), data AS (
-        SELECT 
-          ST_AsMVTGeom(ST_Transform(r.geom, 3857), (SELECT env FROM bounds)) AS geom,
-          r.route_id
-        FROM route_streets_geom r, bounds
-        WHERE r.route_id = %s AND ST_Intersects(ST_Transform(r.geom,3857), (SELECT env FROM bounds))
-      )
-      SELECT ST_AsMVT(data, 'streets', 4096, 'geom') AS tile
-      FROM data
+    Rendered from the indexed web-mercator column and cached (memory LRU + Redis) per
+    route version, so a tile is only rebuilt after the route is re-matched.
     """
-    with conn() as c, c.cursor() as cur:
-        cur.execute(sql, (z, x, y, route_id))
-        row = cur.fetchone()
-        tile = row and row["tile"] or None
-        if not tile:
-            # Return an empty tile
-            empty = b""  # MapLibre accepts empty response
-            return Response(content=empty, media_type="application/vnd.mapbox-vector-tile", headers={
-                "Cache-Control": "public, max-age=86400"
-            })
-        return Response(content=bytes(tile), media_type="application/vnd.mapbox-vector-tile", headers={
-            "Cache-Control": "public, max-age=86400"
-        })
+    tile, version = await route_tile(route_id, z, x, y)
+    headers = {"Cache-Control": "public, max-age=3600"}
+    if version is not None:
+        etag = f'"{version}-{z}-{x}-{y}"'
+        headers["ETag"] = etag
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+    # An empty body is a valid empty tile for MapLibre
+    return Response(content=tile, media_type="application/vnd.mapbox-vector-tile", headers=headers)
@@ -1,24 +1,50 @@
-from fastapi import APIRouter
-from ..db.connection import conn
+from fastapi import APIRouter, Query, Request
+from pydantic import BaseModel, Field
+from ..services import stop_index
+from ..services.redis_client import aget_alerts
+from ..services.response_cache import CachedBody, cached_response
+from ..services.schedule import departures_board
 
 router = APIRouter()
 
 
+MAX_RADIUS = 5000
+MAX_BATCH_POINTS = 500
+
+
+class Point(BaseModel):
+    lat: float
+    lon: float
+
+
+class NearBatch(BaseModel):
+    points: list[Point] = Field(max_length=MAX_BATCH_POINTS)
+    r: int = Field(default=500, ge=1, le=MAX_RADIUS)
+    limit: int = Field(default=5, ge=1, le=50)
+
+
 @router.get("/near")
-def near(lat: float, lon: float, r: int = 500):
-    with conn() as c, c.cursor() as cur:
-        cur.execute(
-            """
-          SELECT stop_id, name, ST_Y(geom) AS lat, ST_X(geom) AS lon
-          FROM stops
-          WHERE ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s,%s),4326)::geography, %s)
-        """,
-            (lon, lat, r),
-        )
-        return cur.fetchall()
+async def near(lat: float, lon: float, r: int = Query(default=500, ge=1, le=MAX_RADIUS),
+               limit: int = Query(default=10, ge=1, le=50)):
+    """Stops within `r` meters, nearest first, each with `distance_m`."""
+    return await stop_index.stops.near(lat, lon, limit, r)
+
+
+@router.post("/near/batch")
+async def near_batch(body: NearBatch):
+    """Nearest stops for many points at once; one list per point, in request order."""
+    return await stop_index.stops.near_many([(p.lat, p.lon) for p in body.points], body.limit, body.r)
 
 
 @router.get("/{stop_id}/arrivals")
-def arrivals(stop_id: str):
-    # Placeholder: would read Redis "trip_eta:{stop_id}"
-    return []
+async def arrivals(stop_id: str, request: Request, limit: int = Query(default=10, ge=1, le=50)):
+    """Next departures from a stop: schedule blended with realtime predictions."""
+    body = await departures_board(stop_id, limit)
+    return cached_response(request, body, cache_control="public, max-age=15")
+
+
+@router.get("/{stop_id}/alerts")
+async def stop_alerts(stop_id: str, request: Request):
+    """Service alerts active now for a stop (and agency-wide ones of its feed)."""
+    body = CachedBody(None, await aget_alerts("stop", stop_id))
+    return cached_response(request, body, cache_control="public, max-age=30")
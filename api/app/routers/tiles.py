@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Query, Request, Response
+from ..services.tiles import network_tile
+
+router = APIRouter()
+
+
+@router.get("/network/{z}/{x}/{y}.mvt")
+async def network_mvt(
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    stops: bool | None = Query(default=None, description="Include a stops layer (default: z >= 14)"),
+):
+    """One vector tile with every route's streets (layer `streets`: route_id, short_name,
+    color, type) and optionally stops (layer `stops`), simplified to the tile's resolution."""
+    tile, version = await network_tile(z, x, y, stops)
+    etag = f'"{version}-{z}-{x}-{y}"'
+    headers = {"Cache-Control": "public, max-age=3600", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=tile, media_type="application/vnd.mapbox-vector-tile", headers=headers)
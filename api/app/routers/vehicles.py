@@ -1,17 +1,105 @@
-from fastapi import APIRouter, Query
-from ..services.redis_client import get_current_vehicles, get_ingest_lag_seconds
-from ..metrics import VEHICLE_COUNT, INGEST_LAG_SECONDS
+import asyncio, json
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from ..services.geo import parse_bbox
+from ..services.redis_client import (
+    VEHICLE_TTL,
+    find_vehicles,
+    get_vehicle_generation,
+    get_vehicle_snapshot,
+    get_vehicle_snapshot_generation,
+)
+from ..services.response_cache import cache, cached_response, negotiate
+from ..services.vehicle_stream import hub
 
 router = APIRouter()
 
+STREAM_HEARTBEAT_SECONDS = 15
+# Columnar fleet snapshot offered alongside JSON (format: ingest/src/snapshot.py)
+MSGPACK_TYPES = ("application/x-msgpack", "application/msgpack", "application/vnd.msgpack")
+
+
+def _bbox_or_400(bbox: str | None):
+    try:
+        return parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _vary_accept(resp):
+    # JSON and MessagePack bodies share the URL
+    resp.headers["Vary"] = "Accept, Accept-Encoding"
+    return resp
+
 
 @router.get("")
-def vehicles(bbox: str | None = Query(default=None), route_id: str | None = None):
-    """Return current vehicles from Redis; bbox/route_id can be used to filter in future."""
-    data = get_current_vehicles()
-    VEHICLE_COUNT.set(len(data))
-    lag = get_ingest_lag_seconds()
-    if lag is not None:
-        INGEST_LAG_SECONDS.set(lag)
-    # Optionally filter here by route_id and bbox.
-    return data
+def vehicles(
+    request: Request,
+    bbox: str | None = Query(default=None, description="minLon,minLat,maxLon,maxLat"),
+    route_id: str | None = None,
+):
+    """Return current vehicles from Redis, optionally limited to a bbox and/or route.
+
+    The unfiltered fleet is encoded once per ingest generation and served as cached bytes
+    with a strong ETag; filtered responses are already proportional to the viewport.
+    With `Accept: application/x-msgpack` the unfiltered fleet comes as ingest's columnar
+    snapshot instead, several times smaller than the JSON.
+    """
+    box = _bbox_or_400(bbox)
+    if box is not None or route_id is not None:
+        return find_vehicles(box, route_id)
+
+    # JSON wins ties and is the default; MessagePack only when asked for by name
+    if negotiate(request.headers.get("accept"), ("application/json",) + MSGPACK_TYPES) in MSGPACK_TYPES:
+        # Cached under the snapshot's own generation, read together with its bytes
+        body = cache.get("vehicles.msgpack", get_vehicle_snapshot_generation())
+        if body is None:
+            snap_gen, snapshot = get_vehicle_snapshot()
+            if snapshot is not None:
+                body = cache.put("vehicles.msgpack", snap_gen, snapshot)
+        if body is not None:
+            return _vary_accept(cached_response(request, body, media_type=MSGPACK_TYPES[0]))
+    gen = get_vehicle_generation()
+    # Vehicles can also age out without a write, so bodies are never older than half a TTL
+    body = cache.get("vehicles", gen, max_age=VEHICLE_TTL / 2)
+    if body is None:
+        data = find_vehicles()
+        body = cache.put("vehicles", gen, json.dumps(data, separators=(",", ":")).encode())
+    return _vary_accept(cached_response(request, body))
+
+
+@router.get("/stream")
+async def vehicles_stream(
+    request: Request,
+    bbox: str | None = Query(default=None, description="minLon,minLat,maxLon,maxLat"),
+    route_id: str | None = None,
+):
+    """Server-sent events: a `snapshot` of matching vehicles, then `delta` events carrying
+    only vehicles that changed ({"ts", "upserts": [...], "removes": ["feed:id"]})."""
+    box = _bbox_or_400(bbox)
+    sub = hub.subscribe(box, route_id)
+
+    async def events():
+        try:
+            while True:
+                if sub.resync:
+                    sub.resync = False
+                    snapshot = await asyncio.to_thread(find_vehicles, box, route_id)
+                    sub.visible = {f"{v.get('feed')}:{v.get('id')}" for v in snapshot}
+                    yield f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+                try:
+                    payload = await asyncio.wait_for(sub.queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: delta\ndata: {payload}\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,56 @@
+"""Pre-render route street tiles into the tile cache.
+
+    python -m app.seed_tiles                 # all routes, zooms TILE_SEED_ZOOMS (default 10-15)
+    ROUTE_IDS=localbus:10 TILE_SEED_ZOOMS=12-16 python -m app.seed_tiles
+"""
+import asyncio, os, time
+from .db.connection import close_pool, fetch
+from .services.tiles import cached_tile, render_route_tile, route_versions, tile_range
+
+SEED_CONCURRENCY = int(os.getenv("TILE_SEED_CONCURRENCY", "4"))
+
+
+def _zooms(spec: str) -> range:
+    lo, _, hi = spec.partition("-")
+    return range(int(lo), int(hi or lo) + 1)
+
+
+async def seed_route(route_id: str, version: int, bbox, zooms: range, sem: asyncio.Semaphore) -> int:
+    async def one(z, x, y):
+        async with sem:
+            key = f"tile:route:{route_id}:{version}:{z}/{x}/{y}"
+            await cached_tile(key, lambda: render_route_tile(route_id, z, x, y))
+
+    jobs = []
+    for z in zooms:
+        x0, y0, x1, y1 = tile_range(bbox, z)
+        jobs.extend(one(z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    await asyncio.gather(*jobs)
+    return len(jobs)
+
+
+async def main():
+    zooms = _zooms(os.getenv("TILE_SEED_ZOOMS", "10-15"))
+    only = {x.strip() for x in os.getenv("ROUTE_IDS", "").split(",") if x.strip()}
+    versions = await route_versions(force=True)
+    rows = await fetch(
+        """
+        SELECT route_id, ST_XMin(ext) AS minx, ST_YMin(ext) AS miny, ST_XMax(ext) AS maxx, ST_YMax(ext) AS maxy
+        FROM (SELECT route_id, ST_Extent(geom) AS ext FROM route_streets_geom GROUP BY route_id) t
+        ORDER BY route_id
+        """
+    )
+    sem = asyncio.Semaphore(SEED_CONCURRENCY)
+    for row in rows:
+        rid = row["route_id"]
+        if (only and rid not in only) or rid not in versions or row["minx"] is None:
+            continue
+        t0 = time.time()
+        bbox = (row["minx"], row["miny"], row["maxx"], row["maxy"])
+        n = await seed_route(rid, versions[rid], bbox, zooms, sem)
+        print(f"seeded {rid}: {n} tiles z{zooms.start}-{zooms.stop - 1} in {time.time() - t0:.1f}s")
+    await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
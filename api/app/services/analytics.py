@@ -0,0 +1,68 @@
+"""Historical queries over `vehicle_positions` (written by ingest/src/archive.py).
+
+Every query filters on route_id and a ts range first: the range prunes the table to
+the days asked for (it is partitioned by UTC day) and (route_id, ts) is indexed within
+each partition, so a month of one route reads only that route's rows.
+"""
+
+from datetime import datetime
+from ..db.connection import fetch
+from .schedule import AGENCY_TZ
+
+SPEED_SQL = """
+  SELECT hour, count(*) AS samples, count(DISTINCT vehicle_id) AS vehicles, avg(speed) AS avg_speed_mps
+  FROM (
+    SELECT extract(hour FROM ts AT TIME ZONE $4)::int AS hour, vehicle_id, speed
+    FROM vehicle_positions
+    WHERE route_id = $1 AND ts >= $2 AND ts < $3 AND speed IS NOT NULL
+  ) p
+  WHERE hour >= $5 AND hour < $6
+  GROUP BY GROUPING SETS ((), (hour))
+  ORDER BY hour NULLS FIRST
+"""
+
+# Latest position per vehicle per time bucket; on each shape, a vehicle closer than
+# `gap` meters behind the one ahead is bunched. Events are binned along the shape.
+BUNCHING_SQL = """
+  WITH b AS (
+    SELECT DISTINCT ON (vehicle_id, bucket) vehicle_id, shape_id, shape_dist, lat, lon, bucket
+    FROM (
+      SELECT vehicle_id, shape_id, shape_dist, lat, lon, ts,
+             floor(extract(epoch FROM ts) / $4) AS bucket
+      FROM vehicle_positions
+      WHERE route_id = $1 AND ts >= $2 AND ts < $3 AND shape_id IS NOT NULL AND off_route < $7
+    ) p
+    ORDER BY vehicle_id, bucket, ts DESC
+  ), g AS (
+    SELECT shape_id, shape_dist, lat, lon,
+           shape_dist - lag(shape_dist) OVER (PARTITION BY shape_id, bucket ORDER BY shape_dist) AS gap
+    FROM b
+  )
+  SELECT shape_id, (floor(shape_dist / $6) * $6)::int AS dist_from, count(*) AS events,
+         avg(gap) AS avg_gap_m, avg(lat) AS lat, avg(lon) AS lon
+  FROM g
+  WHERE gap < $5
+  GROUP BY 1, 2
+  ORDER BY events DESC
+  LIMIT $8
+"""
+
+
+async def route_speeds(route_id: str, start: datetime, end: datetime, hour_from: int = 0, hour_to: int = 24) -> dict:
+    """Average reported speed on a route over [start, end), overall and per local hour."""
+    rows = await fetch(SPEED_SQL, route_id, start, end, str(AGENCY_TZ), hour_from, hour_to)
+    total = next((r for r in rows if r["hour"] is None), None)
+    return {
+        "route_id": route_id,
+        "samples": total["samples"] if total else 0,
+        "vehicles": total["vehicles"] if total else 0,
+        "avg_speed_mps": total["avg_speed_mps"] if total else None,
+        "by_hour": [r for r in rows if r["hour"] is not None],
+    }
+
+
+async def bunching_hotspots(route_id: str, start: datetime, end: datetime, gap_meters: float = 400,
+                            bucket_seconds: int = 60, bin_meters: float = 250, max_off_route: float = 100,
+                            limit: int = 20) -> list[dict]:
+    """Stretches of a route's shapes where vehicles most often ran within `gap_meters`."""
+    return await fetch(BUNCHING_SQL, route_id, start, end, bucket_seconds, gap_meters, bin_meters, max_off_route, limit)
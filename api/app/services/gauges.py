@@ -0,0 +1,23 @@
+"""Fleet gauges refreshed on a timer instead of by whichever request happens to run."""
+
+import asyncio, os
+from ..metrics import INGEST_LAG_SECONDS, VEHICLE_COUNT
+from .redis_client import aget_fleet_stats
+
+METRICS_COLLECT_SECONDS = float(os.getenv("METRICS_COLLECT_SECONDS", "5"))
+
+
+async def collect_once():
+    lag, count = await aget_fleet_stats()
+    if lag is not None:
+        INGEST_LAG_SECONDS.set(lag)
+    VEHICLE_COUNT.set(count)
+
+
+async def run_collector():
+    while True:
+        try:
+            await collect_once()
+        except Exception as e:
+            print("gauge collector error:", e or type(e).__name__)
+        await asyncio.sleep(METRICS_COLLECT_SECONDS)
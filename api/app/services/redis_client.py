@@ -1,21 +1,96 @@
 import os, json, time
 import redis
+import redis.asyncio as aioredis
+from .geo import haversine_m, in_bbox
+from ..metrics import REDIS_CALL_SECONDS, timed
 
 _redis = redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://redis:6379/0"), decode_responses=True)
+# Async client for long-lived pub/sub listeners running on the event loop
+_aredis = aioredis.Redis.from_url(os.environ.get("REDIS_URL", "redis://redis:6379/0"), decode_responses=True)
+# Binary-safe clients for cached blobs (vector tiles, vehicle snapshots)
+_redis_bin = redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://redis:6379/0"))
+_aredis_bin = aioredis.Redis.from_url(os.environ.get("REDIS_URL", "redis://redis:6379/0"))
+
+# Must match ingest/src/writers.py: one key per vehicle, listed in a last-seen index
+VEHICLE_TTL = 30
+VEHICLE_INDEX = "vehicles:index"
+VEHICLE_GEO = "vehicles:geo"
+VEHICLE_DELTAS = "vehicles:deltas"
+VEHICLE_GEN = "vehicles:gen"
+# Columnar MessagePack fleet built by ingest (ingest/src/snapshot.py) and its generation,
+# written together in one transaction
+VEHICLE_SNAPSHOT = "vehicles:snapshot"
+VEHICLE_SNAPSHOT_GEN = "vehicles:snapshot:gen"
+# Per-stop predictions (trip_eta:{stop_id}) written by ingest's ETA stage; bumped per write
+ETA_GEN = "trip_eta:gen"
 
 
 def r() -> redis.Redis:
     return _redis
 
 
+def ar() -> aioredis.Redis:
+    return _aredis
+
+
+def r_bin() -> redis.Redis:
+    return _redis_bin
+
+
+def ar_bin() -> aioredis.Redis:
+    return _aredis_bin
+
+
 # helpers for vehicles mock/live
+def _route_members(route_id: str, cutoff: float) -> list[str]:
+    members = r().zrangebyscore(f"vehicles:route:{route_id}", cutoff, "+inf")
+    if not members and ":" in route_id:
+        # Static GTFS ids are "{feed}:{route_id}" while vehicles carry the feed's bare id
+        feed, bare = route_id.split(":", 1)
+        members = [
+            m for m in r().zrangebyscore(f"vehicles:route:{bare}", cutoff, "+inf") if m.startswith(f"{feed}:")
+        ]
+    return members
+
+
+def _bbox_members(bbox: tuple[float, float, float, float]) -> list[str]:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    cx, cy = (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+    # GEOSEARCH boxes are centred and sized in meters; use the wider edge so nothing in the
+    # bbox is missed, callers trim the overshoot exactly
+    width = max(haversine_m(min_lon, lat, max_lon, lat) for lat in (min_lat, max_lat)) * 1.01
+    height = haversine_m(cx, min_lat, cx, max_lat) * 1.01
+    return r().geosearch(VEHICLE_GEO, longitude=cx, latitude=cy, width=max(width, 1), height=max(height, 1), unit="m")
+
+
+def _load_vehicles(members: list[str]) -> list[dict]:
+    if not members:
+        return []
+    raws = r().mget([f"vehicle:{m}" for m in members])
+    # Expired keys (vehicles that just dropped out) come back as None
+    return [json.loads(raw) for raw in raws if raw]
+
+
 def get_current_vehicles():
-    raw = r().get("vehicles:current")
-    return [] if not raw else json.loads(raw)
+    return _load_vehicles(r().zrangebyscore(VEHICLE_INDEX, time.time() - VEHICLE_TTL, "+inf"))
 
 
-def set_current_vehicles(objs):
-    r().set("vehicles:current", json.dumps(objs), ex=30)
+@timed(REDIS_CALL_SECONDS)
+def find_vehicles(bbox: tuple[float, float, float, float] | None = None, route_id: str | None = None):
+    """Vehicles inside `bbox` and/or on `route_id`, resolved through the GEO and per-route
+    indexes so the cost follows the result size rather than the fleet."""
+    if not bbox and not route_id:
+        return get_current_vehicles()
+    members = None
+    if route_id:
+        members = _route_members(route_id, time.time() - VEHICLE_TTL)
+    if bbox:
+        in_box = set(_bbox_members(bbox))
+        members = list(in_box) if members is None else [m for m in members if m in in_box]
+    vehicles = _load_vehicles(members)
+    if bbox:
+        vehicles = [v for v in vehicles if in_bbox(v["lon"], v["lat"], bbox)]
+    return vehicles
 
 
 def set_ingest_timestamp(ts: float | None = None):
@@ -27,6 +102,75 @@ def get_ingest_lag_seconds():
     return None if not ts else max(0, int(time.time()) - int(ts))
 
 
+async def aget_fleet_stats() -> tuple[int | None, int]:
+    """(seconds since ingest last wrote, vehicles seen within VEHICLE_TTL) in one round trip."""
+    now = time.time()
+    pipe = ar().pipeline(transaction=False)
+    pipe.get("ingest:last_ts")
+    pipe.zcount(VEHICLE_INDEX, now - VEHICLE_TTL, "+inf")
+    ts, count = await pipe.execute()
+    return (None if not ts else max(0, int(now) - int(ts))), count
+
+
+@timed(REDIS_CALL_SECONDS)
+def get_vehicle_generation() -> str:
+    return r().get(VEHICLE_GEN) or "0"
+
+
+@timed(REDIS_CALL_SECONDS)
+def get_vehicle_snapshot_generation() -> str | None:
+    return r().get(VEHICLE_SNAPSHOT_GEN)
+
+
+@timed(REDIS_CALL_SECONDS)
+def get_vehicle_snapshot() -> tuple[str | None, bytes | None]:
+    """(generation, snapshot) read in one MGET, so the two always belong together."""
+    gen, blob = r_bin().mget(VEHICLE_SNAPSHOT_GEN, VEHICLE_SNAPSHOT)
+    return (gen.decode() if gen is not None else None), blob
+
+
+@timed(REDIS_CALL_SECONDS)
+def get_seed_version() -> str:
+    # Bumped by `make seed` whenever static GTFS is (re)loaded
+    return r().get("gtfs:seed_version") or "0"
+
+
+@timed(REDIS_CALL_SECONDS)
+async def aget_seed_version() -> str:
+    return await ar().get("gtfs:seed_version") or "0"
+
+
+@timed(REDIS_CALL_SECONDS)
+async def aget_board_versions() -> tuple[str, str]:
+    """Seed version and ETA generation in one round trip; together they version a stop board."""
+    seed, gen = await ar().mget("gtfs:seed_version", ETA_GEN)
+    return seed or "0", gen or "0"
+
+
+@timed(REDIS_CALL_SECONDS)
+async def aget_stop_etas(stop_id: str, since: float, count: int) -> list[tuple[list, int]]:
+    """Realtime predictions for a stop from `since` on, earliest first, as (member, eta)."""
+    rows = await ar().zrangebyscore(f"trip_eta:{stop_id}", since, "+inf", start=0, num=count, withscores=True)
+    return [(json.loads(m), int(score)) for m, score in rows]
+
+
+@timed(REDIS_CALL_SECONDS)
+async def aget_alerts(kind: str, entity_id: str) -> bytes:
+    """Active alerts for a route, stop or trip as a JSON array, from ingest's alerts:* index.
+
+    Agency-wide alerts of the entity's feed are included; both keys come back in one MGET.
+    """
+    feed = entity_id.split(":", 1)[0]
+    own, agency = await ar().mget(f"alerts:{kind}:{entity_id}", f"alerts:agency:{feed}")
+    if not agency or not own:
+        return (own or agency or "[]").encode()
+    own_alerts = json.loads(own)
+    seen = {a["id"] for a in own_alerts}
+    merged = own_alerts + [a for a in json.loads(agency) if a["id"] not in seen]
+    return json.dumps(merged, separators=(",", ":")).encode()
+
+
+@timed(REDIS_CALL_SECONDS)
 def get_derived_routes():
     raw = r().get("routes:derived")
     if not raw:
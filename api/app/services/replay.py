@@ -0,0 +1,90 @@
+"""Reads the per-minute position history written by ingest/src/history.py.
+
+Each minute is one zstd blob (format documented there), kept in Redis as
+`positions:minute:{YYYYMMDDHHmm}` (UTC) for the last hours and in `position_minutes`
+for longer. Minutes are fetched and decompressed one at a time, so a range request
+only ever holds one minute in memory.
+"""
+
+import json, os, struct
+from datetime import datetime, timezone
+from typing import AsyncIterator
+import asyncpg
+import numpy as np
+import zstandard
+from ..db.connection import fetchval
+from .redis_client import ar_bin
+
+REPLAY_MAX_MINUTES = int(os.getenv("REPLAY_MAX_MINUTES", "120"))
+MINUTE_FORMAT = "%Y%m%d%H%M"
+COORD_SCALE = 1_000_000
+_COLUMNS = ("<i4", "<i4", "<i4", "<i2", "<i2")
+
+
+def parse_minute(value: str) -> int:
+    """Epoch of a YYYYMMDDHHmm minute in UTC."""
+    return int(datetime.strptime(value, MINUTE_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+
+
+def minute_key(minute: int) -> str:
+    return "positions:minute:" + datetime.fromtimestamp(minute, timezone.utc).strftime(MINUTE_FORMAT)
+
+
+def decode_frames(blob: bytes, route_id: str | None = None) -> list[dict]:
+    """[{"ts", "vehicles": [...]}] for one minute, optionally limited to a route."""
+    raw = zstandard.ZstdDecompressor().decompress(blob)
+    (hlen,) = struct.unpack_from("<I", raw)
+    head = json.loads(raw[4:4 + hlen])
+    total = sum(head["n"])
+    pos = 4 + hlen
+    cols = []
+    for dt in _COLUMNS:
+        arr = np.frombuffer(raw, dtype=dt, count=total, offset=pos).astype(np.int64)
+        pos += arr.size * np.dtype(dt).itemsize
+        cols.append(arr)
+    ids, routes = head["ids"], head["routes"]
+    feeds = [m.split(":", 1) for m in ids]
+    last_lat = np.zeros(len(ids), dtype=np.int64)
+    last_lon = np.zeros(len(ids), dtype=np.int64)
+    frames = []
+    start = 0
+    for off, n in zip(head["ts"], head["n"]):
+        sl = slice(start, start + n)
+        start += n
+        # Deltas are applied for every vehicle so later frames stay correct when filtering
+        ix = np.cumsum(cols[0][sl]) - 1
+        last_lat[ix] += cols[1][sl]
+        last_lon[ix] += cols[2][sl]
+        vehicles = []
+        for i, la, lo, h, s in zip(ix.tolist(), last_lat[ix].tolist(), last_lon[ix].tolist(),
+                                   cols[3][sl].tolist(), cols[4][sl].tolist()):
+            if route_id is not None and routes[i] != route_id:
+                continue
+            feed, vid = feeds[i]
+            vehicles.append({
+                "id": vid, "feed": feed, "route_id": routes[i], "lat": la / COORD_SCALE, "lon": lo / COORD_SCALE,
+                "heading": None if h < 0 else h, "speed": None if s < 0 else s / 100,
+            })
+        frames.append({"ts": head["minute"] + off, "vehicles": vehicles})
+    return frames
+
+
+async def minute_blob(minute: int) -> bytes | None:
+    """A minute's blob from Redis, else from the Postgres archive."""
+    blob = await ar_bin().get(minute_key(minute))
+    if blob is not None:
+        return blob
+    try:
+        return await fetchval("SELECT blob FROM position_minutes WHERE minute = to_timestamp($1)", minute)
+    except (OSError, asyncpg.PostgresError):
+        return None
+
+
+async def stream_frames(start: int, end: int, route_id: str | None = None) -> AsyncIterator[bytes]:
+    """Newline-delimited JSON frames for the minutes start..end (inclusive), in order."""
+    for minute in range(start, end + 60, 60):
+        blob = await minute_blob(minute)
+        if blob is None:
+            continue
+        for frame in decode_frames(blob, route_id):
+            yield json.dumps(frame, separators=(",", ":")).encode() + b"\n"
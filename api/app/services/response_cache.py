@@ -0,0 +1,121 @@
+import gzip, hashlib, threading, time
+from collections import OrderedDict
+import brotli
+from fastapi import Request, Response
+
+
+class CachedBody:
+    """Pre-encoded response body plus lazily built compressed variants."""
+
+    __slots__ = ("version", "raw", "etag", "built_at", "_encoded")
+
+    def __init__(self, version, raw: bytes):
+        self.version = version
+        self.raw = raw
+        self.etag = f'"{hashlib.blake2b(raw, digest_size=12).hexdigest()}"'
+        self.built_at = time.monotonic()
+        self._encoded: dict[str, bytes] = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        body = self._encoded.get(encoding)
+        if body is None:
+            if encoding == "br":
+                body = brotli.compress(self.raw, quality=5)
+            else:
+                body = gzip.compress(self.raw, compresslevel=6)
+            self._encoded[encoding] = body
+        return body
+
+    def etag_for(self, encoding: str | None) -> str:
+        # Strong validators must differ between content-codings of the same data
+        return f'{self.etag[:-1]}-{encoding}"' if encoding else self.etag
+
+
+class ResponseCache:
+    """Named response bodies keyed by a data version (ingest generation, seed version...).
+
+    A body is rebuilt only when its version changes or it is older than `max_age`. With a
+    `capacity`, the least recently used names are evicted beyond it (for open-ended names
+    such as one board per stop).
+    """
+
+    def __init__(self, capacity: int | None = None):
+        self._bodies: OrderedDict[str, CachedBody] = OrderedDict()
+        self._lock = threading.Lock()
+        self.capacity = capacity
+
+    def get(self, name: str, version, max_age: float | None = None) -> CachedBody | None:
+        body = self._bodies.get(name)
+        if body is None or body.version != version:
+            return None
+        if max_age is not None and time.monotonic() - body.built_at > max_age:
+            return None
+        if self.capacity is not None:
+            with self._lock:
+                if name in self._bodies:
+                    self._bodies.move_to_end(name)
+        return body
+
+    def put(self, name: str, version, raw: bytes) -> CachedBody:
+        body = CachedBody(version, raw)
+        with self._lock:
+            prev = self._bodies.get(name)
+            # Same bytes under a new version: keep the old entry's compressed variants
+            if prev is not None and prev.etag == body.etag:
+                prev.version, prev.built_at = version, body.built_at
+                return prev
+            self._bodies[name] = body
+            if self.capacity is not None:
+                self._bodies.move_to_end(name)
+                while len(self._bodies) > self.capacity:
+                    self._bodies.popitem(last=False)
+        return body
+
+
+def _qvalues(header: str) -> dict[str, float]:
+    """token -> q for an Accept or Accept-Encoding header."""
+    out = {}
+    for part in header.split(","):
+        token, *params = [p.strip() for p in part.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        out[token.lower()] = q
+    return out
+
+
+def negotiate(header: str | None, offers, wildcard: str | None = None) -> str | None:
+    """The offer with the highest q in `header` (ties go to the earlier offer), or None
+    when none is acceptable. `wildcard` (e.g. "*") covers offers the header leaves out."""
+    q = _qvalues(header or "")
+    default = q.get(wildcard, 0.0) if wildcard else 0.0
+    best, best_q = None, 0.0
+    for offer in offers:
+        offer_q = q.get(offer, default)
+        if offer_q > best_q:
+            best, best_q = offer, offer_q
+    return best
+
+
+def cached_response(request: Request, body: CachedBody, media_type: str = "application/json",
+                    cache_control: str = "no-cache") -> Response:
+    encoding = negotiate(request.headers.get("accept-encoding"), ("br", "gzip"), "*")
+    etag = body.etag_for(encoding)
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    inm = request.headers.get("if-none-match")
+    if inm and etag in [t.strip().removeprefix("W/") for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return Response(content=body.encoded(encoding), media_type=media_type, headers=headers)
+    return Response(content=body.raw, media_type=media_type, headers=headers)
+
+
+cache = ResponseCache()
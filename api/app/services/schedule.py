@@ -0,0 +1,165 @@
+import asyncio, json, os, time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from ..db.connection import fetch
+from .redis_client import aget_board_versions, aget_stop_etas
+from .response_cache import CachedBody, ResponseCache
+from .tiles import LRU
+
+AGENCY_TZ = ZoneInfo(os.getenv("AGENCY_TZ") or os.getenv("TZ") or "America/New_York")
+# How far ahead a board looks for departures
+ARRIVALS_HORIZON_SECONDS = int(os.getenv("ARRIVALS_HORIZON_SECONDS", str(3 * 3600)))
+# Stops whose boards are kept in memory; the least recently asked for are evicted
+BOARD_CACHE_SIZE = int(os.getenv("BOARD_CACHE_SIZE", "2048"))
+# Scheduled rows are fetched for the smallest of these covering the requested limit
+LIMIT_BUCKETS = (10, 20, 50)
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+ACTIVE_SERVICES_SQL = """
+  SELECT service_id FROM calendar
+  WHERE $1::date BETWEEN start_date AND end_date AND {weekday}
+  UNION
+  SELECT service_id FROM calendar_dates WHERE date = $1::date AND exception_type = 1
+  EXCEPT
+  SELECT service_id FROM calendar_dates WHERE date = $1::date AND exception_type = 2
+"""
+
+DEPARTURES_SQL = """
+  SELECT trip_id, route_id, headsign, departure_secs, arrival_secs, stop_sequence
+  FROM stop_departures
+  WHERE stop_id = $1 AND departure_secs >= $2 AND departure_secs < $3 AND service_id = ANY($4::text[])
+  ORDER BY departure_secs
+  LIMIT $5
+"""
+
+# Realtime predictions this far in the past still show (e.g. a bus that is "due")
+ETA_GRACE_SECONDS = 60
+
+# (service date, seed version) -> active service_ids
+_services: dict[tuple[date, str], list[str]] = {}
+# (stop_id, limit bucket) -> (seed, minute, scheduled rows); reused across ETA generations
+_boards = LRU(BOARD_CACHE_SIZE)
+# Encoded boards, "arrivals:{stop_id}:{limit}"
+boards = ResponseCache(capacity=BOARD_CACHE_SIZE)
+
+
+def service_day_start(day: date, tz: ZoneInfo = AGENCY_TZ) -> datetime:
+    """GTFS times count from "noon minus 12h", which differs from midnight on DST days.
+
+    The subtraction is done in UTC; timedelta arithmetic in `tz` would be wall-clock.
+    """
+    noon = datetime.combine(day, dtime(12), tz).astimezone(timezone.utc)
+    return (noon - timedelta(hours=12)).astimezone(tz)
+
+
+async def active_services(day: date, seed: str) -> list[str]:
+    key = (day, seed)
+    hit = _services.get(key)
+    if hit is None:
+        rows = await fetch(ACTIVE_SERVICES_SQL.format(weekday=WEEKDAYS[day.weekday()]), day)
+        hit = _services[key] = [r["service_id"] for r in rows]
+        # Only today and yesterday are ever asked for
+        for old in [k for k in _services if k[0] < day - timedelta(days=2) or k[1] != seed]:
+            _services.pop(old, None)
+    return hit
+
+
+async def next_departures(stop_id: str, limit: int, now: datetime, seed: str) -> list[dict]:
+    """The next `limit` scheduled departures from a stop at or after `now`.
+
+    Trips of yesterday's service day that run past midnight (times >= 24:00:00) are
+    included, so both service days are queried and merged.
+    """
+    today = now.astimezone(AGENCY_TZ).date()
+    days = (today - timedelta(days=1), today)
+    starts = [service_day_start(d) for d in days]
+    services = await asyncio.gather(*(active_services(d, seed) for d in days))
+    queries = []
+    for start, svc in zip(starts, services):
+        # Via timestamps: subtracting datetimes that share a tzinfo would be wall-clock
+        secs = int(now.timestamp() - start.timestamp())
+        queries.append(fetch(DEPARTURES_SQL, stop_id, secs, secs + ARRIVALS_HORIZON_SECONDS, svc, limit) if svc else None)
+    results = await asyncio.gather(*(q for q in queries if q is not None))
+
+    out = []
+    it = iter(results)
+    for day, start, q in zip(days, starts, queries):
+        if q is None:
+            continue
+        base = int(start.timestamp())
+        for r in next(it):
+            out.append({
+                "trip_id": r["trip_id"],
+                "route_id": r["route_id"],
+                "headsign": r["headsign"],
+                "stop_sequence": r["stop_sequence"],
+                "service_date": day.isoformat(),
+                "scheduled_departure": base + r["departure_secs"],
+                "scheduled_arrival": base + r["arrival_secs"] if r["arrival_secs"] is not None else None,
+            })
+    out.sort(key=lambda d: d["scheduled_departure"])
+    return out[:limit]
+
+
+def limit_bucket(limit: int) -> int:
+    return next((b for b in LIMIT_BUCKETS if b >= limit), limit)
+
+
+async def scheduled_departures(stop_id: str, limit: int, seed: str, minute: int) -> list[dict]:
+    bucket = limit_bucket(limit)
+    key = (stop_id, bucket)
+    hit = _boards.get(key)
+    if hit is None or hit[:2] != (seed, minute):
+        rows = await next_departures(stop_id, bucket, datetime.fromtimestamp(minute, AGENCY_TZ), seed)
+        hit = (seed, minute, rows)
+        _boards.put(key, hit)
+    return hit[2][:limit]
+
+
+def blend_predictions(rows: list[dict], preds: list[tuple[list, int]], limit: int) -> list[dict]:
+    """Attach realtime predictions to scheduled departures by trip_id.
+
+    Predicted trips missing from the schedule window (running late, or added) are
+    listed on their own. The board is ordered by predicted time where known.
+    """
+    by_trip = {m[0]: (m, eta) for m, eta in preds}
+    out = []
+    for row in rows:
+        hit = by_trip.pop(row["trip_id"], None)
+        out.append({**row, **_prediction(hit)})
+    for m, eta in by_trip.values():
+        out.append({
+            "trip_id": m[0], "route_id": m[1], "headsign": None, "stop_sequence": None, "service_date": None,
+            "scheduled_departure": None, "scheduled_arrival": None, **_prediction((m, eta)),
+        })
+    out.sort(key=lambda d: d["predicted_arrival"] or d["scheduled_departure"])
+    return out[:limit]
+
+
+def _prediction(hit) -> dict:
+    if hit is None:
+        return {"predicted_arrival": None, "delay": None, "vehicle_id": None, "realtime": None}
+    (_, _, vehicle_id, delay, source), eta = hit
+    return {"predicted_arrival": eta, "delay": delay, "vehicle_id": vehicle_id, "realtime": source}
+
+
+async def departures_board(stop_id: str, limit: int) -> CachedBody:
+    """A stop's departures as an encoded body, rebuilt once per minute or ETA cycle.
+
+    Scheduled rows are reused within the minute; each rebuild adds one sorted-set
+    read of the stop's realtime predictions.
+    """
+    seed, gen = await aget_board_versions()
+    now = int(time.time())
+    minute = now // 60 * 60
+    name = f"arrivals:{stop_id}:{limit}"
+    body = boards.get(name, (seed, minute, gen))
+    if body is None:
+        rows, preds = await asyncio.gather(
+            scheduled_departures(stop_id, limit, seed, minute),
+            aget_stop_etas(stop_id, now - ETA_GRACE_SECONDS, 2 * limit),
+        )
+        board = blend_predictions(rows, preds, limit)
+        body = boards.put(name, (seed, minute, gen), json.dumps(board, separators=(",", ":")).encode())
+    return body
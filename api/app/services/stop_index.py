@@ -0,0 +1,198 @@
+"""Nearest-stop search over an in-process grid of every stop.
+
+Stops are loaded once (and again whenever the seed version changes) into NumPy
+arrays in a local planar frame, bucketed by a uniform grid of which only occupied
+cells are stored (sorted cell keys, looked up with searchsorted), so a stop with
+bogus coordinates far away costs one cell rather than a grid spanning the gap. A
+query walks rings of cells outward from the point until the k nearest are settled
+or the radius is exhausted. Reported distances are great-circle meters.
+
+Until the index is loaded (e.g. the database was down at startup), queries fall back
+to PostGIS with a KNN `<->` ordering on the indexed geometry column.
+"""
+
+import asyncio, math, os, time
+import numpy as np
+from ..db.connection import fetch
+from .redis_client import aget_seed_version
+
+STOP_INDEX_CELL_METERS = float(os.getenv("STOP_INDEX_CELL_METERS", "250"))
+# How long a loaded index is trusted before the seed version is checked again
+STOP_INDEX_CHECK_SECONDS = float(os.getenv("STOP_INDEX_CHECK_SECONDS", "10"))
+
+EARTH_RADIUS_M = 6_371_008.8
+_KY = np.pi / 180 * EARTH_RADIUS_M
+
+STOPS_SQL = "SELECT stop_id, name, ST_X(geom) AS lon, ST_Y(geom) AS lat FROM stops WHERE geom IS NOT NULL"
+
+# KNN on the geometry index ranks by planar degrees, so a wider pool is re-ranked by
+# true distance; the degree bound keeps the GiST index in play for the radius
+NEAR_SQL = """
+  SELECT stop_id, name, lat, lon, distance_m FROM (
+    SELECT s.stop_id, s.name, ST_Y(s.geom) AS lat, ST_X(s.geom) AS lon,
+           ST_DistanceSphere(s.geom, p.pt) AS distance_m
+    FROM stops s, (SELECT ST_SetSRID(ST_MakePoint($1, $2), 4326) AS pt) p
+    WHERE ST_DWithin(s.geom, p.pt, $4)
+    ORDER BY s.geom <-> p.pt
+    LIMIT $5
+  ) c
+  WHERE distance_m <= $3
+  ORDER BY distance_m
+  LIMIT $6
+"""
+
+
+def haversine_np(lon1, lat1, lon2, lat2) -> np.ndarray:
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+class StopIndex:
+    def __init__(self, rows: list[dict], cell: float = STOP_INDEX_CELL_METERS):
+        self.cell = cell
+        self.stop_ids = [r["stop_id"] for r in rows]
+        self.names = [r["name"] for r in rows]
+        self.lon = np.array([r["lon"] for r in rows], dtype=np.float64)
+        self.lat = np.array([r["lat"] for r in rows], dtype=np.float64)
+        # Median, so a few stray stops (e.g. at 0,0) do not skew the frame
+        lat0 = float(np.median(self.lat)) if len(rows) else 0.0
+        self.kx, self.ky = _KY * np.cos(np.radians(lat0)), _KY
+        x, y = self.lon * self.kx, self.lat * self.ky
+        self.x0 = float(x.min()) if len(rows) else 0.0
+        self.y0 = float(y.min()) if len(rows) else 0.0
+        cx = ((x - self.x0) // cell).astype(np.int64)
+        cy = ((y - self.y0) // cell).astype(np.int64)
+        self.nx = int(cx.max()) + 1 if len(rows) else 1
+        self.ny = int(cy.max()) + 1 if len(rows) else 1
+        # Stops sorted by cell; each occupied cell's key with its [start, end) slice
+        cell_id = cy * self.nx + cx
+        self.order = np.argsort(cell_id, kind="stable")
+        self.x, self.y = x[self.order], y[self.order]
+        self.cell_keys, self.cell_start, counts = np.unique(cell_id[self.order], return_index=True, return_counts=True)
+        self.cell_end = self.cell_start + counts
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def _ring(self, cx: int, cy: int, n: int) -> list[tuple[int, int]]:
+        """(start, end) offsets of the occupied cells at Chebyshev distance n from (cx, cy)."""
+        if n == 0:
+            xs, ys = np.array([cx]), np.array([cy])
+        else:
+            side = np.arange(-n, n + 1)
+            inner = side[1:-1]
+            xs = np.concatenate((cx + side, cx + side, np.full(len(inner), cx - n), np.full(len(inner), cx + n)))
+            ys = np.concatenate((np.full(len(side), cy - n), np.full(len(side), cy + n), cy + inner, cy + inner))
+        inside = (xs >= 0) & (xs < self.nx) & (ys >= 0) & (ys < self.ny)
+        if not inside.any():
+            return []
+        keys = ys[inside] * self.nx + xs[inside]
+        pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        pos = pos[self.cell_keys[pos] == keys]
+        return list(zip(self.cell_start[pos].tolist(), self.cell_end[pos].tolist()))
+
+    def nearest(self, lat: float, lon: float, k: int, radius: float) -> list[tuple[int, float]]:
+        """Up to k (stop index, meters) within `radius`, nearest first."""
+        if not len(self):
+            return []
+        px, py = lon * self.kx, lat * self.ky
+        gx = max(self.x0 - px, px - self.x0 - self.nx * self.cell, 0)
+        gy = max(self.y0 - py, py - self.y0 - self.ny * self.cell, 0)
+        if math.hypot(gx, gy) > radius * 1.01:
+            return []
+        cx = int((px - self.x0) // self.cell)
+        cy = int((py - self.y0) // self.cell)
+        far = max(-cx, cx - self.nx + 1, -cy, cy - self.ny + 1, 0)
+        max_n = far + int(radius // self.cell) + 1
+        found: list[np.ndarray] = []
+        d2: list[np.ndarray] = []
+        for n in range(max_n + 1):
+            for lo, hi in self._ring(cx, cy, n):
+                if hi > lo:
+                    found.append(np.arange(lo, hi))
+                    d2.append((self.x[lo:hi] - px) ** 2 + (self.y[lo:hi] - py) ** 2)
+            # Every stop within n cells of the point is now seen (less a margin for the
+            # planar frame); once k are that close, outer rings cannot beat them
+            covered = n * self.cell * 0.99
+            if covered >= radius * 1.01:
+                break
+            if found and np.count_nonzero(np.concatenate(d2) <= covered * covered) >= k:
+                break
+        if not found:
+            return []
+        idx = np.concatenate(found)
+        dist = np.sqrt(np.concatenate(d2))
+        keep = dist <= radius * 1.01 + 1
+        idx = self.order[idx[keep]]
+        true = haversine_np(lon, lat, self.lon[idx], self.lat[idx])
+        sel = true <= radius
+        idx, true = idx[sel], true[sel]
+        top = np.argsort(true, kind="stable")[:k]
+        return [(int(i), float(d)) for i, d in zip(idx[top], true[top])]
+
+    def row(self, i: int, distance: float) -> dict:
+        return {"stop_id": self.stop_ids[i], "name": self.names[i], "lat": float(self.lat[i]),
+                "lon": float(self.lon[i]), "distance_m": round(distance, 1)}
+
+
+class StopIndexHolder:
+    """The current StopIndex, rebuilt in the background when the seed version moves."""
+
+    def __init__(self):
+        self.index: StopIndex | None = None
+        self._seed: str | None = None
+        self._checked = 0.0
+        self._loading: asyncio.Task | None = None
+
+    async def _load(self, seed: str):
+        try:
+            rows = await fetch(STOPS_SQL)
+            index = await asyncio.to_thread(StopIndex, rows)
+            self.index, self._seed = index, seed
+        except Exception as e:
+            print("stop index load failed:", e or type(e).__name__)
+        finally:
+            self._loading = None
+
+    async def refresh(self, wait: bool = False):
+        """Start a reload if the seed changed; queries keep using the old index meanwhile."""
+        now = time.monotonic()
+        if now - self._checked < STOP_INDEX_CHECK_SECONDS:
+            return
+        self._checked = now
+        try:
+            seed = await aget_seed_version()
+        except Exception as e:
+            # Redis down: keep serving the index we have (or PostGIS)
+            print("stop index seed check failed:", e or type(e).__name__)
+            return
+        if seed != self._seed and self._loading is None:
+            self._loading = asyncio.create_task(self._load(seed))
+        if wait and self._loading is not None:
+            await self._loading
+
+    async def near(self, lat: float, lon: float, k: int, radius: float) -> list[dict]:
+        await self.refresh()
+        index = self.index
+        if index is not None:
+            return [index.row(i, d) for i, d in index.nearest(lat, lon, k, radius)]
+        return await self._near_db(lat, lon, k, radius)
+
+    async def near_many(self, points: list[tuple[float, float]], k: int, radius: float) -> list[list[dict]]:
+        await self.refresh()
+        index = self.index
+        if index is not None:
+            return [[index.row(i, d) for i, d in index.nearest(lat, lon, k, radius)] for lat, lon in points]
+        return list(await asyncio.gather(*(self._near_db(lat, lon, k, radius) for lat, lon in points)))
+
+    async def _near_db(self, lat: float, lon: float, k: int, radius: float) -> list[dict]:
+        # Degrees of longitude per meter grow with latitude; bound by the wider one
+        deg = radius / (111_320 * max(np.cos(np.radians(lat)), 0.01))
+        rows = await fetch(NEAR_SQL, lon, lat, radius, deg, 4 * k + 16, k)
+        for r in rows:
+            r["distance_m"] = round(r["distance_m"], 1)
+        return rows
+
+
+stops = StopIndexHolder()
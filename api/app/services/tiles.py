@@ -0,0 +1,185 @@
+import math, os, time
+from collections import OrderedDict
+from redis.exceptions import RedisError
+from ..db.connection import fetch, fetchrow
+from .redis_client import aget_seed_version, ar_bin
+
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "4096"))
+TILE_REDIS_TTL = int(os.getenv("TILE_REDIS_TTL", str(7 * 24 * 3600)))
+# How long a route's updated_at is trusted before re-reading route_streets_geom
+ROUTE_VERSION_TTL = float(os.getenv("ROUTE_VERSION_TTL", "30"))
+# Network tiles only carry stops from this zoom up; below it they are noise and weight
+NETWORK_STOPS_MIN_ZOOM = int(os.getenv("NETWORK_STOPS_MIN_ZOOM", "14"))
+
+# Web-mercator meters per MVT grid unit (4096 per tile) at zoom 0
+_MVT_UNIT_Z0 = 40075016.686 / 4096
+
+ROUTE_TILE_SQL = """
+  WITH bounds AS (
+    SELECT ST_TileEnvelope($1,$2,$3) AS env
+  ), data AS (
+    SELECT
+      ST_AsMVTGeom(r.geom_3857, bounds.env) AS geom,
+      r.route_id
+    FROM route_streets_geom r, bounds
+    WHERE r.route_id = $4 AND r.geom_3857 && bounds.env
+  )
+  SELECT ST_AsMVT(data, 'streets', 4096, 'geom') AS tile
+  FROM data
+"""
+
+
+NETWORK_STREETS_SQL = """
+  WITH bounds AS (
+    SELECT ST_TileEnvelope($1,$2,$3) AS env
+  ), data AS (
+    SELECT
+      ST_AsMVTGeom(ST_Simplify(r.geom_3857, $4), bounds.env) AS geom,
+      r.route_id,
+      COALESCE(NULLIF(rt.short_name, ''), r.route_id) AS short_name,
+      COALESCE(NULLIF(rt.color, ''), '000000') AS color,
+      rt.type
+    FROM route_streets_geom r
+    CROSS JOIN bounds
+    LEFT JOIN routes rt ON rt.route_id = r.route_id
+    WHERE r.geom_3857 && bounds.env
+  )
+  SELECT ST_AsMVT(data, 'streets', 4096, 'geom') AS tile
+  FROM data
+  WHERE geom IS NOT NULL
+"""
+
+NETWORK_STOPS_SQL = """
+  WITH bounds AS (
+    SELECT ST_TileEnvelope($1,$2,$3) AS env
+  ), data AS (
+    SELECT
+      ST_AsMVTGeom(ST_Transform(s.geom, 3857), bounds.env) AS geom,
+      s.stop_id,
+      s.name
+    FROM stops s, bounds
+    WHERE s.geom && ST_Transform(bounds.env, 4326)
+  )
+  SELECT ST_AsMVT(data, 'stops', 4096, 'geom') AS tile
+  FROM data
+  WHERE geom IS NOT NULL
+"""
+
+
+class LRU:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+
+_tiles = LRU(TILE_CACHE_SIZE)
+_versions: dict[str, int] = {}
+_versions_at = 0.0
+
+
+async def route_versions(force: bool = False) -> dict[str, int]:
+    """route_id -> updated_at (epoch seconds); tiles are keyed by it, so a re-match
+    through match_routes.upsert_route_geom invalidates every cached tile of that route."""
+    global _versions, _versions_at
+    if force or time.monotonic() - _versions_at > ROUTE_VERSION_TTL:
+        rows = await fetch(
+            "SELECT route_id, extract(epoch FROM updated_at)::bigint AS v FROM route_streets_geom"
+        )
+        _versions = {row["route_id"]: row["v"] for row in rows}
+        _versions_at = time.monotonic()
+    return _versions
+
+
+async def render_route_tile(route_id: str, z: int, x: int, y: int) -> bytes:
+    row = await fetchrow(ROUTE_TILE_SQL, z, x, y, route_id)
+    tile = row and row["tile"] or None
+    return bytes(tile) if tile else b""
+
+
+async def cached_tile(key: str, render) -> bytes:
+    """Memory LRU, then Redis, then `render()`; whatever is rendered is stored in both.
+
+    Redis is only a cache here: when it is down, tiles are rendered from PostGIS.
+    """
+    tile = _tiles.get(key)
+    if tile is not None:
+        return tile
+    try:
+        tile = await ar_bin().get(key)
+    except RedisError as e:
+        print("tile cache read error:", e or type(e).__name__)
+        tile = None
+    if tile is None:
+        tile = await render()
+        try:
+            await ar_bin().set(key, tile, ex=TILE_REDIS_TTL)
+        except RedisError as e:
+            print("tile cache write error:", e or type(e).__name__)
+    _tiles.put(key, tile)
+    return tile
+
+
+async def route_tile(route_id: str, z: int, x: int, y: int) -> tuple[bytes, str | None]:
+    """Returns (tile, version); version is None when the route has no streets geometry."""
+    version = (await route_versions()).get(route_id)
+    if version is None:
+        return b"", None
+    key = f"tile:route:{route_id}:{version}:{z}/{x}/{y}"
+    return await cached_tile(key, lambda: render_route_tile(route_id, z, x, y)), str(version)
+
+
+def simplify_tolerance(z: int) -> float:
+    """Douglas-Peucker tolerance in meters: about two MVT grid units at this zoom, so
+    simplification never removes detail the tile could actually encode."""
+    return 2 * _MVT_UNIT_Z0 / (2 ** z)
+
+
+async def render_network_tile(z: int, x: int, y: int, stops: bool) -> bytes:
+    row = await fetchrow(NETWORK_STREETS_SQL, z, x, y, simplify_tolerance(z))
+    tile = bytes(row["tile"]) if row and row["tile"] else b""
+    if stops:
+        # MVT layers are independent protobuf fields, so tiles concatenate
+        row = await fetchrow(NETWORK_STOPS_SQL, z, x, y)
+        tile += bytes(row["tile"]) if row and row["tile"] else b""
+    return tile
+
+
+async def network_tile(z: int, x: int, y: int, stops: bool | None = None) -> tuple[bytes, str]:
+    """All routes' streets (and stops at high zoom) in one tile; returns (tile, version)."""
+    if stops is None:
+        stops = z >= NETWORK_STOPS_MIN_ZOOM
+    versions = await route_versions()
+    try:
+        seed = await aget_seed_version()
+    except RedisError:
+        # Still render; the tile is keyed apart from any seed's until Redis is back
+        seed = "unknown"
+    version = f"{max(versions.values(), default=0)}-{seed}-{int(stops)}"
+    key = f"tile:network:{version}:{z}/{x}/{y}"
+    return await cached_tile(key, lambda: render_network_tile(z, x, y, stops)), version
+
+
+def tile_range(bbox: tuple[float, float, float, float], z: int) -> tuple[int, int, int, int]:
+    """(x0, y0, x1, y1) inclusive XYZ tile range covering a lon/lat bbox at zoom z."""
+    def to_xy(lon: float, lat: float) -> tuple[int, int]:
+        n = 2 ** z
+        lat = max(min(lat, 85.0511), -85.0511)
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    x0, y0 = to_xy(bbox[0], bbox[3])
+    x1, y1 = to_xy(bbox[2], bbox[1])
+    return x0, y0, x1, y1
@@ -0,0 +1,113 @@
+import asyncio, json
+from .geo import in_bbox
+from .redis_client import VEHICLE_DELTAS, ar
+
+# Deltas buffered per client before it is considered too slow and told to resync
+QUEUE_SIZE = 64
+
+
+def _member(v: dict) -> str:
+    return f"{v.get('feed')}:{v.get('id')}"
+
+
+def _delta(ts, upserts: list[str], removes: list[str]) -> str:
+    return f'{{"ts":{json.dumps(ts)},"upserts":[{",".join(upserts)}],"removes":{json.dumps(removes)}}}'
+
+
+class Subscriber:
+    def __init__(self, bbox: tuple[float, float, float, float] | None, route_id: str | None):
+        self.bbox = bbox
+        self.route_id = route_id
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=QUEUE_SIZE)
+        # Members this client currently shows, so vehicles leaving its filter become removes
+        self.visible: set[str] = set()
+        # Set when deltas were lost; the stream sends a fresh snapshot before the next delta
+        self.resync = True
+
+    @property
+    def filtered(self) -> bool:
+        return self.bbox is not None or self.route_id is not None
+
+    def wants(self, v: dict) -> bool:
+        if self.route_id and self.route_id not in (v.get("route_id"), f"{v.get('feed')}:{v.get('route_id')}"):
+            return False
+        return self.bbox is None or in_bbox(v["lon"], v["lat"], self.bbox)
+
+    def offer(self, payload: str):
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resync = True
+
+
+class VehicleHub:
+    """Single Redis subscription per API process, fanned out to every connected client.
+
+    Unfiltered clients get the published payload as-is; filtered clients share one
+    per-vehicle encoding of each delta, so no client causes a fleet-wide re-serialize.
+    """
+
+    def __init__(self):
+        self._subs: set[Subscriber] = set()
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, bbox=None, route_id: str | None = None) -> Subscriber:
+        sub = Subscriber(bbox, route_id)
+        self._subs.add(sub)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subs.discard(sub)
+
+    async def _run(self):
+        while True:
+            pubsub = ar().pubsub()
+            try:
+                await pubsub.subscribe(VEHICLE_DELTAS)
+                async for msg in pubsub.listen():
+                    if msg["type"] == "message":
+                        self._fan_out(msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("vehicle stream error:", e)
+                # Deltas published while disconnected are gone; clients must resync
+                for sub in self._subs:
+                    sub.resync = True
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _fan_out(self, data: str):
+        if not self._subs:
+            return
+        delta = None
+        encoded = None
+        for sub in list(self._subs):
+            if not sub.filtered:
+                sub.offer(data)
+                continue
+            if delta is None:
+                delta = json.loads(data)
+                encoded = [(v, _member(v), json.dumps(v)) for v in delta["upserts"]]
+            upserts, removes = [], []
+            for v, member, body in encoded:
+                if sub.wants(v):
+                    upserts.append(body)
+                    sub.visible.add(member)
+                elif member in sub.visible:
+                    sub.visible.discard(member)
+                    removes.append(member)
+            for member in delta["removes"]:
+                if member in sub.visible:
+                    sub.visible.discard(member)
+                    removes.append(member)
+            if upserts or removes:
+                sub.offer(_delta(delta["ts"], upserts, removes))
+
+
+hub = VehicleHub()
@@ -0,0 +1,18 @@
+import pytest
+from app.services.geo import haversine_m, in_bbox, parse_bbox
+
+
+def test_parse_bbox_order_and_validation():
+    assert parse_bbox("-76.7,39.2,-76.5,39.4") == (-76.7, 39.2, -76.5, 39.4)
+    with pytest.raises(ValueError):
+        parse_bbox("-76.5,39.2,-76.7,39.4")
+    with pytest.raises(ValueError):
+        parse_bbox("1,2,3")
+
+
+def test_in_bbox_and_distance():
+    box = (-76.7, 39.2, -76.5, 39.4)
+    assert in_bbox(-76.61, 39.29, box)
+    assert not in_bbox(-76.4, 39.29, box)
+    # one degree of latitude is ~111 km
+    assert 110_000 < haversine_m(-76.6, 39.0, -76.6, 40.0) < 112_000
@@ -0,0 +1,26 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.metrics import RequestTimer, registry
+
+
+def _count(route, status):
+    return registry.get_sample_value(
+        "http_request_seconds_count", {"method": "GET", "route": route, "status": status}
+    ) or 0
+
+
+def test_request_timer_labels_by_route_template():
+    app = FastAPI()
+    app.add_middleware(RequestTimer)
+
+    @app.get("/things/{thing_id}")
+    async def thing(thing_id: str):
+        return {"id": thing_id}
+
+    before = _count("/things/{thing_id}", "200"), _count("unmatched", "404")
+    client = TestClient(app)
+    client.get("/things/a")
+    client.get("/things/b")
+    client.get("/nope")
+    assert _count("/things/{thing_id}", "200") == before[0] + 2
+    assert _count("unmatched", "404") == before[1] + 1
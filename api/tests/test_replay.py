@@ -0,0 +1,28 @@
+import json, struct
+import numpy as np
+import zstandard
+from app.services.replay import decode_frames, parse_minute
+
+
+def _blob(minute: int) -> bytes:
+    # Two vehicles, then only the second one 10 microdegrees further north
+    head = {"v": 1, "minute": minute, "ids": ["lb:1", "mc:2"], "routes": ["lb:10", "mc:1"], "ts": [0, 6], "n": [2, 1]}
+    cols = [
+        np.array([1, 1, 2], "<i4"),  # index deltas from -1
+        np.array([39_290_000, 39_300_000, 10], "<i4"),
+        np.array([-76_610_000, -76_600_000, 0], "<i4"),
+        np.array([90, -1, -1], "<i2"),
+        np.array([825, -1, 900], "<i2"),
+    ]
+    h = json.dumps(head).encode()
+    return zstandard.ZstdCompressor().compress(struct.pack("<I", len(h)) + h + b"".join(c.tobytes() for c in cols))
+
+
+def test_decode_frames_applies_deltas_and_filters():
+    minute = parse_minute("202311142214")
+    frames = decode_frames(_blob(minute))
+    assert [f["ts"] for f in frames] == [minute, minute + 6]
+    assert frames[0]["vehicles"][0] == {"id": "1", "feed": "lb", "route_id": "lb:10", "lat": 39.29, "lon": -76.61,
+                                        "heading": 90, "speed": 8.25}
+    assert frames[1]["vehicles"][0]["lat"] == 39.30001 and frames[1]["vehicles"][0]["speed"] == 9.0
+    assert [len(f["vehicles"]) for f in decode_frames(_blob(minute), "mc:1")] == [1, 1]
@@ -0,0 +1,53 @@
+import gzip
+from starlette.requests import Request
+from app.services.response_cache import ResponseCache, cached_response, negotiate
+
+
+def _request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw})
+
+
+def test_cache_is_keyed_by_version():
+    cache = ResponseCache()
+    body = cache.put("vehicles", "7", b"[1,2]")
+    assert cache.get("vehicles", "7") is body
+    assert cache.get("vehicles", "8") is None
+    # identical bytes under a new version keep their ETag (and compressed variants)
+    assert cache.put("vehicles", "8", b"[1,2]").etag == body.etag
+
+
+def test_capacity_evicts_least_recently_used():
+    cache = ResponseCache(capacity=2)
+    cache.put("a", 1, b"a")
+    cache.put("b", 1, b"b")
+    assert cache.get("a", 1) is not None
+    cache.put("c", 1, b"c")
+    assert cache.get("b", 1) is None and cache.get("a", 1) is not None and cache.get("c", 1) is not None
+
+
+def test_etag_revalidation_and_gzip():
+    body = ResponseCache().put("routes", "1", b'[{"route_id":"lb:10"}]' * 50)
+    assert cached_response(_request(if_none_match=body.etag), body).status_code == 304
+    resp = cached_response(_request(accept_encoding="gzip"), body)
+    assert resp.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(resp.body) == body.raw
+    assert cached_response(_request(), body).body == body.raw
+
+
+def test_etag_differs_per_encoding():
+    body = ResponseCache().put("routes", "1", b"[]" * 50)
+    gz = cached_response(_request(accept_encoding="gzip"), body)
+    assert gz.headers["etag"] != body.etag
+    assert cached_response(_request(accept_encoding="gzip", if_none_match=gz.headers["etag"]), body).status_code == 304
+    # The gzip validator does not revalidate the identity body
+    assert cached_response(_request(if_none_match=gz.headers["etag"]), body).status_code == 200
+
+
+def test_accept_encoding_honours_q_values():
+    assert negotiate("gzip, br;q=0", ("br", "gzip"), "*") == "gzip"
+    assert negotiate("br;q=0.5, gzip", ("br", "gzip"), "*") == "gzip"
+    assert negotiate("x-gzip-like, identity", ("br", "gzip"), "*") is None
+    assert negotiate("*", ("br", "gzip"), "*") == "br"
+    assert negotiate("*, br;q=0", ("br", "gzip"), "*") == "gzip"
+    assert negotiate(None, ("br", "gzip"), "*") is None
@@ -0,0 +1,30 @@
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+from app.services.schedule import blend_predictions, service_day_start
+
+NY = ZoneInfo("America/New_York")
+
+
+def test_service_day_starts_at_midnight_on_normal_days():
+    start = service_day_start(date(2024, 6, 3), NY)
+    assert (start.hour, start.minute) == (0, 0)
+
+
+def test_service_day_start_follows_noon_minus_12h_on_dst_change():
+    # Spring forward: 2024-03-10 has 23 hours, so 12:00 is 11 wall-clock hours after midnight
+    start = service_day_start(date(2024, 3, 10), NY)
+    noon = datetime.fromtimestamp(start.timestamp() + 12 * 3600, NY)
+    assert noon.hour == 12
+    assert (start.day, start.hour) == (9, 23)  # 23:00 on the previous day
+
+
+def test_blend_predictions_attaches_by_trip_and_reorders():
+    rows = [
+        {"trip_id": "a", "route_id": "r", "scheduled_departure": 100, "scheduled_arrival": 100},
+        {"trip_id": "b", "route_id": "r", "scheduled_departure": 200, "scheduled_arrival": 200},
+    ]
+    preds = [(["a", "r", "v1", 150, "rt"], 250), (["c", "r", None, None, "rt"], 50)]
+    board = blend_predictions(rows, preds, 3)
+    assert [d["trip_id"] for d in board] == ["c", "b", "a"]
+    assert board[2]["predicted_arrival"] == 250 and board[2]["delay"] == 150
+    assert board[1]["realtime"] is None and board[0]["scheduled_departure"] is None
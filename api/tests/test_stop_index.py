@@ -0,0 +1,45 @@
+import numpy as np
+from app.services.stop_index import StopIndex, haversine_np
+
+
+def _stops(n=2000, seed=3):
+    rng = np.random.default_rng(seed)
+    lat = 39.29 + rng.normal(0, 0.05, n)
+    lon = -76.61 + rng.normal(0, 0.06, n)
+    return [{"stop_id": f"bus:{i}", "name": f"Stop {i}", "lat": a, "lon": o} for i, (a, o) in enumerate(zip(lat, lon))]
+
+
+def test_nearest_matches_brute_force():
+    rows = _stops()
+    index = StopIndex(rows, cell=250)
+    lat = np.array([r["lat"] for r in rows])
+    lon = np.array([r["lon"] for r in rows])
+    rng = np.random.default_rng(7)
+    for qlat, qlon in zip(39.29 + rng.normal(0, 0.07, 200), -76.61 + rng.normal(0, 0.08, 200)):
+        for k, radius in ((1, 5000), (5, 800), (20, 2000)):
+            d = haversine_np(qlon, qlat, lon, lat)
+            expect = [i for i in np.argsort(d, kind="stable") if d[i] <= radius][:k]
+            got = index.nearest(qlat, qlon, k, radius)
+            assert [i for i, _ in got] == expect
+            assert all(abs(m - d[i]) < 1e-6 for i, m in got)
+
+
+def test_nearest_outside_the_network_and_empty_index():
+    index = StopIndex(_stops(50))
+    assert index.nearest(0.0, 0.0, 5, 5000) == []
+    assert StopIndex([]).nearest(39.29, -76.61, 5, 500) == []
+    row = index.row(*index.nearest(39.29, -76.61, 1, 50000)[0])
+    assert set(row) == {"stop_id", "name", "lat", "lon", "distance_m"}
+
+
+def test_stray_stop_does_not_blow_up_the_grid():
+    # A stop at 0,0 (common bad data) stretches the box across the Atlantic; only occupied
+    # cells are stored, and searches around Baltimore are unaffected
+    rows = _stops(500) + [{"stop_id": "null-island", "name": "bad", "lat": 0.0, "lon": 0.0}]
+    index = StopIndex(rows, cell=250)
+    assert index.nx * index.ny > 10**8 and len(index.cell_keys) <= len(rows)
+    got = [i for i, _ in index.nearest(39.29, -76.61, 10, 3000)]
+    d = haversine_np(-76.61, 39.29, index.lon, index.lat)
+    want = [i for i in np.argsort(d, kind="stable")[:10] if d[i] <= 3000]
+    assert got == want
+    assert [index.stop_ids[i] for i, _ in index.nearest(0.001, 0.001, 1, 500)] == ["null-island"]
@@ -0,0 +1,43 @@
+import asyncio
+from redis.exceptions import ConnectionError as RedisConnectionError
+from app.services import tiles
+from app.services.tiles import LRU, simplify_tolerance, tile_range
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRU(2)
+    lru.put("a", b"1")
+    lru.put("b", b"2")
+    assert lru.get("a") == b"1"
+    lru.put("c", b"3")
+    assert lru.get("b") is None
+    assert lru.get("a") == b"1" and lru.get("c") == b"3"
+
+
+def test_tile_range_covers_bbox():
+    # downtown Baltimore sits in tile 12/1176/1561
+    assert tile_range((-76.62, 39.28, -76.60, 39.30), 12) == (1176, 1561, 1176, 1561)
+    x0, y0, x1, y1 = tile_range((-76.7, 39.2, -76.5, 39.4), 14)
+    assert x0 < x1 and y0 < y1
+
+
+def test_simplify_tolerance_halves_per_zoom():
+    assert simplify_tolerance(10) == 2 * simplify_tolerance(11)
+    # at z14 two grid units are a couple of meters
+    assert 1 < simplify_tolerance(14) < 5
+
+
+def test_cached_tile_renders_when_redis_is_down(monkeypatch):
+    class Down:
+        async def get(self, key):
+            raise RedisConnectionError("down")
+
+        async def set(self, *args, **kwargs):
+            raise RedisConnectionError("down")
+
+    async def render():
+        return b"tile"
+
+    monkeypatch.setattr(tiles, "ar_bin", lambda: Down())
+    monkeypatch.setattr(tiles, "_tiles", LRU(4))
+    assert asyncio.run(tiles.cached_tile("k", render)) == b"tile"
@@ -0,0 +1,40 @@
+import asyncio, json
+from app.services.vehicle_stream import Subscriber, VehicleHub
+
+
+def test_filtered_subscribers_get_enter_and_leave_deltas():
+    async def run():
+        hub = VehicleHub()
+        everyone = Subscriber(None, None)
+        downtown = Subscriber((-76.7, 39.2, -76.5, 39.4), None)
+        downtown.visible = {"lb:2"}
+        hub._subs = {everyone, downtown}
+        data = json.dumps(
+            {
+                "ts": 1,
+                "upserts": [
+                    {"id": "1", "feed": "lb", "route_id": "10", "lat": 39.29, "lon": -76.61},
+                    {"id": "2", "feed": "lb", "route_id": "10", "lat": 39.60, "lon": -76.61},
+                ],
+                "removes": [],
+            }
+        )
+        hub._fan_out(data)
+        assert everyone.queue.get_nowait() == data
+        delta = json.loads(downtown.queue.get_nowait())
+        assert [v["id"] for v in delta["upserts"]] == ["1"]
+        assert delta["removes"] == ["lb:2"]
+        assert downtown.visible == {"lb:1"}
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_is_flagged_for_resync():
+    async def run():
+        sub = Subscriber(None, None)
+        sub.resync = False
+        for _ in range(sub.queue.maxsize + 1):
+            sub.offer("{}")
+        assert sub.resync and sub.queue.empty()
+
+    asyncio.run(run())
@@ -0,0 +1,117 @@
+"""Micro-benchmark: GTFS-RT vehicle decoding on a synthetic 10k-entity FeedMessage.
+
+Run from the repo root: `make bench` or `python -m bench.bench_decode [n_vehicles]`.
+"""
+import random, sys, time, timeit
+from google.transit import gtfs_realtime_pb2 as gtfs
+from ingest.src.decode import VehicleDecoder, decode_vehicles
+
+
+def synthetic_feed(n: int, seed: int = 7, moved: float = 1.0, base: gtfs.FeedMessage | None = None) -> gtfs.FeedMessage:
+    """n vehicles around Baltimore; with `base`, only a `moved` fraction of them change."""
+    rnd = random.Random(seed)
+    feed = gtfs.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = int(time.time())
+    if base is not None:
+        feed.entity.extend(base.entity)
+        for ent in feed.entity:
+            if rnd.random() < moved:
+                ent.vehicle.position.latitude += rnd.uniform(-0.0005, 0.0005)
+                ent.vehicle.position.longitude += rnd.uniform(-0.0005, 0.0005)
+                ent.vehicle.timestamp += 6
+        return feed
+    for i in range(n):
+        ent = feed.entity.add()
+        ent.id = f"e{i}"
+        v = ent.vehicle
+        v.vehicle.id = f"{i:05d}"
+        v.vehicle.label = f"{i:05d}"
+        v.trip.trip_id = f"trip_{i}"
+        v.trip.route_id = str(rnd.randint(1, 120))
+        v.position.latitude = 39.29 + rnd.uniform(-0.15, 0.15)
+        v.position.longitude = -76.61 + rnd.uniform(-0.15, 0.15)
+        v.position.speed = rnd.uniform(0, 20)
+        v.position.bearing = rnd.uniform(0, 359)
+        v.timestamp = feed.header.timestamp - rnd.randint(0, 30)
+        v.stop_id = str(rnd.randint(1, 4000))
+        v.current_stop_sequence = rnd.randint(1, 60)
+    return feed
+
+
+def legacy_parse_vehicles(pb_bytes: bytes):
+    """The per-entity dict builder ingest used before decode.py, kept as the baseline."""
+    feed = gtfs.FeedMessage()
+    feed.ParseFromString(pb_bytes)
+    ts_fallback = int(feed.header.timestamp) if feed.header.timestamp else int(time.time())
+    out = []
+    for ent in feed.entity:
+        if not ent.HasField("vehicle"):
+            continue
+        v = ent.vehicle
+        pos = v.position
+        if not pos or not pos.latitude or not pos.longitude:
+            continue
+        vid = v.vehicle.id if v.vehicle and v.vehicle.id else (ent.id or "")
+        route_id = v.trip.route_id if v.trip and v.trip.route_id else ""
+        ts = int(v.timestamp) if v.timestamp else ts_fallback
+        vehicle_label = v.vehicle.label if (hasattr(v, "vehicle") and v.vehicle and hasattr(v.vehicle, "label")) else None
+        license_plate = v.vehicle.license_plate if (hasattr(v, "vehicle") and v.vehicle and hasattr(v.vehicle, "license_plate")) else None
+        trip_id = v.trip.trip_id if (hasattr(v, "trip") and v.trip and hasattr(v.trip, "trip_id")) else None
+        current_status = int(v.current_status) if hasattr(v, "current_status") and v.current_status is not None else None
+        stop_id = v.stop_id if hasattr(v, "stop_id") else None
+        current_stop_sequence = int(v.current_stop_sequence) if hasattr(v, "current_stop_sequence") and v.current_stop_sequence is not None else None
+        occupancy_status = int(v.occupancy_status) if hasattr(v, "occupancy_status") and v.occupancy_status is not None else None
+        occupancy_percentage = getattr(v, "occupancy_percentage", None)
+        out.append(
+            {
+                "id": vid or f"veh_{len(out)}",
+                "route_id": route_id or "UNKNOWN",
+                "lat": float(pos.latitude),
+                "lon": float(pos.longitude),
+                "speed": float(pos.speed) if pos.speed else None,
+                "heading": int(pos.bearing) if pos.bearing else None,
+                "ts": ts,
+                "label": vehicle_label,
+                "license_plate": license_plate,
+                "trip_id": trip_id,
+                "current_status": current_status,
+                "stop_id": stop_id,
+                "current_stop_sequence": current_stop_sequence,
+                "occupancy_status": occupancy_status,
+                "occupancy_percentage": occupancy_percentage,
+            }
+        )
+    return out
+
+
+def _best(fn, repeat=5) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    first = synthetic_feed(n)
+    raw1 = first.SerializeToString()
+    raw2 = synthetic_feed(n, seed=8, moved=0.2, base=first).SerializeToString()
+
+    legacy = _best(lambda: legacy_parse_vehicles(raw1))
+    fast = _best(lambda: decode_vehicles(raw1))
+
+    def steady():
+        dec = VehicleDecoder()
+        dec.decode(raw1)
+        t0 = time.perf_counter()
+        dec.decode(raw2)
+        return time.perf_counter() - t0
+
+    incremental = min(steady() for _ in range(5))
+
+    print(f"{n} vehicles, {len(raw1) / 1024:.0f} KiB payload")
+    print(f"  legacy dicts          {legacy * 1000:8.1f} ms")
+    print(f"  decode_vehicles       {fast * 1000:8.1f} ms  ({legacy / fast:.1f}x)")
+    print(f"  VehicleDecoder 20%Δ   {incremental * 1000:8.1f} ms  ({legacy / incremental:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Micro-benchmark: decoding a Valhalla trace_attributes response into storable geometry.
+
+Run from the repo root: `make bench` or `python -m bench.bench_polyline [n_points]`.
+"""
+import json, math, random, sys, timeit
+from ingest.src.match_routes import edges_to_lines
+from ingest.src.polyline import encode6, multilinestring_wkb, simplify
+
+
+def synthetic_response(n: int, edge_len: int = 20, seed: int = 7) -> dict:
+    """A street-like matched path of n vertices about 5 m apart: straight runs joined at
+    turns, with sub-meter jitter, split into edges that share their end vertices."""
+    rnd = random.Random(seed)
+    lon, lat = -76.61, 39.29
+    dlon = dlat = 0.0
+    pts = []
+    run = 0
+    for _ in range(n):
+        if run == 0:
+            ang = rnd.uniform(0, 6.283)
+            dlon, dlat = 5 * math.cos(ang) / 86_000, 5 * math.sin(ang) / 111_000
+            run = rnd.randint(5, 60)
+        run -= 1
+        lon += dlon
+        lat += dlat
+        pts.append([lon + rnd.uniform(-2e-6, 2e-6), lat + rnd.uniform(-2e-6, 2e-6)])
+    edges = [{"shape": encode6(pts[i:i + edge_len + 1])} for i in range(0, n - 1, edge_len)]
+    return {"edges": edges, "shape": encode6(pts)}
+
+
+def legacy_decode_polyline6(encoded: str):
+    """The per-character decoder match_routes used before polyline.decode6, kept as the baseline."""
+    result = []
+    index = lat = lon = 0
+    length = len(encoded)
+    factor = 1e-6
+    while index < length:
+        for coord in (lat, lon):
+            shift = 0
+            b = 0x20
+            value = 0
+            while b >= 0x20:
+                b = ord(encoded[index]) - 63
+                index += 1
+                value |= (b & 0x1F) << shift
+                shift += 5
+            d = ~(value >> 1) if (value & 1) else (value >> 1)
+            if coord is lat:
+                lat += d
+            else:
+                lon += d
+        result.append([lon * factor, lat * factor])
+    return result
+
+
+def legacy_geometry(resp: dict) -> str:
+    coords = [legacy_decode_polyline6(e["shape"]) for e in resp["edges"] if e.get("shape")]
+    return json.dumps({"type": "MultiLineString", "coordinates": coords})
+
+
+def fast_geometry(resp: dict, tolerance_m: float = 0.0) -> bytes:
+    return multilinestring_wkb([simplify(ln, tolerance_m) for ln in edges_to_lines(resp)])
+
+
+def _best(fn, repeat=5) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 15_000
+    resp = synthetic_response(n)
+
+    legacy = _best(lambda: legacy_geometry(resp))
+    fast = _best(lambda: fast_geometry(resp))
+    simplified = _best(lambda: fast_geometry(resp, 1.0))
+    kept = sum(len(simplify(ln, 1.0)) for ln in edges_to_lines(resp))
+
+    print(f"{n} points in {len(resp['edges'])} edges")
+    print(f"  legacy decode + json   {legacy * 1000:8.1f} ms")
+    print(f"  decode6 + merge + wkb  {fast * 1000:8.1f} ms  ({legacy / fast:.1f}x)")
+    print(f"  ... + simplify 1 m     {simplified * 1000:8.1f} ms  ({legacy / simplified:.1f}x), {kept} vertices kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Micro-benchmark: projecting a whole fleet onto its shapes in one batch.
+
+Run from the repo root: `make bench` or `python -m bench.bench_projection [n_vehicles] [gtfs.zip]`.
+Without a zip, a synthetic network about the size of MTA Maryland's (local bus, light
+rail, metro, MARC, commuter bus: ~1,000 shapes) is used; with one, its shapes.txt.
+"""
+import csv, io, math, random, sys, time, timeit, zipfile
+import numpy as np
+from ingest.src.projection import ShapeIndex
+
+
+def synthetic_shapes(n_shapes: int = 1000, seed: int = 7) -> dict[str, np.ndarray]:
+    """Street-like shapes of 300-1,500 vertices ~15 m apart, criss-crossing the region."""
+    rnd = random.Random(seed)
+    shapes = {}
+    for s in range(n_shapes):
+        lon, lat = -76.61 + rnd.uniform(-0.2, 0.2), 39.29 + rnd.uniform(-0.15, 0.15)
+        pts = []
+        run = 0
+        for _ in range(rnd.randint(300, 1500)):
+            if run == 0:
+                ang = rnd.choice((0, 1.571, 3.142, 4.712)) + rnd.uniform(-0.3, 0.3)
+                run = rnd.randint(10, 80)
+            run -= 1
+            lon += 15 * math.cos(ang) / 86_000
+            lat += 15 * math.sin(ang) / 111_000
+            pts.append((lon, lat))
+        shapes[f"s{s}"] = np.array(pts)
+    return shapes
+
+
+def zip_shapes(path: str) -> dict[str, np.ndarray]:
+    rows: dict[str, list] = {}
+    with zipfile.ZipFile(path) as zf, zf.open("shapes.txt") as f:
+        for r in csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig")):
+            rows.setdefault(r["shape_id"], []).append((int(r["shape_pt_sequence"]), float(r["shape_pt_lon"]), float(r["shape_pt_lat"])))
+    return {sid: np.array([p[1:] for p in sorted(pts)]) for sid, pts in rows.items()}
+
+
+def fleet(index: ShapeIndex, n: int, seed: int = 8):
+    """n vehicles each a few meters off a random point of a random shape."""
+    rnd = np.random.default_rng(seed)
+    shape = rnd.integers(0, len(index.shape_ids), n)
+    lo, hi = index.shape_range[shape, 0], index.shape_range[shape, 1]
+    seg = lo + (rnd.random(n) * (hi - lo)).astype(np.int64)
+    t = rnd.random(n)
+    x = index.x0[seg] + t * index.dx[seg] + rnd.normal(0, 8, n)
+    y = index.y0[seg] + t * index.dy[seg] + rnd.normal(0, 8, n)
+    return x / index.kx, y / index.ky, shape
+
+
+def per_vehicle(index: ShapeIndex, lon, lat, shape):
+    """Baseline: each vehicle scans its own shape's segments (what a per-vehicle
+    ST_LineLocatePoint does, minus the database round trips)."""
+    out = []
+    for i in range(len(lon)):
+        lo, hi = index.shape_range[shape[i]]
+        t, d2 = index._nearest(lon[i] * index.kx, lat[i] * index.ky, np.arange(lo, hi))
+        j = int(np.argmin(d2))
+        out.append((index.start[lo + j] + t[j] * math.sqrt(index.len2[lo + j]), math.sqrt(d2[j])))
+    return out
+
+
+def _best(fn, number=3, repeat=5):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    shapes = zip_shapes(sys.argv[2]) if len(sys.argv) > 2 else synthetic_shapes()
+
+    t0 = time.perf_counter()
+    index = ShapeIndex(shapes)
+    build = time.perf_counter() - t0
+    lon, lat, shape = fleet(index, n)
+
+    legacy = _best(lambda: per_vehicle(index, lon, lat, shape), number=1, repeat=3)
+    fast = _best(lambda: index.project(lon, lat, shape))
+    _, along, off = index.project(lon, lat, shape)
+    ref = np.array(per_vehicle(index, lon, lat, shape))
+    # Loops can pass the same spot twice; count where the nearest point was the same
+    agree = np.mean(np.isclose(off, ref[:, 1], atol=1e-6))
+
+    print(f"{n} vehicles on {len(index.shape_ids)} shapes, {len(index.x0)} segments (index built in {build * 1000:.0f} ms)")
+    print(f"  per-vehicle scan       {legacy * 1000:8.1f} ms")
+    print(f"  ShapeIndex.project     {fast * 1000:8.1f} ms  ({legacy / fast:.1f}x), {agree:.1%} identical")
+
+
+if __name__ == "__main__":
+    main()
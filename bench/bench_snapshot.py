@@ -0,0 +1,61 @@
+"""Micro-benchmark: /vehicles as JSON vs the columnar MessagePack snapshot.
+
+Run from the repo root: `make bench` or `python -m bench.bench_snapshot [n_vehicles]`.
+Compares bytes on the wire (raw, gzip, brotli as the API would send them) and the
+client's decode time: json.loads for JSON, unpacking plus typed-array views for the
+snapshot (what a browser does with DataView/TypedArray), and a full decode to dicts.
+"""
+import gzip, json, sys, time, timeit
+import brotli
+import msgpack
+import numpy as np
+from bench.bench_decode import synthetic_feed
+from ingest.src.decode import decode_vehicles
+from ingest.src.snapshot import NUMERIC_COLUMNS, decode_snapshot, encode_snapshot
+
+
+def fleet(n: int) -> list[dict]:
+    """The dicts ingest writes for n decoded vehicles, with shape projection filled in."""
+    out = []
+    for i, rec in enumerate(decode_vehicles(synthetic_feed(n).SerializeToString())):
+        rec.shape_id, rec.shape_dist, rec.off_route = f"localbus:{rec.route_id}_0", 37.5 * i % 12000, 4.2
+        out.append({**rec.to_dict(), "feed": "localbus"})
+    return out
+
+
+def _best(fn, repeat=7) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def views(blob: bytes):
+    snap = msgpack.unpackb(blob, raw=False)
+    return {col: np.frombuffer(snap[col], dtype=dt) for col, (_, dt, _) in NUMERIC_COLUMNS.items()}
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    vehicles = fleet(n)
+    body = json.dumps(vehicles, separators=(",", ":")).encode()
+    now = time.time()
+    snap = encode_snapshot(vehicles, now)
+    assert len(decode_snapshot(snap)) == n
+
+    def sizes(raw: bytes) -> str:
+        return (f"{len(raw) / 1024:7.1f} KiB raw  {len(gzip.compress(raw, 6)) / 1024:6.1f} gzip  "
+                f"{len(brotli.compress(raw, quality=5)) / 1024:6.1f} br")
+
+    print(f"{n} vehicles")
+    print(f"  JSON      {sizes(body)}")
+    print(f"  msgpack   {sizes(snap)}")
+    encode = _best(lambda: encode_snapshot(vehicles, now))
+    j = _best(lambda: json.loads(body))
+    v = _best(lambda: views(snap))
+    d = _best(lambda: decode_snapshot(snap))
+    print(f"  encode snapshot (per ingest write)  {encode * 1000:7.2f} ms")
+    print(f"  json.loads                          {j * 1000:7.2f} ms")
+    print(f"  msgpack + typed-array views         {v * 1000:7.2f} ms  ({j / v:.0f}x)")
+    print(f"  msgpack to dicts                    {d * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
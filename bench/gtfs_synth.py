@@ -0,0 +1,189 @@
+"""Synthetic static GTFS for offline benchmarks.
+
+    python -m bench.gtfs_synth out.zip [--routes 60] [--fleet 600] [--route-km 10] [--seed 7]
+
+Each route is a street-like random walk around downtown Baltimore, run in both
+directions (shapes `{route}_0` and `{route}_1`) with a stop every STOP_SPACING_M.
+Trips run all day on a fixed headway, chosen so about `fleet` vehicles are in service
+at any moment. bench/rt_server.py simulates realtime vehicles from the same Network,
+so its trip and stop IDs line up with what `load_gtfs --zip bench=out.zip` seeds.
+"""
+import argparse, csv, io, math, zipfile
+import numpy as np
+
+STOP_SPACING_M = 350
+SPEED_MPS = 7.0  # average including dwell, ~25 km/h
+CENTER = (-76.6122, 39.2904)
+_KX = 111_320 * math.cos(math.radians(CENTER[1]))
+_KY = 110_574
+
+
+class Route:
+    __slots__ = ("route_id", "lonlat", "dist", "stop_dist", "stop_ids", "offset")
+
+    def __init__(self, route_id: str, lonlat: np.ndarray, offset: float):
+        self.route_id = route_id
+        self.lonlat = lonlat
+        step = np.hypot(np.diff(lonlat[:, 0]) * _KX, np.diff(lonlat[:, 1]) * _KY)
+        self.dist = np.concatenate(([0.0], np.cumsum(step)))
+        self.stop_dist = np.append(np.arange(0, self.length, STOP_SPACING_M), self.length)
+        self.stop_ids = [f"{route_id}_s{j}" for j in range(len(self.stop_dist))]
+        # Seconds added to every departure so routes do not all leave on the same tick
+        self.offset = offset
+
+    @property
+    def length(self) -> float:
+        return float(self.dist[-1])
+
+    @property
+    def duration(self) -> float:
+        return self.length / SPEED_MPS
+
+    def shape(self, direction: int) -> np.ndarray:
+        return self.lonlat if direction == 0 else self.lonlat[::-1]
+
+    def stops(self, direction: int) -> tuple[list[str], np.ndarray]:
+        """Stop IDs and their distance along the direction's shape, in travel order."""
+        if direction == 0:
+            return self.stop_ids, self.stop_dist
+        return self.stop_ids[::-1], self.length - self.stop_dist[::-1]
+
+    def position(self, direction: int, along: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """lon, lat and heading (degrees) at distances along the direction's shape."""
+        pts = self.shape(direction)
+        dist = self.dist if direction == 0 else self.length - self.dist[::-1]
+        lon = np.interp(along, dist, pts[:, 0])
+        lat = np.interp(along, dist, pts[:, 1])
+        seg = np.clip(np.searchsorted(dist, along, side="right") - 1, 0, len(pts) - 2)
+        dx = (pts[seg + 1, 0] - pts[seg, 0]) * _KX
+        dy = (pts[seg + 1, 1] - pts[seg, 1]) * _KY
+        return lon, lat, np.degrees(np.arctan2(dx, dy)) % 360
+
+
+class Network:
+    """Routes plus a shared headway; trip k of a route/direction departs at
+    offset + k * headway (+ half a headway for direction 1) seconds into the service day."""
+
+    def __init__(self, routes: list[Route], headway: float):
+        self.routes = routes
+        self.headway = headway
+
+    def trip_id(self, route: Route, direction: int, k: int) -> str:
+        return f"{route.route_id}_{direction}_{k}"
+
+    def departure(self, route: Route, direction: int, k: int) -> float:
+        return route.offset + k * self.headway + direction * self.headway / 2
+
+    def trips_per_direction(self, route: Route) -> int:
+        return int((86_400 - route.offset - self.headway / 2) // self.headway) + 1
+
+    def active(self, route: Route, direction: int, t: float) -> range:
+        """k of the trips of one service day under way `t` seconds into it."""
+        base = route.offset + direction * self.headway / 2
+        lo = max(0, math.ceil((t - route.duration - base) / self.headway))
+        hi = min(self.trips_per_direction(route) - 1, math.floor((t - base) / self.headway))
+        return range(lo, hi + 1)
+
+
+def _walk(rng: np.random.Generator, km: float) -> np.ndarray:
+    """A street-like polyline: straight runs of 150-1,200 m at right angles, 15 m vertices."""
+    n = int(km * 1000 / 15)
+    pts = np.empty((n, 2))
+    lon = CENTER[0] + rng.uniform(-0.12, 0.12)
+    lat = CENTER[1] + rng.uniform(-0.09, 0.09)
+    ang, run = 0.0, 0
+    for i in range(n):
+        if run == 0:
+            ang = rng.choice((0, math.pi / 2, math.pi, 3 * math.pi / 2)) + rng.uniform(-0.25, 0.25)
+            run = int(rng.integers(10, 80))
+            # Drift back towards the centre rather than wandering off the map
+            if abs(lon - CENTER[0]) > 0.2 or abs(lat - CENTER[1]) > 0.15:
+                ang = math.atan2((CENTER[1] - lat) * _KY, (CENTER[0] - lon) * _KX)
+        run -= 1
+        lon += 15 * math.cos(ang) / _KX
+        lat += 15 * math.sin(ang) / _KY
+        pts[i] = lon, lat
+    return pts
+
+
+def synth_network(routes: int = 60, fleet: int = 600, route_km: float = 10, seed: int = 7) -> Network:
+    rng = np.random.default_rng(seed)
+    rs = [Route(f"R{i + 1}", _walk(rng, route_km * rng.uniform(0.6, 1.4)), float(rng.uniform(0, 600)))
+          for i in range(routes)]
+    # A vehicle is busy for one trip in each direction per cycle
+    cycle = sum(2 * r.duration for r in rs)
+    return Network(rs, max(60.0, cycle / max(fleet, 1)))
+
+
+def _hms(secs: float) -> str:
+    s = int(round(secs))
+    return f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}"
+
+
+def _write_csv(zf: zipfile.ZipFile, name: str, header: list[str], rows):
+    with zf.open(name, "w") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+
+
+def write_gtfs_zip(net: Network, path: str) -> None:
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        _write_csv(zf, "agency.txt", ["agency_id", "agency_name", "agency_url", "agency_timezone"],
+                   [["BENCH", "Bench Transit", "https://example.invalid", "America/New_York"]])
+        _write_csv(zf, "routes.txt", ["route_id", "agency_id", "route_short_name", "route_long_name", "route_type", "route_color"],
+                   ([r.route_id, "BENCH", r.route_id[1:], f"Synthetic {r.route_id}", 3, "1F77B4"] for r in net.routes))
+        _write_csv(zf, "calendar.txt", ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday",
+                                        "saturday", "sunday", "start_date", "end_date"],
+                   [["ALL", 1, 1, 1, 1, 1, 1, 1, "20200101", "20991231"]])
+        stops = []
+        for r in net.routes:
+            lon, lat, _ = r.position(0, r.stop_dist)
+            stops.extend([sid, f"{r.route_id} stop {j}", f"{a:.6f}", f"{o:.6f}"]
+                         for j, (sid, a, o) in enumerate(zip(r.stop_ids, lat, lon)))
+        _write_csv(zf, "stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon"], stops)
+        _write_csv(zf, "shapes.txt", ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"],
+                   ([f"{r.route_id}_{d}", f"{la:.6f}", f"{lo:.6f}", i + 1]
+                    for r in net.routes for d in (0, 1) for i, (lo, la) in enumerate(r.shape(d))))
+        _write_csv(zf, "trips.txt", ["route_id", "service_id", "trip_id", "direction_id", "shape_id", "trip_headsign"],
+                   ([r.route_id, "ALL", net.trip_id(r, d, k), d, f"{r.route_id}_{d}", f"{r.route_id} dir {d}"]
+                    for r in net.routes for d in (0, 1) for k in range(net.trips_per_direction(r))))
+
+        def stop_times():
+            for r in net.routes:
+                for d in (0, 1):
+                    ids, along = r.stops(d)
+                    offsets = along / SPEED_MPS
+                    for k in range(net.trips_per_direction(r)):
+                        trip, dep = net.trip_id(r, d, k), net.departure(r, d, k)
+                        for seq, (sid, off) in enumerate(zip(ids, offsets)):
+                            t = _hms(dep + off)
+                            yield trip, t, t, sid, seq + 1
+
+        _write_csv(zf, "stop_times.txt", ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"], stop_times())
+
+
+def add_network_args(ap: argparse.ArgumentParser):
+    ap.add_argument("--routes", type=int, default=60)
+    ap.add_argument("--fleet", type=int, default=600, help="vehicles in service at any moment")
+    ap.add_argument("--route-km", type=float, default=10)
+    ap.add_argument("--seed", type=int, default=7)
+
+
+def network_from_args(args) -> Network:
+    return synth_network(args.routes, args.fleet, args.route_km, args.seed)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("out")
+    add_network_args(ap)
+    args = ap.parse_args(argv)
+    net = network_from_args(args)
+    write_gtfs_zip(net, args.out)
+    print(f"{args.out}: {len(net.routes)} routes, headway {net.headway:.0f} s, "
+          f"{sum(2 * net.trips_per_direction(r) for r in net.routes)} trips")
+
+
+if __name__ == "__main__":
+    main()
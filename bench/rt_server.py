@@ -0,0 +1,235 @@
+"""Local GTFS-RT stand-in for offline load tests.
+
+    python -m bench.rt_server [--port 8765] [--fleet 600] [--alerts 50] [--latency-ms 0]
+                              [--jitter-ms 0] [--fail-rate 0] [--hang-rate 0] [--tick 1]
+
+Serves /vehicles, /trip_updates and /alerts as GTFS-RT protobuf, simulated from the
+same synthetic Network as bench/gtfs_synth.py (same arguments give the same IDs).
+Vehicles drive their scheduled trips along the shapes with a per-trip delay that
+drifts over time, so payloads change every `tick` seconds; within a tick the body
+and ETag repeat (a conditional GET gets a 304). Latency, 503s and hung requests
+can be injected to exercise ingest's deadlines and fallbacks.
+"""
+import argparse, hashlib, math, random, threading, time, zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from google.transit import gtfs_realtime_pb2 as gtfs
+from ingest.src.eta import AGENCY_TZ, service_day_start
+from .gtfs_synth import SPEED_MPS, Network, add_network_args, network_from_args
+
+HANG_SECONDS = 60
+# Stop time updates per trip: the next stop, then one every few stops after it
+UPDATE_STRIDE = 5
+UPDATES_PER_TRIP = 3
+
+
+def _delay(trip_id: str, t: float) -> int:
+    """Seconds late, drifting smoothly between about -1 and +5 minutes."""
+    h = zlib.crc32(trip_id.encode())
+    phase, bias = (h & 0xFFFF) / 0xFFFF * 2 * math.pi, ((h >> 16) & 0xFF) / 255
+    return int(180 * math.sin(t / 900 + phase) + 120 * bias)
+
+
+class Simulation:
+    """Builds the three feeds for a moment in time."""
+
+    def __init__(self, net: Network, n_alerts: int = 50, fleet_cap: int | None = None):
+        self.net = net
+        self.n_alerts = n_alerts
+        self.fleet_cap = fleet_cap
+
+    def _service_days(self, now: float):
+        today = datetime.fromtimestamp(now, AGENCY_TZ).date()
+        start = service_day_start(today)
+        # Trips of yesterday's service day can still run after midnight
+        yield today, now - start
+        yesterday = datetime.fromordinal(today.toordinal() - 1).date()
+        yield yesterday, now - service_day_start(yesterday)
+
+    def vehicles_at(self, now: float) -> list[tuple]:
+        """(vehicle_id, trip_id, route, direction, start_date, lon, lat, heading, delay, next stop index)."""
+        out = []
+        for day, t in self._service_days(now):
+            date = day.strftime("%Y%m%d")
+            for ri, r in enumerate(self.net.routes):
+                for d in (0, 1):
+                    ks = self.net.active(r, d, t)
+                    if not ks:
+                        continue
+                    trips = [self.net.trip_id(r, d, k) for k in ks]
+                    delays = np.array([_delay(tid, now) for tid in trips])
+                    deps = np.array([self.net.departure(r, d, k) for k in ks])
+                    along = np.clip((t - deps - delays) * SPEED_MPS, 0, r.length)
+                    lon, lat, heading = r.position(d, along)
+                    _, stop_along = r.stops(d)
+                    nxt = np.searchsorted(stop_along, along, side="left")
+                    for i, (tid, k) in enumerate(zip(trips, ks)):
+                        # Vehicle ids are stable per route/direction slot, as a block would be
+                        vid = f"V{ri:03d}{d}{k % 1000:03d}"
+                        out.append((vid, tid, r, d, date, lon[i], lat[i], heading[i], int(delays[i]), int(nxt[i])))
+        if self.fleet_cap is not None:
+            out = out[:self.fleet_cap]
+        return out
+
+    def _message(self, now: float) -> gtfs.FeedMessage:
+        msg = gtfs.FeedMessage()
+        msg.header.gtfs_realtime_version = "2.0"
+        msg.header.incrementality = gtfs.FeedHeader.FULL_DATASET
+        msg.header.timestamp = int(now)
+        return msg
+
+    def vehicle_feed(self, now: float, fleet) -> bytes:
+        msg = self._message(now)
+        for vid, tid, r, d, date, lon, lat, heading, _, nxt in fleet:
+            v = msg.entity.add(id=vid).vehicle
+            v.trip.trip_id, v.trip.route_id, v.trip.direction_id, v.trip.start_date = tid, r.route_id, d, date
+            v.vehicle.id = vid
+            v.position.latitude, v.position.longitude = float(lat), float(lon)
+            v.position.bearing, v.position.speed = float(heading), SPEED_MPS
+            v.current_stop_sequence = nxt + 1
+            v.timestamp = int(now)
+        return msg.SerializeToString()
+
+    def trip_update_feed(self, now: float, fleet) -> bytes:
+        msg = self._message(now)
+        for vid, tid, r, d, date, _, _, _, delay, nxt in fleet:
+            tu = msg.entity.add(id=tid).trip_update
+            tu.trip.trip_id, tu.trip.route_id, tu.trip.start_date = tid, r.route_id, date
+            tu.vehicle.id = vid
+            ids, _ = r.stops(d)
+            for seq in range(nxt, min(len(ids), nxt + UPDATE_STRIDE * UPDATES_PER_TRIP), UPDATE_STRIDE):
+                stu = tu.stop_time_update.add(stop_sequence=seq + 1, stop_id=ids[seq])
+                stu.arrival.delay = delay
+        return msg.SerializeToString()
+
+    def alert_feed(self, now: float) -> bytes:
+        """n_alerts alerts on rotating routes and stops; each is active for a 10-minute
+        window that moves on every 5 minutes, so the active set keeps changing."""
+        msg = self._message(now)
+        routes = self.net.routes
+        slot = int(now // 300)
+        for i in range(self.n_alerts):
+            rnd = random.Random(i * 7919 + slot // 2)
+            r = routes[rnd.randrange(len(routes))]
+            a = msg.entity.add(id=f"A{i}").alert
+            start = (slot - (i % 2)) * 300
+            a.active_period.add(start=start, end=start + 600)
+            if i % 3 == 0:
+                a.informed_entity.add(stop_id=r.stop_ids[rnd.randrange(len(r.stop_ids))])
+                a.effect = gtfs.Alert.STOP_MOVED
+            else:
+                a.informed_entity.add(route_id=r.route_id)
+                a.effect = gtfs.Alert.DETOUR
+            a.header_text.translation.add(text=f"Synthetic alert {i} on {r.route_id}", language="en")
+        return msg.SerializeToString()
+
+
+class FeedCache:
+    """Feeds built once per tick, shared by every request in it."""
+
+    def __init__(self, sim: Simulation, tick: float):
+        self.sim = sim
+        self.tick = tick
+        self._at = None
+        self._bodies: dict[str, tuple[bytes, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str) -> tuple[bytes, str]:
+        now = time.time()
+        at = now - now % self.tick
+        with self._lock:
+            if at != self._at:
+                self._at, self._bodies = at, {}
+            body = self._bodies.get(kind)
+            if body is None:
+                if kind == "alerts":
+                    raw = self.sim.alert_feed(at)
+                else:
+                    fleet = self.sim.vehicles_at(at)
+                    raw = self.sim.vehicle_feed(at, fleet) if kind == "vehicles" else self.sim.trip_update_feed(at, fleet)
+                body = self._bodies[kind] = (raw, f'"{hashlib.blake2b(raw, digest_size=12).hexdigest()}"')
+        return body
+
+
+class Faults:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, fail_rate=0.0, hang_rate=0.0):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.fail_rate, self.hang_rate = fail_rate, hang_rate
+
+
+def make_handler(feeds: FeedCache, faults: Faults, stats: dict):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes = b"", headers: dict | None = None):
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            kind = self.path.split("?", 1)[0].strip("/")
+            if kind not in ("vehicles", "trip_updates", "alerts"):
+                return self._send(404)
+            stats[kind] = stats.get(kind, 0) + 1
+            delay = max(0.0, faults.latency_ms + random.uniform(-1, 1) * faults.jitter_ms) / 1000
+            roll = random.random()
+            if roll < faults.hang_rate:
+                stats["hung"] = stats.get("hung", 0) + 1
+                time.sleep(HANG_SECONDS)
+            elif roll < faults.hang_rate + faults.fail_rate:
+                stats["failed"] = stats.get("failed", 0) + 1
+                time.sleep(delay)
+                return self._send(503, b"injected failure")
+            raw, etag = feeds.get(kind)
+            time.sleep(delay)
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+            self._send(200, raw, {"Content-Type": "application/x-protobuf", "ETag": etag})
+
+    return Handler
+
+
+def serve(net: Network, port: int = 8765, n_alerts: int = 50, tick: float = 1.0, faults: Faults | None = None,
+          fleet_cap: int | None = None) -> tuple[ThreadingHTTPServer, dict]:
+    """Start the server on a daemon thread; returns it and its per-kind request counts."""
+    stats: dict = {}
+    handler = make_handler(FeedCache(Simulation(net, n_alerts, fleet_cap), tick), faults or Faults(), stats)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="rt-server", daemon=True).start()
+    return server, stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    add_network_args(ap)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--alerts", type=int, default=50)
+    ap.add_argument("--tick", type=float, default=1.0, help="seconds between payload changes")
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--jitter-ms", type=float, default=0)
+    ap.add_argument("--fail-rate", type=float, default=0, help="share of requests answered with 503")
+    ap.add_argument("--hang-rate", type=float, default=0, help=f"share of requests stalled for {HANG_SECONDS} s")
+    args = ap.parse_args(argv)
+    net = network_from_args(args)
+    faults = Faults(args.latency_ms, args.jitter_ms, args.fail_rate, args.hang_rate)
+    server, stats = serve(net, args.port, args.alerts, args.tick, faults)
+    print(f"serving http://127.0.0.1:{args.port}/{{vehicles,trip_updates,alerts}}")
+    try:
+        while True:
+            time.sleep(10)
+            print(stats)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Scripted load test: synthetic feeds into ingest, then a burst of API traffic.
+
+    python -m bench.scenario [baseline|large|flaky] [--api http://localhost:8000]
+                             [--seed-db] [--no-ingest] [--duration 30] [--json out.json]
+
+Steps, all on one machine:
+
+1. Build the synthetic network (bench/gtfs_synth.py); with --seed-db also write its zip
+   and load it with `python -m src.load_gtfs --zip bench=...` so schedule, stops and
+   shapes line up with the realtime IDs.
+2. Start bench/rt_server.py with the scenario's fleet size and injected faults.
+3. Start ingest (`python -m src.main`) with FEEDS=bench pointed at it, unless
+   --no-ingest (e.g. the docker ingest is already configured for the stand-in).
+4. After a warm-up, hit the API from `concurrency` clients for `duration` seconds with a
+   weighted mix of endpoints, and report per-endpoint throughput and p50/p90/p99.
+5. Scrape ingest's metrics for the per-feed fetch/parse/write histograms.
+
+Redis and Postgres come from REDIS_URL / DATABASE_URL as for the services themselves.
+Results can be written as JSON and compared between commits.
+"""
+import argparse, asyncio, json, os, random, subprocess, sys, tempfile, time
+from pathlib import Path
+import httpx
+import numpy as np
+from .gtfs_synth import network_from_args, add_network_args, write_gtfs_zip
+from .rt_server import Faults, serve
+
+ROOT = Path(__file__).resolve().parent.parent
+FEED = "bench"
+
+SCENARIOS = {
+    "baseline": {"fleet": 600, "alerts": 50, "concurrency": 32, "faults": {}},
+    "large": {"fleet": 3000, "routes": 150, "alerts": 400, "concurrency": 64, "faults": {}},
+    "flaky": {
+        "fleet": 600,
+        "alerts": 50,
+        "concurrency": 32,
+        "faults": {"latency_ms": 300, "jitter_ms": 250, "fail_rate": 0.1, "hang_rate": 0.02},
+    },
+}
+
+
+def endpoint_mix(net, rnd: random.Random) -> list[tuple[str, float, object]]:
+    """(name, weight, request factory) for the endpoints a map client calls most."""
+    routes = net.routes
+
+    def stop():
+        r = rnd.choice(routes)
+        return rnd.choice(r.stop_ids), r
+
+    def point():
+        r = rnd.choice(routes)
+        lon, lat = r.lonlat[rnd.randrange(len(r.lonlat))]
+        return float(lat), float(lon)
+
+    def bbox():
+        lat, lon = point()
+        return f"{lon - 0.02:.5f},{lat - 0.015:.5f},{lon + 0.02:.5f},{lat + 0.015:.5f}"
+
+    return [
+        ("vehicles", 30, lambda: ("GET", "/vehicles", None)),
+        ("vehicles?bbox", 15, lambda: ("GET", f"/vehicles?bbox={bbox()}", None)),
+        ("vehicles?route_id", 10, lambda: ("GET", f"/vehicles?route_id={FEED}:{rnd.choice(routes).route_id}", None)),
+        ("routes", 5, lambda: ("GET", "/routes", None)),
+        ("stops/near", 10, lambda: ("GET", "/stops/near?lat={}&lon={}&r=500".format(*point()), None)),
+        ("stops/near/batch", 2, lambda: ("POST", "/stops/near/batch",
+                                         {"points": [dict(zip(("lat", "lon"), point())) for _ in range(50)]})),
+        ("stops/arrivals", 20, lambda: ("GET", f"/stops/{FEED}:{stop()[0]}/arrivals", None)),
+        ("routes/alerts", 4, lambda: ("GET", f"/routes/{FEED}:{rnd.choice(routes).route_id}/alerts", None)),
+        ("stops/alerts", 4, lambda: ("GET", f"/stops/{FEED}:{stop()[0]}/alerts", None)),
+    ]
+
+
+async def hammer(api: str, mix, concurrency: int, duration: float) -> dict[str, dict]:
+    names = [m[0] for m in mix]
+    weights = [m[1] for m in mix]
+    makers = {m[0]: m[2] for m in mix}
+    samples: dict[str, list[float]] = {n: [] for n in names}
+    errors: dict[str, int] = {n: 0 for n in names}
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def client_loop(client: httpx.AsyncClient, seed: int):
+        rnd = random.Random(seed)
+        while time.perf_counter() < deadline:
+            name = rnd.choices(names, weights)[0]
+            method, path, body = makers[name]()
+            t0 = time.perf_counter()
+            try:
+                resp = await client.request(method, path, json=body)
+                ok = resp.status_code < 400 or resp.status_code == 404
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                samples[name].append(time.perf_counter() - t0)
+            else:
+                errors[name] += 1
+
+    async with httpx.AsyncClient(base_url=api, limits=limits, timeout=10,
+                                 headers={"Accept-Encoding": "br, gzip"}) as client:
+        await asyncio.gather(*(client_loop(client, i) for i in range(concurrency)))
+    out = {}
+    for n in names:
+        lat = np.array(samples[n]) * 1000
+        out[n] = {
+            "requests": len(lat),
+            "errors": errors[n],
+            "rps": round(len(lat) / duration, 1),
+            **({f"p{p}_ms": round(float(np.percentile(lat, p)), 2) for p in (50, 90, 99)} if len(lat) else {}),
+            "max_ms": round(float(lat.max()), 2) if len(lat) else None,
+        }
+    return out
+
+
+def scrape_ingest(url: str) -> dict[str, dict]:
+    """Mean of each per-feed histogram from ingest's /metrics, as {metric: {kind: mean}}."""
+    try:
+        text = httpx.get(url, timeout=5).text
+    except httpx.HTTPError:
+        return {}
+    sums: dict[tuple, float] = {}
+    counts: dict[tuple, float] = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "{" not in line:
+            continue
+        name, rest = line.split("{", 1)
+        labels, value = rest.rsplit("} ", 1)
+        kind = next((p.split("=", 1)[1].strip('"') for p in labels.split(",") if p.startswith("kind=")), None)
+        if kind is None:
+            continue
+        if name.endswith("_sum"):
+            sums[(name[:-4], kind)] = float(value)
+        elif name.endswith("_count"):
+            counts[(name[:-6], kind)] = float(value)
+    out: dict[str, dict] = {}
+    for (metric, kind), total in sums.items():
+        n = counts.get((metric, kind)) or 0
+        if n:
+            out.setdefault(metric, {})[kind] = round(total / n, 4)
+    return out
+
+
+def start_ingest(port: int, poll: dict) -> subprocess.Popen:
+    base = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "FEEDS": FEED,
+        f"FEED_{FEED}_VEHICLES_URL": f"{base}/vehicles",
+        f"FEED_{FEED}_TRIP_UPDATES_URL": f"{base}/trip_updates",
+        f"FEED_{FEED}_ALERTS_URL": f"{base}/alerts",
+        **{k: str(v) for k, v in poll.items()},
+    }
+    return subprocess.Popen([sys.executable, "-m", "src.main"], cwd=ROOT / "ingest", env=env)
+
+
+def print_report(result: dict):
+    print(f"\n{'endpoint':<20}{'req':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, s in result["api"].items():
+        print(f"{name:<20}{s['requests']:>8}{s['errors']:>6}{s['rps']:>9}"
+              + "".join(f"{s.get(k) if s.get(k) is not None else '-':>9}" for k in ("p50_ms", "p90_ms", "p99_ms", "max_ms")))
+    for metric, kinds in result.get("ingest", {}).items():
+        print(f"{metric:<28}" + "  ".join(f"{k}={v}" for k, v in sorted(kinds.items())))
+    print("rt server requests:", result.get("rt_server"))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    ap.add_argument("scenario", nargs="?", default="baseline", choices=sorted(SCENARIOS))
+    add_network_args(ap)
+    ap.add_argument("--api", default=os.getenv("BENCH_API", "http://localhost:8000"))
+    ap.add_argument("--ingest-metrics", default="http://localhost:9108/metrics")
+    ap.add_argument("--port", type=int, default=8765, help="port of the GTFS-RT stand-in")
+    ap.add_argument("--seed-db", action="store_true", help="load the synthetic static GTFS first")
+    ap.add_argument("--no-ingest", action="store_true", help="do not start an ingest process")
+    ap.add_argument("--warmup", type=float, default=20)
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--concurrency", type=int)
+    ap.add_argument("--json", help="write the results here as well")
+    args = ap.parse_args(argv)
+
+    sc = SCENARIOS[args.scenario]
+    # Scenario sizes override the defaults, not explicit flags
+    for key in ("fleet", "routes"):
+        if key in sc and getattr(args, key) == ap.get_default(key):
+            setattr(args, key, sc[key])
+    net = network_from_args(args)
+    print(f"[bench] {args.scenario}: {len(net.routes)} routes, ~{args.fleet} vehicles, headway {net.headway:.0f} s")
+
+    if args.seed_db:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench_gtfs.zip")
+            write_gtfs_zip(net, path)
+            subprocess.run([sys.executable, "-m", "src.load_gtfs", "--zip", f"{FEED}={path}"], cwd=ROOT / "ingest", check=True)
+
+    server, stats = serve(net, args.port, sc["alerts"], faults=Faults(**sc["faults"]))
+    ingest = None if args.no_ingest else start_ingest(args.port, {"VEHICLES_POLL_SECONDS": 2, "TRIP_UPDATES_POLL_SECONDS": 10})
+    try:
+        print(f"[bench] warming up for {args.warmup:.0f} s")
+        time.sleep(args.warmup)
+        concurrency = args.concurrency or sc["concurrency"]
+        print(f"[bench] {concurrency} clients for {args.duration:.0f} s against {args.api}")
+        mix = endpoint_mix(net, random.Random(args.seed))
+        api = asyncio.run(hammer(args.api, mix, concurrency, args.duration))
+        result = {
+            "scenario": args.scenario,
+            "fleet": args.fleet,
+            "routes": len(net.routes),
+            "concurrency": concurrency,
+            "duration": args.duration,
+            "api": api,
+            "ingest": scrape_ingest(args.ingest_metrics),
+            "rt_server": dict(stats),
+        }
+    finally:
+        if ingest is not None:
+            ingest.terminate()
+            ingest.wait(timeout=10)
+        server.shutdown()
+    print_report(result)
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
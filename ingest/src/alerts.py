@@ -0,0 +1,98 @@
+"""Service alerts decoded per feed into per-entity lookup keys.
+
+A feed's Alerts payload is decoded once when it changes. Every poll the alerts whose
+active periods cover the current time are grouped by what they inform:
+
+    alerts:route:{route_id}    alerts:stop:{stop_id}    alerts:trip:{trip_id}
+    alerts:agency:{feed}       (agency- or mode-wide alerts with no narrower selector)
+
+A selector with several fields means their intersection, so a stop on one route is
+indexed only under the stop (the route stays in the alert's `informed_entity`). A trip
+selector goes under the trip and, when it names one, under the trip's route as well:
+the trip is part of that route, and no API endpoint reads trips on their own. Each key
+holds a JSON array of alert objects, so the API answers a route or stop with one read.
+IDs are feed-prefixed like the static tables, so every key belongs to one feed.
+"""
+
+import json
+from google.transit import gtfs_realtime_pb2 as gtfs
+
+LANGUAGE = "en"
+
+
+def _text(ts) -> str | None:
+    """Pick the English translation, else an untagged one, else the first."""
+    if not ts.translation:
+        return None
+    by_lang = {t.language or "": t.text for t in ts.translation}
+    return by_lang.get(LANGUAGE) or by_lang.get("") or ts.translation[0].text
+
+
+def _enum(enum, value) -> str:
+    try:
+        return enum.Name(value)
+    except ValueError:
+        return "UNKNOWN"
+
+
+def decode_alerts(raw: bytes, feed: str) -> list[tuple[dict, list[tuple[int, int]], list[str]]]:
+    """(alert, active periods, index keys) per alert; open period ends are 0."""
+    msg = gtfs.FeedMessage()
+    msg.ParseFromString(raw)
+    out = []
+    for ent in msg.entity:
+        if not ent.HasField("alert") or ent.is_deleted:
+            continue
+        a = ent.alert
+        periods = [(p.start, p.end) for p in a.active_period]
+        keys = []
+        informed = []
+        for sel in a.informed_entity:
+            ids = {
+                "route_id": sel.route_id or sel.trip.route_id,
+                "stop_id": sel.stop_id,
+                "trip_id": sel.trip.trip_id if sel.HasField("trip") else "",
+            }
+            ids = {k: f"{feed}:{v}" for k, v in ids.items() if v}
+            informed.append(ids)
+            if "trip_id" in ids:
+                keys.append(f"alerts:trip:{ids['trip_id']}")
+                if "route_id" in ids:
+                    keys.append(f"alerts:route:{ids['route_id']}")
+            elif "stop_id" in ids:
+                keys.append(f"alerts:stop:{ids['stop_id']}")
+            elif "route_id" in ids:
+                keys.append(f"alerts:route:{ids['route_id']}")
+            else:
+                keys.append(f"alerts:agency:{feed}")
+        if not keys:
+            continue
+        alert = {
+            "id": f"{feed}:{ent.id}",
+            "feed": feed,
+            "cause": _enum(gtfs.Alert.Cause, a.cause),
+            "effect": _enum(gtfs.Alert.Effect, a.effect),
+            "severity": _enum(gtfs.Alert.SeverityLevel, a.severity_level),
+            "header": _text(a.header_text),
+            "description": _text(a.description_text),
+            "url": _text(a.url),
+            "active_period": [{"start": s or None, "end": e or None} for s, e in periods],
+            "informed_entity": [ids for ids in informed if ids],
+        }
+        out.append((alert, periods, list(dict.fromkeys(keys))))
+    return out
+
+
+def is_active(periods: list[tuple[int, int]], now: float) -> bool:
+    # No period means active for as long as the alert is in the feed
+    return not periods or any((not s or s <= now) and (not e or now < e) for s, e in periods)
+
+
+def index_alerts(alerts, now: float) -> dict[str, str]:
+    """key -> JSON array of the alerts active at `now`, in feed order."""
+    grouped: dict[str, list[dict]] = {}
+    for alert, periods, keys in alerts:
+        if is_active(periods, now):
+            for key in keys:
+                grouped.setdefault(key, []).append(alert)
+    return {k: json.dumps(v, separators=(",", ":")) for k, v in grouped.items()}
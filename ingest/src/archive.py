@@ -0,0 +1,155 @@
+"""Append-only archive of vehicle positions for analytics.
+
+Each poll's moved vehicles are handed to a background thread, which batches them and
+bulk-loads them into `vehicle_positions` with COPY. The table is partitioned by UTC
+day; partitions are created on first write and dropped after ARCHIVE_RETENTION_DAYS,
+so time-range queries only touch the days they ask for. The poll loop never waits on
+the database: a full queue drops rows (counted in ARCHIVE_DROPPED) instead.
+"""
+
+import io, os, queue, threading, time
+from datetime import datetime, timedelta, timezone
+from prometheus_client import Counter
+from .db import conn
+from .metrics import registry
+
+ARCHIVE_POSITIONS = os.getenv("ARCHIVE_POSITIONS", "true").lower() in ("1", "true", "yes")
+# Rows are flushed at least this often, or as soon as a batch is this large
+ARCHIVE_FLUSH_SECONDS = float(os.getenv("ARCHIVE_FLUSH_SECONDS", "10"))
+ARCHIVE_BATCH_ROWS = int(os.getenv("ARCHIVE_BATCH_ROWS", "20000"))
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+# Polls waiting for the writer; beyond this (e.g. database down) new polls are dropped
+ARCHIVE_QUEUE_POLLS = int(os.getenv("ARCHIVE_QUEUE_POLLS", "2000"))
+
+ARCHIVE_ROWS = Counter("archive_rows", "Vehicle positions written to vehicle_positions", registry=registry)
+ARCHIVE_DROPPED = Counter("archive_dropped_rows", "Vehicle positions dropped because the archive fell behind", registry=registry)
+
+COLUMNS = ("ts", "feed", "vehicle_id", "route_id", "trip_id", "lat", "lon", "speed", "heading",
+           "shape_id", "shape_dist", "off_route")
+COPY_SQL = f"COPY vehicle_positions ({', '.join(COLUMNS)}) FROM STDIN"
+PARTITION_SQL = """
+  CREATE TABLE IF NOT EXISTS {name} PARTITION OF vehicle_positions
+  FOR VALUES FROM ('{lo}') TO ('{hi}')
+"""
+PARTITIONS_SQL = """
+  SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+  WHERE i.inhparent = 'vehicle_positions'::regclass
+"""
+
+
+def partition_name(day) -> str:
+    return f"vehicle_positions_{day:%Y%m%d}"
+
+
+def _text(v) -> str:
+    if v is None or v == "":
+        return r"\N"
+    if isinstance(v, str):
+        return v.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return str(v)
+
+
+def position_rows(feed: str, records) -> list[tuple]:
+    """(day, COPY text line) for each record; IDs are feed-prefixed like the static tables."""
+    out = []
+    stamps: dict[int, tuple] = {}
+    for rec in records:
+        stamp = stamps.get(rec.ts)
+        if stamp is None:
+            ts = datetime.fromtimestamp(rec.ts, timezone.utc)
+            stamp = stamps[rec.ts] = (ts.date(), ts.isoformat())
+        fields = (
+            stamp[1], feed, rec.id,
+            f"{feed}:{rec.route_id}" if rec.route_id else None,
+            f"{feed}:{rec.trip_id}" if rec.trip_id else None,
+            rec.lat, rec.lon, rec.speed, rec.heading, rec.shape_id, rec.shape_dist, rec.off_route,
+        )
+        out.append((stamp[0], "\t".join(_text(f) for f in fields)))
+    return out
+
+
+class PositionArchiver:
+    """Background COPY writer; `submit` is safe to call from any thread and never blocks."""
+
+    def __init__(self, connect=conn):
+        self._connect = connect
+        self._conn = None
+        self._queue: queue.Queue = queue.Queue(maxsize=ARCHIVE_QUEUE_POLLS)
+        self._partitions: set = set()
+        self._pruned_on = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def submit(self, feed: str, records) -> None:
+        if not ARCHIVE_POSITIONS or not records:
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="archive", daemon=True)
+                    self._thread.start()
+        # Formatting happens on the writer thread; records are not modified once projected
+        try:
+            self._queue.put_nowait((feed, list(records)))
+        except queue.Full:
+            ARCHIVE_DROPPED.inc(len(records))
+
+    def _take_batch(self) -> list[tuple]:
+        batch: list[tuple] = []
+        deadline = time.monotonic() + ARCHIVE_FLUSH_SECONDS
+        while len(batch) < ARCHIVE_BATCH_ROWS:
+            try:
+                feed, records = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                batch.extend(position_rows(feed, records))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        pending: list[tuple] = []
+        while True:
+            pending.extend(self._take_batch())
+            if not pending:
+                continue
+            try:
+                self.write(pending)
+                ARCHIVE_ROWS.inc(len(pending))
+                pending = []
+            except Exception as e:
+                print("archive write error:", e or type(e).__name__)
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                # Keep what fits in one batch and retry after a pause
+                if len(pending) > ARCHIVE_BATCH_ROWS:
+                    ARCHIVE_DROPPED.inc(len(pending) - ARCHIVE_BATCH_ROWS)
+                    pending = pending[-ARCHIVE_BATCH_ROWS:]
+                time.sleep(ARCHIVE_FLUSH_SECONDS)
+
+    def write(self, rows: list[tuple]) -> None:
+        if self._conn is None:
+            self._conn = self._connect()
+        new_days = {d for d, _ in rows} - self._partitions
+        with self._conn, self._conn.cursor() as cur:
+            for day in new_days:
+                cur.execute(PARTITION_SQL.format(name=partition_name(day), lo=day, hi=day + timedelta(days=1)))
+            buf = io.StringIO("\n".join(line for _, line in rows) + "\n")
+            cur.copy_expert(COPY_SQL, buf)
+            today = datetime.now(timezone.utc).date()
+            if self._pruned_on != today:
+                self._prune(cur, today - timedelta(days=ARCHIVE_RETENTION_DAYS))
+                self._pruned_on = today
+        # Only once committed: a rolled-back CREATE must be retried
+        self._partitions |= new_days
+
+    def _prune(self, cur, before) -> None:
+        cur.execute(PARTITIONS_SQL)
+        for r in cur.fetchall():
+            name = r["relname"]
+            try:
+                day = datetime.strptime(name.rsplit("_", 1)[1], "%Y%m%d").date()
+            except (IndexError, ValueError):
+                continue
+            if day < before:
+                cur.execute(f"DROP TABLE IF EXISTS {name}")
+                self._partitions.discard(day)
@@ -0,0 +1,12 @@
+import os
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+
+def pg_url():
+    raw = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/transit")
+    return raw.replace("postgresql+psycopg2://", "postgresql://").replace("postgres+psycopg2://", "postgres://")
+
+
+def conn():
+    return psycopg2.connect(pg_url(), cursor_factory=RealDictCursor)
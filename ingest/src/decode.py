@@ -0,0 +1,246 @@
+import time
+from google.transit import gtfs_realtime_pb2 as gtfs
+
+
+class VehicleRecord:
+    """One vehicle position; the compact form of the dicts the API serves."""
+
+    __slots__ = (
+        "id",
+        "route_id",
+        "lat",
+        "lon",
+        "speed",
+        "heading",
+        "ts",
+        "label",
+        "license_plate",
+        "trip_id",
+        "current_status",
+        "stop_id",
+        "current_stop_sequence",
+        "occupancy_status",
+        "occupancy_percentage",
+        # Filled in by projection.ProjectionEngine, not decoded from the feed
+        "shape_id",
+        "shape_dist",
+        "off_route",
+    )
+
+    def __init__(self, id, route_id, lat, lon, speed, heading, ts, label=None, license_plate=None,
+                 trip_id=None, current_status=None, stop_id=None, current_stop_sequence=None,
+                 occupancy_status=None, occupancy_percentage=None, shape_id=None, shape_dist=None, off_route=None):
+        self.id = id
+        self.route_id = route_id
+        self.lat = lat
+        self.lon = lon
+        self.speed = speed
+        self.heading = heading
+        self.ts = ts
+        self.label = label
+        self.license_plate = license_plate
+        self.trip_id = trip_id
+        self.current_status = current_status
+        self.stop_id = stop_id
+        self.current_stop_sequence = current_stop_sequence
+        self.occupancy_status = occupancy_status
+        self.occupancy_percentage = occupancy_percentage
+        self.shape_id = shape_id
+        self.shape_dist = shape_dist
+        self.off_route = off_route
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+DECODED_FIELDS = VehicleRecord.__slots__[:-3]
+
+
+def _record(v, vid: str, ts_fallback: int) -> VehicleRecord | None:
+    pos = v.position
+    lat = pos.latitude
+    lon = pos.longitude
+    if not lat or not lon:
+        return None
+    veh = v.vehicle
+    trip = v.trip
+    speed = pos.speed
+    bearing = pos.bearing
+    return VehicleRecord(
+        vid,
+        trip.route_id or "UNKNOWN",
+        float(lat),
+        float(lon),
+        float(speed) if speed else None,
+        int(bearing) if bearing else None,
+        int(v.timestamp) or ts_fallback,
+        veh.label,
+        veh.license_plate,
+        trip.trip_id,
+        int(v.current_status),
+        v.stop_id,
+        int(v.current_stop_sequence),
+        int(v.occupancy_status),
+        v.occupancy_percentage,
+    )
+
+
+def _read_varint(buf: bytes, i: int) -> tuple[int, int]:
+    shift = value = 0
+    while True:
+        b = buf[i]
+        i += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, i
+        shift += 7
+
+
+def _find_field(buf: bytes, field: int, wire_type: int):
+    """Value of the first occurrence of `field` in a serialized protobuf message, else None."""
+    i, n = 0, len(buf)
+    while i < n:
+        key, i = _read_varint(buf, i)
+        fno, wt = key >> 3, key & 7
+        if wt == 0:
+            value, i = _read_varint(buf, i)
+        elif wt == 2:
+            size, i = _read_varint(buf, i)
+            value, i = buf[i:i + size], i + size
+        elif wt == 1:
+            value, i = buf[i:i + 8], i + 8
+        elif wt == 5:
+            value, i = buf[i:i + 4], i + 4
+        else:
+            return None
+        if fno == field and wt == wire_type:
+            return value
+    return None
+
+
+def header_timestamp(raw: bytes) -> int | None:
+    """FeedMessage.header.timestamp read straight off the wire, without parsing the entities."""
+    try:
+        header = _find_field(raw, 1, 2)  # FeedMessage.header
+        if header is None:
+            return None
+        return _find_field(header, 3, 0) or None  # FeedHeader.timestamp
+    except IndexError:
+        return None
+
+
+def split_entities(raw: bytes) -> tuple[bytes, list[bytes]] | None:
+    """Split a FeedMessage into its header and per-entity wire chunks.
+
+    Returns None for anything but plain length-delimited top-level fields (e.g. extensions),
+    in which case callers should fall back to a full parse.
+    """
+    header = b""
+    entities = []
+    append = entities.append
+    i, n = 0, len(raw)
+    while i < n:
+        key = raw[i]
+        i += 1
+        if key & 0x80 or key & 7 != 2:
+            return None
+        b = raw[i]
+        i += 1
+        size = b & 0x7F
+        shift = 7
+        while b & 0x80:
+            b = raw[i]
+            i += 1
+            size |= (b & 0x7F) << shift
+            shift += 7
+        if key == 0x12:  # field 2: entity
+            append(raw[i:i + size])
+        elif key == 0x0A:  # field 1: header
+            header = raw[i:i + size]
+        i += size
+    return header, entities
+
+
+def _parse(raw: bytes):
+    feed = gtfs.FeedMessage()
+    feed.ParseFromString(raw)
+    ts_fallback = int(feed.header.timestamp) if feed.header.timestamp else int(time.time())
+    return feed, ts_fallback
+
+
+def decode_vehicles(raw: bytes) -> list[VehicleRecord]:
+    """Decode every vehicle in a VehiclePositions FeedMessage."""
+    feed, ts_fallback = _parse(raw)
+    out = []
+    for ent in feed.entity:
+        if not ent.HasField("vehicle"):
+            continue
+        v = ent.vehicle
+        rec = _record(v, v.vehicle.id or ent.id or f"veh_{len(out)}", ts_fallback)
+        if rec is not None:
+            out.append(rec)
+    return out
+
+
+class VehicleDecoder:
+    """Stateful decoder for one feed that skips entities unchanged since the previous payload.
+
+    The payload is split into per-entity wire chunks without parsing; a chunk that is
+    byte-identical to one from the previous payload reuses that record, so only moved
+    vehicles are parsed and built. `records` always holds the full current fleet.
+    """
+
+    def __init__(self):
+        self.records: dict[str, VehicleRecord] = {}
+        # entity wire bytes -> (record, whether its ts came from the header fallback)
+        self._by_wire: dict[bytes, tuple[VehicleRecord, bool]] = {}
+
+    def decode(self, raw: bytes) -> tuple[list[VehicleRecord], list[str]]:
+        """Returns (changed records, ids of vehicles no longer in the feed)."""
+        split = split_entities(raw)
+        if split is None:
+            return self._decode_full(raw)
+        header, chunks = split
+        ts_fallback = (_find_field(header, 3, 0) if header else None) or int(time.time())
+
+        prev = self._by_wire
+        by_wire: dict[bytes, tuple[VehicleRecord, bool]] = {}
+        records: dict[str, VehicleRecord] = {}
+        changed = []
+        for chunk in chunks:
+            hit = prev.get(chunk)
+            # Vehicles without their own timestamp inherit the header's, which still moves
+            if hit is not None and (not hit[1] or hit[0].ts == ts_fallback):
+                rec = hit[0]
+                by_wire[chunk] = hit
+                records[rec.id] = rec
+                continue
+            ent = gtfs.FeedEntity.FromString(chunk)
+            if not ent.HasField("vehicle"):
+                continue
+            v = ent.vehicle
+            rec = _record(v, v.vehicle.id or ent.id or f"veh_{len(records)}", ts_fallback)
+            if rec is None:
+                continue
+            by_wire[chunk] = (rec, not v.timestamp)
+            records[rec.id] = rec
+            changed.append(rec)
+        return self._commit(records, by_wire, changed)
+
+    def _decode_full(self, raw: bytes):
+        records = {}
+        changed = []
+        for rec in decode_vehicles(raw):
+            old = self.records.get(rec.id)
+            if old is None or any(getattr(old, k) != getattr(rec, k) for k in DECODED_FIELDS):
+                changed.append(rec)
+            else:
+                rec = old
+            records[rec.id] = rec
+        return self._commit(records, {}, changed)
+
+    def _commit(self, records, by_wire, changed):
+        removed = [vid for vid in self.records if vid not in records]
+        self.records = records
+        self._by_wire = by_wire
+        return changed, removed
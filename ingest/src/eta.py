@@ -0,0 +1,290 @@
+"""Per-stop arrival predictions from GTFS-RT TripUpdates, schedule and vehicle positions.
+
+Each cycle a feed's latest TripUpdates are merged with the trips' scheduled stop times
+(`stop_departures`). Delays propagate downstream until the next explicit update, as
+the GTFS-RT spec describes. Trips with a vehicle but no update fall back to
+`baseline_eta` from the vehicle's distance to its upcoming stops.
+
+Predictions land in one sorted set per stop, `trip_eta:{stop_id}`, scored by the
+predicted epoch. Members are compact JSON arrays `[trip_id, route_id, vehicle_id,
+delay, source]`, so a board reads its next arrivals with one ZRANGEBYSCORE.
+"""
+
+import json, math, os, time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import psycopg2
+from google.transit import gtfs_realtime_pb2 as gtfs
+from .db import conn
+
+AGENCY_TZ = ZoneInfo(os.getenv("AGENCY_TZ") or os.getenv("TZ") or "America/New_York")
+# Upcoming stops predicted from a vehicle position when its trip has no update
+ETA_FALLBACK_STOPS = int(os.getenv("ETA_FALLBACK_STOPS", "10"))
+# Straight-line distance between stops under-counts the street path
+ETA_DETOUR_FACTOR = float(os.getenv("ETA_DETOUR_FACTOR", "1.3"))
+# Predictions this far in the past are dropped (a bus "due" a minute ago is still useful)
+ETA_GRACE_SECONDS = 60
+
+EARTH_RADIUS_M = 6_371_008.8
+
+SKIPPED = gtfs.TripUpdate.StopTimeUpdate.SKIPPED
+NO_DATA = gtfs.TripUpdate.StopTimeUpdate.NO_DATA
+CANCELED = gtfs.TripDescriptor.CANCELED
+
+SCHEDULE_SQL = """
+  SELECT d.trip_id, d.stop_id, d.stop_sequence, d.arrival_secs, d.departure_secs,
+         ST_X(s.geom) AS lon, ST_Y(s.geom) AS lat
+  FROM stop_departures d JOIN stops s ON s.stop_id = d.stop_id
+  WHERE d.trip_id = ANY(%s)
+  ORDER BY d.trip_id, d.stop_sequence
+"""
+
+
+class StopTime:
+    __slots__ = ("stop_id", "stop_sequence", "secs", "lon", "lat")
+
+    def __init__(self, stop_id, stop_sequence, secs, lon, lat):
+        self.stop_id = stop_id
+        self.stop_sequence = stop_sequence
+        self.secs = secs
+        self.lon = lon
+        self.lat = lat
+
+
+class StopUpdate:
+    __slots__ = ("stop_sequence", "stop_id", "time", "delay", "skipped")
+
+    def __init__(self, stop_sequence, stop_id, time, delay, skipped):
+        self.stop_sequence = stop_sequence
+        self.stop_id = stop_id
+        self.time = time
+        self.delay = delay
+        self.skipped = skipped
+
+
+class TripUpdateRecord:
+    __slots__ = ("trip_id", "route_id", "start_date", "vehicle_id", "canceled", "updates")
+
+    def __init__(self, trip_id, route_id, start_date, vehicle_id, canceled, updates):
+        self.trip_id = trip_id
+        self.route_id = route_id
+        self.start_date = start_date
+        self.vehicle_id = vehicle_id
+        self.canceled = canceled
+        self.updates = updates
+
+
+def baseline_eta(vehicle_speed_mps: float, remaining_meters: float, scheduled_epoch: int | None, now_epoch: int) -> dict:
+    """Same estimate as api/app/services/eta.baseline_eta (ingest does not import the API)."""
+    speed = max(5 / 3.6, min(vehicle_speed_mps or 0, 22))
+    naive = now_epoch + int(remaining_meters / max(speed, 0.1))
+    if scheduled_epoch:
+        return {"eta": max(naive, scheduled_epoch), "uncertainty": 60}
+    return {"eta": naive, "uncertainty": 90}
+
+
+def haversine_m(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def service_day_start(day: date, tz: ZoneInfo = AGENCY_TZ) -> int:
+    """Epoch of "noon minus 12h" on `day`, the origin GTFS stop times count from."""
+    noon = datetime.combine(day, dtime(12), tz).astimezone(timezone.utc)
+    return int((noon - timedelta(hours=12)).timestamp())
+
+
+def _time_event(ev) -> tuple[int | None, int | None]:
+    return (ev.time or None, ev.delay if ev.HasField("delay") else None)
+
+
+def decode_trip_updates(raw: bytes, feed: str) -> list[TripUpdateRecord]:
+    """Decode a TripUpdates feed, prefixing IDs with `{feed}:` to match the static tables."""
+    msg = gtfs.FeedMessage()
+    msg.ParseFromString(raw)
+    out = []
+    for ent in msg.entity:
+        if not ent.HasField("trip_update"):
+            continue
+        tu = ent.trip_update
+        trip = tu.trip
+        if not trip.trip_id:
+            continue
+        updates = []
+        for stu in tu.stop_time_update:
+            if stu.schedule_relationship == NO_DATA:
+                continue
+            # Arrival wins; a departure-only update (e.g. the first stop) is used as is
+            t, d = _time_event(stu.arrival) if stu.HasField("arrival") else (None, None)
+            if t is None and d is None and stu.HasField("departure"):
+                t, d = _time_event(stu.departure)
+            updates.append(StopUpdate(
+                stu.stop_sequence if stu.HasField("stop_sequence") else None,
+                f"{feed}:{stu.stop_id}" if stu.stop_id else None,
+                t,
+                d,
+                stu.schedule_relationship == SKIPPED,
+            ))
+        out.append(TripUpdateRecord(
+            f"{feed}:{trip.trip_id}",
+            f"{feed}:{trip.route_id}" if trip.route_id else None,
+            trip.start_date or None,
+            tu.vehicle.id or None,
+            trip.schedule_relationship == CANCELED,
+            updates,
+        ))
+    return out
+
+
+def pick_service_day(stops: list[StopTime], now: int, start_date: str | None = None) -> int:
+    """Service day origin for a trip: the feed's start_date, else today or yesterday,
+    whichever puts the trip's scheduled span closest to `now`."""
+    if start_date:
+        return service_day_start(datetime.strptime(start_date, "%Y%m%d").date())
+    today = datetime.fromtimestamp(now, AGENCY_TZ).date()
+    starts = [service_day_start(today), service_day_start(today - timedelta(days=1))]
+    if not stops:
+        return starts[0]
+    lo, hi = stops[0].secs, stops[-1].secs
+
+    def gap(base):
+        return max(base + lo - now, now - base - hi, 0)
+
+    return min(starts, key=gap)
+
+
+def predict_trip(tu: TripUpdateRecord, stops: list[StopTime], now: int) -> list[tuple[str, int, int | None]]:
+    """(stop_id, eta, delay) for each stop of a trip from its first update onwards.
+
+    A stop with an explicit time or delay sets the trip's delay; stops after it reuse
+    that delay until the next update. Skipped stops get no prediction.
+    """
+    if tu.canceled:
+        return []
+    if not stops:
+        # Unknown (e.g. added) trip: only absolute times are usable
+        return [(u.stop_id, u.time, None) for u in tu.updates if u.stop_id and u.time and not u.skipped and u.time >= now - ETA_GRACE_SECONDS]
+    by_seq = {u.stop_sequence: u for u in tu.updates if u.stop_sequence is not None}
+    by_stop = {u.stop_id: u for u in tu.updates if u.stop_sequence is None and u.stop_id}
+    base = pick_service_day(stops, now, tu.start_date)
+    out = []
+    delay = None
+    for st in stops:
+        sched = base + st.secs
+        u = by_seq.get(st.stop_sequence) or by_stop.get(st.stop_id)
+        if u is not None:
+            if u.skipped:
+                continue
+            if u.time is not None:
+                delay = u.time - sched
+            elif u.delay is not None:
+                delay = u.delay
+        if delay is None:
+            continue
+        eta = sched + delay
+        if eta >= now - ETA_GRACE_SECONDS:
+            out.append((st.stop_id, eta, delay))
+    return out
+
+
+def predict_from_vehicle(v, stops: list[StopTime], now: int, max_stops: int = ETA_FALLBACK_STOPS,
+                         feed: str | None = None) -> list[tuple[str, int, int | None]]:
+    """(stop_id, eta, delay) for a vehicle's next stops by distance and speed.
+
+    Schedule stop IDs are feed-prefixed while the vehicle's stop_id is as the feed sent
+    it, so `feed` is needed to match the two.
+    """
+    if not stops:
+        return []
+    start = None
+    if v.current_stop_sequence:
+        start = next((i for i, st in enumerate(stops) if st.stop_sequence >= v.current_stop_sequence), None)
+    if start is None and v.stop_id:
+        stop_id = f"{feed}:{v.stop_id}" if feed else v.stop_id
+        start = next((i for i, st in enumerate(stops) if st.stop_id == stop_id), None)
+    if start is None:
+        start = min(range(len(stops)), key=lambda i: haversine_m(v.lon, v.lat, stops[i].lon, stops[i].lat))
+    base = pick_service_day(stops, now)
+    out = []
+    remaining = 0.0
+    lon, lat = v.lon, v.lat
+    for st in stops[start:start + max_stops]:
+        remaining += haversine_m(lon, lat, st.lon, st.lat) * ETA_DETOUR_FACTOR
+        lon, lat = st.lon, st.lat
+        sched = base + st.secs
+        eta = baseline_eta(v.speed, remaining, sched, now)["eta"]
+        out.append((st.stop_id, eta, eta - sched))
+    return out
+
+
+class ScheduleCache:
+    """Scheduled stop times per trip, loaded on first use and dropped on a new seed or
+    service day, so it only ever holds about one day's trips.
+
+    Without a database (no static GTFS seeded) trips come back empty and only the
+    absolute times in TripUpdates are used.
+    """
+
+    def __init__(self, connect=conn):
+        self._connect = connect
+        self._conn = None
+        self._trips: dict[str, list[StopTime]] = {}
+        self._seed = None
+        self._day = None
+
+    def reset(self, seed, now: float | None = None):
+        day = datetime.fromtimestamp(now or time.time(), AGENCY_TZ).date()
+        if seed != self._seed or day != self._day:
+            self._trips.clear()
+            self._seed = seed
+            self._day = day
+
+    def _load(self, trip_ids: list[str]) -> dict[str, list[StopTime]]:
+        loaded: dict[str, list[StopTime]] = {t: [] for t in trip_ids}
+        if self._conn is None:
+            self._conn = self._connect()
+        with self._conn, self._conn.cursor() as cur:
+            cur.execute(SCHEDULE_SQL, (trip_ids,))
+            for r in cur.fetchall():
+                secs = r["arrival_secs"] if r["arrival_secs"] is not None else r["departure_secs"]
+                loaded[r["trip_id"]].append(StopTime(r["stop_id"], r["stop_sequence"], secs, r["lon"], r["lat"]))
+        return loaded
+
+    def get(self, trip_ids) -> dict[str, list[StopTime]]:
+        trip_ids = set(trip_ids)
+        missing = [t for t in trip_ids if t not in self._trips]
+        if missing:
+            try:
+                self._trips.update(self._load(missing))
+            except psycopg2.Error as e:
+                print("eta schedule lookup error:", e or type(e).__name__)
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                return {t: self._trips.get(t, []) for t in trip_ids}
+        return {t: self._trips[t] for t in trip_ids}
+
+
+def build_predictions(feed: str, trip_updates: list[TripUpdateRecord], vehicles, schedule: ScheduleCache,
+                      now: int | None = None) -> dict[str, list[tuple[int, str]]]:
+    """stop_id -> [(eta, member)] for every trip with an update or a tracked vehicle."""
+    now = int(now or time.time())
+    by_trip = {f"{feed}:{v.trip_id}": v for v in vehicles if v.trip_id}
+    updated = {tu.trip_id for tu in trip_updates}
+    trips = schedule.get(updated | by_trip.keys())
+    out: dict[str, list[tuple[int, str]]] = {}
+
+    def add(trip_id, route_id, vehicle_id, preds, source):
+        for stop_id, eta, delay in preds:
+            member = json.dumps([trip_id, route_id, vehicle_id, delay, source], separators=(",", ":"))
+            out.setdefault(stop_id, []).append((eta, member))
+
+    for tu in trip_updates:
+        v = by_trip.get(tu.trip_id)
+        route = tu.route_id or (f"{feed}:{v.route_id}" if v else None)
+        add(tu.trip_id, route, tu.vehicle_id or (v.id if v else None), predict_trip(tu, trips[tu.trip_id], now), "rt")
+    for trip_id, v in by_trip.items():
+        if trip_id not in updated:
+            add(trip_id, f"{feed}:{v.route_id}", v.id, predict_from_vehicle(v, trips[trip_id], now, feed=feed), "vehicle")
+    return out
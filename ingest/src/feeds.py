@@ -1,4 +1,11 @@
-import os, requests, socket
+import asyncio, contextlib, hashlib, os, socket, time
+from urllib.parse import urlparse
+from urllib.request import getproxies, proxy_bypass
+
+import httpcore
+import httpx
+
+from .decode import header_timestamp
 
 VEH_FEED = os.getenv("GTFS_RT_VEHICLES_URL")
 TRIP_FEED = os.getenv("GTFS_RT_TRIP_UPDATES_URL")
@@ -6,6 +13,17 @@ ALERTS_FEED = os.getenv("GTFS_RT_ALERTS_URL")
 
 SWIFTLY_API_KEY = os.getenv("SWIFTLY_API_KEY")
 
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "10"))
+DNS_TTL_SECONDS = float(os.getenv("DNS_TTL_SECONDS", "300"))
+
+# Returned by fetch_bytes when the payload is the same as the previous fetch of that URL
+UNCHANGED = object()
+
+# One long-lived client per host so HTTP/2 connections are kept alive across polls
+_clients: dict[str, httpx.AsyncClient] = {}
+# url -> {"etag", "last_modified", "digest", "header_ts"} from the previous successful fetch
+_last: dict[str, dict] = {}
+
 
 def _headers_for(url: str | None, extra: dict | None = None):
     # Prefer header-based auth for Swiftly if key is provided
@@ -34,27 +52,188 @@ def _headers_for(url: str | None, extra: dict | None = None):
     return headers
 
 
-def fetch_bytes(url: str | None, headers: dict | None = None):
+class _CachedDNSBackend(httpcore.AsyncNetworkBackend):
+    """Network backend that resolves each host once per DNS_TTL_SECONDS.
+
+    TLS still uses the original hostname for SNI and certificate checks; only the
+    TCP connect target is swapped for the cached address.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend):
+        self._backend = backend
+        self._cache: dict[tuple[str, int], tuple[str, float]] = {}
+
+    async def _resolve(self, host: str, port: int) -> str:
+        hit = self._cache.get((host, port))
+        if hit and hit[1] > time.monotonic():
+            return hit[0]
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+        addr = infos[0][4][0]
+        self._cache[(host, port)] = (addr, time.monotonic() + DNS_TTL_SECONDS)
+        return addr
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addr = await self._resolve(host, port)
+        try:
+            return await self._backend.connect_tcp(
+                addr, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+            )
+        except Exception:
+            # Address may have moved; resolve again on the next connect
+            self._cache.pop((host, port), None)
+            raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+@contextlib.contextmanager
+def _httpx_errors(request: httpx.Request):
+    # httpx mirrors httpcore's exception names (ConnectTimeout, ReadError, ...)
+    try:
+        yield
+    except Exception as e:
+        if not type(e).__module__.startswith("httpcore"):
+            raise
+        cls = next((getattr(httpx, c.__name__) for c in type(e).__mro__ if hasattr(httpx, c.__name__)), None)
+        if cls is None or not issubclass(cls, httpx.TransportError):
+            cls = httpx.TransportError
+        raise cls(str(e), request=request) from e
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream, request: httpx.Request):
+        self._stream = stream
+        self._request = request
+
+    async def __aiter__(self):
+        with _httpx_errors(self._request):
+            async for chunk in self._stream:
+                yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class _PoolTransport(httpx.AsyncBaseTransport):
+    """httpx transport over an httpcore pool we build ourselves, so the pool can use the
+    DNS-caching backend through httpcore's public `network_backend` argument."""
+
+    def __init__(self, http2: bool = True, max_connections: int = 8, max_keepalive_connections: int = 4,
+                 keepalive_expiry: float = 120):
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=_CachedDNSBackend(httpcore.AnyIOBackend()),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        req = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _httpx_errors(request):
+            resp = await self._pool.handle_async_request(req)
+        return httpx.Response(
+            status_code=resp.status,
+            headers=resp.headers,
+            stream=_ResponseStream(resp.stream, request),
+            extensions=resp.extensions,
+        )
+
+    async def aclose(self):
+        await self._pool.aclose()
+
+
+def _proxied(url: str) -> bool:
+    """Whether HTTP(S)_PROXY/ALL_PROXY cover `url` and NO_PROXY does not exempt it."""
+    parts = urlparse(url)
+    proxies = getproxies()
+    return bool(proxies.get(parts.scheme) or proxies.get("all")) and not proxy_bypass(parts.hostname or "")
+
+
+def client_for(url: str) -> httpx.AsyncClient:
+    host = urlparse(url).netloc
+    client = _clients.get(host)
+    if client is None:
+        if _proxied(url):
+            # Behind an egress proxy: httpx's own transports honour the proxy variables, and
+            # DNS is the proxy's business, so the resolver cache has nothing to do
+            client = httpx.AsyncClient(
+                http2=True,
+                trust_env=True,
+                limits=httpx.Limits(max_connections=8, max_keepalive_connections=4, keepalive_expiry=120),
+                timeout=FETCH_TIMEOUT_SECONDS,
+            )
+        else:
+            client = httpx.AsyncClient(transport=_PoolTransport(), timeout=FETCH_TIMEOUT_SECONDS)
+        _clients[host] = client
+    return client
+
+
+async def fetch_bytes(url: str | None, headers: dict | None = None):
+    """GET a feed; returns the body, None when no URL is configured, or UNCHANGED.
+
+    UNCHANGED covers a 304, an identical body and an unchanged FeedHeader.timestamp,
+    so callers can skip parsing and writes entirely.
+    """
     if not url:
         return None
-    
-    # Pre-resolve DNS
-    try:
-        from urllib.parse import urlparse
-        parsed = urlparse(url)
-        hostname = parsed.hostname
-        if hostname:
-            ip = socket.gethostbyname(hostname)
-            print(f"DNS resolution for {hostname}: {ip}")
-    except Exception as dns_error:
-        print(f"DNS pre-resolution error for {url}: {dns_error}")
-        # Continue, let requests handle it
-    
-    # Create a new session for each request to avoid connection pool issues
-    session = requests.Session()
-    try:
-        resp = session.get(url, headers=_headers_for(url, headers), timeout=10)
-        resp.raise_for_status()
-        return resp.content
-    finally:
-        session.close()
+    prev = _last.get(url) or {}
+    req_headers = _headers_for(url, headers)
+    if prev.get("etag"):
+        req_headers["If-None-Match"] = prev["etag"]
+    if prev.get("last_modified"):
+        req_headers["If-Modified-Since"] = prev["last_modified"]
+
+    resp = await client_for(url).get(url, headers=req_headers)
+    if resp.status_code == 304:
+        return UNCHANGED
+    resp.raise_for_status()
+    raw = resp.content
+
+    digest = hashlib.blake2b(raw, digest_size=16).digest()
+    header_ts = header_timestamp(raw)
+    _last[url] = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "digest": digest,
+        "header_ts": header_ts,
+    }
+    if digest == prev.get("digest") or (header_ts and header_ts == prev.get("header_ts")):
+        return UNCHANGED
+    return raw
+
+
+def last_header_timestamp(url: str | None) -> int | None:
+    """FeedHeader.timestamp of the last body fetched from `url`, if it had one."""
+    return (_last.get(url) or {}).get("header_ts")
+
+
+def forget(url: str | None):
+    """Drop cached validators so the next fetch of `url` is processed even if unchanged."""
+    _last.pop(url, None)
+
+
+async def close_clients():
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
@@ -0,0 +1,166 @@
+"""Per-minute vehicle position history for replay.
+
+Every REPLAY_FRAME_SECONDS the whole fleet is captured as a frame. When the minute
+rolls over, its frames are encoded into one blob and stored in Redis as
+`positions:minute:{YYYYMMDDHHmm}` (UTC) for REPLAY_REDIS_HOURS, and in the
+`position_minutes` table for REPLAY_RETENTION_DAYS.
+
+Blob format (version 1), zstd-compressed:
+
+    <u4 header length> <JSON header> <columns>
+
+The header holds the minute's epoch, the vehicle members ("feed:id") and routes seen
+in it, and per frame the second offset and vehicle count. Columns cover all frames
+back to back, column by column: vehicle index deltas (<i4, ascending within a frame),
+lat and lon in 1e-6 degrees as deltas from the vehicle's previous value in the minute
+(<i4, starting from 0), heading in degrees and speed in cm/s (<i2, -1 if unknown).
+Consecutive frames mostly repeat small deltas, which zstd packs tightly. Each minute
+decodes on its own, so a reader only decompresses the minutes it was asked for.
+
+api/app/services/replay.py decodes the same format.
+"""
+
+import json, os, struct, time
+from datetime import datetime, timezone
+import numpy as np
+import psycopg2
+import zstandard
+from .db import conn
+
+REPLAY_FRAME_SECONDS = float(os.getenv("REPLAY_FRAME_SECONDS", "6"))
+REPLAY_REDIS_HOURS = float(os.getenv("REPLAY_REDIS_HOURS", "6"))
+REPLAY_RETENTION_DAYS = float(os.getenv("REPLAY_RETENTION_DAYS", "7"))
+REPLAY_ZSTD_LEVEL = int(os.getenv("REPLAY_ZSTD_LEVEL", "10"))
+
+FORMAT_VERSION = 1
+COORD_SCALE = 1_000_000
+
+ARCHIVE_SQL = """
+  INSERT INTO position_minutes (minute, frames, vehicles, blob)
+  VALUES (to_timestamp(%s), %s, %s, %s)
+  ON CONFLICT (minute) DO UPDATE SET frames = EXCLUDED.frames, vehicles = EXCLUDED.vehicles, blob = EXCLUDED.blob
+"""
+PRUNE_SQL = "DELETE FROM position_minutes WHERE minute < now() - make_interval(secs => %s)"
+
+
+def minute_key(minute: int) -> str:
+    return "positions:minute:" + datetime.fromtimestamp(minute, timezone.utc).strftime("%Y%m%d%H%M")
+
+
+def _int(values, scale: float) -> np.ndarray:
+    return np.array([-1 if v is None else int(round(v * scale)) for v in values], dtype=np.int64)
+
+
+def encode_minute(minute: int, frames: list[tuple[int, list]], level: int = REPLAY_ZSTD_LEVEL) -> bytes:
+    """frames: (epoch seconds, [(member, route_id, lat, lon, heading, speed)]) in time order."""
+    index: dict[str, int] = {}
+    routes: list[str | None] = []
+    for _, rows in frames:
+        for member, route, *_ in rows:
+            i = index.setdefault(member, len(index))
+            if i == len(routes):
+                routes.append(route)
+            else:
+                routes[i] = route
+    last_lat = np.zeros(len(index), dtype=np.int64)
+    last_lon = np.zeros(len(index), dtype=np.int64)
+    cols: list[list[np.ndarray]] = [[], [], [], [], []]
+    offsets, counts = [], []
+    for ts, rows in frames:
+        rows = sorted(rows, key=lambda r: index[r[0]])
+        ix = np.array([index[r[0]] for r in rows], dtype=np.int64)
+        lat = _int((r[2] for r in rows), COORD_SCALE)
+        lon = _int((r[3] for r in rows), COORD_SCALE)
+        cols[0].append(np.diff(ix, prepend=-1))
+        cols[1].append(lat - last_lat[ix])
+        cols[2].append(lon - last_lon[ix])
+        cols[3].append(_int((r[4] for r in rows), 1))
+        cols[4].append(_int((r[5] for r in rows), 100))
+        last_lat[ix], last_lon[ix] = lat, lon
+        offsets.append(int(ts - minute))
+        counts.append(len(rows))
+    header = json.dumps({"v": FORMAT_VERSION, "minute": minute, "ids": list(index), "routes": routes,
+                         "ts": offsets, "n": counts}, separators=(",", ":")).encode()
+    body = [np.concatenate(c or [np.zeros(0, dtype=np.int64)]).astype(dt).tobytes()
+            for c, dt in zip(cols, ("<i4", "<i4", "<i4", "<i2", "<i2"))]
+    return zstandard.ZstdCompressor(level=level).compress(struct.pack("<I", len(header)) + header + b"".join(body))
+
+
+def decode_minute(blob: bytes) -> list[tuple[int, list[tuple]]]:
+    """Inverse of encode_minute: [(epoch, [(member, route_id, lat, lon, heading, speed)])]."""
+    raw = zstandard.ZstdDecompressor().decompress(blob)
+    (hlen,) = struct.unpack_from("<I", raw)
+    head = json.loads(raw[4:4 + hlen])
+    total = sum(head["n"])
+    pos = 4 + hlen
+    cols = []
+    for dt in ("<i4", "<i4", "<i4", "<i2", "<i2"):
+        arr = np.frombuffer(raw, dtype=dt, count=total, offset=pos).astype(np.int64)
+        pos += arr.size * np.dtype(dt).itemsize
+        cols.append(arr)
+    ids, routes = head["ids"], head["routes"]
+    last_lat = np.zeros(len(ids), dtype=np.int64)
+    last_lon = np.zeros(len(ids), dtype=np.int64)
+    out = []
+    start = 0
+    for off, n in zip(head["ts"], head["n"]):
+        sl = slice(start, start + n)
+        start += n
+        ix = np.cumsum(cols[0][sl]) - 1
+        last_lat[ix] += cols[1][sl]
+        last_lon[ix] += cols[2][sl]
+        rows = [
+            (ids[i], routes[i], la / COORD_SCALE, lo / COORD_SCALE, None if h < 0 else h, None if s < 0 else s / 100)
+            for i, la, lo, h, s in zip(ix.tolist(), last_lat[ix].tolist(), last_lon[ix].tolist(),
+                                       cols[3][sl].tolist(), cols[4][sl].tolist())
+        ]
+        out.append((head["minute"] + off, rows))
+    return out
+
+
+class MinuteRecorder:
+    """Buffers frames for the current minute and hands back the previous one when it closes."""
+
+    def __init__(self):
+        self.minute: int | None = None
+        self.frames: list[tuple[int, list]] = []
+
+    def add(self, ts: float, rows: list) -> tuple[int, list] | None:
+        ts = int(ts)
+        minute = ts - ts % 60
+        closed = None
+        if self.minute is not None and minute != self.minute and self.frames:
+            closed = (self.minute, self.frames)
+            self.frames = []
+        self.minute = minute
+        self.frames.append((ts, rows))
+        return closed
+
+
+class MinuteArchive:
+    """Writes closed minutes to Redis and Postgres, pruning the table about hourly."""
+
+    def __init__(self, redis_client, connect=conn):
+        self.r = redis_client
+        self._connect = connect
+        self._conn = None
+        self._pruned_at = 0.0
+
+    def store(self, minute: int, frames: list) -> bytes:
+        blob = encode_minute(minute, frames)
+        self.r.set(minute_key(minute), blob, ex=int(REPLAY_REDIS_HOURS * 3600))
+        vehicles = len({m for _, rows in frames for m, *_ in rows})
+        try:
+            if self._conn is None:
+                self._conn = self._connect()
+            with self._conn, self._conn.cursor() as cur:
+                cur.execute(ARCHIVE_SQL, (minute, len(frames), vehicles, psycopg2.Binary(blob)))
+                if time.monotonic() - self._pruned_at > 3600:
+                    cur.execute(PRUNE_SQL, (REPLAY_RETENTION_DAYS * 86400,))
+                    self._pruned_at = time.monotonic()
+        except psycopg2.Error as e:
+            print("replay archive error:", e or type(e).__name__)
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        return blob
@@ -0,0 +1,508 @@
+"""Static GTFS loader: streams each feed's zip into Postgres and applies what changed atomically.
+
+Run inside the ingest container (`make seed` does this):
+
+    python -m src.load_gtfs [--schema FILE|-] [--zip key=path ...] [--workers N]
+
+Feeds come from GTFS_STATIC_SOURCES (`key=url,...`) or GTFS_STATIC_URL (key `default`),
+or from local zips given with --zip, which also makes the loader usable offline for
+benchmarks. All IDs are prefixed with `key:`.
+
+Loads are incremental: the archive and each member are fingerprinted in `gtfs_files`, only
+members that changed are staged, and only rows that differ are inserted, updated or
+deleted. Changed route and shape IDs are added to Redis sets for `make streets`.
+"""
+import argparse, csv, hashlib, io, os, sys, tempfile, time, zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import redis
+import requests
+
+from .db import conn
+
+SEED_WORKERS = int(os.getenv("SEED_WORKERS", "4"))
+SEED_VERSION_KEY = "gtfs:seed_version"
+# Set of prefixed route IDs changed by seeds since the last `make streets` with MATCH_CHANGED
+CHANGED_ROUTES_KEY = "gtfs:changed_routes"
+# gtfs_files row holding the fingerprint of the whole archive
+ZIP_NAME = "*.zip"
+
+# Loaded through header-driven staging tables; shapes are built in Python instead
+STAGED_FILES = ("stops", "routes", "calendar", "calendar_dates", "trips", "stop_times")
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def parse_sources(multi: str | None, single: str | None) -> dict[str, str]:
+    """key -> zip URL or path from GTFS_STATIC_SOURCES / GTFS_STATIC_URL style values."""
+    sources: dict[str, str] = {}
+    for part in (multi or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        key, _, url = part.partition("=")
+        if not key.strip() or not url.strip():
+            print(f"[seed] skipping invalid source entry: {part}")
+            continue
+        sources[key.strip()] = url.strip()
+    if not sources and single and single != "<PUT_STATIC_GTFS_ZIP_URL_HERE>":
+        sources["default"] = single
+    return sources
+
+
+class CleanLines(io.TextIOBase):
+    """Text stream over a zip member for COPY: BOM dropped, blank records skipped and
+    record ends normalized to LF. Text inside quoted fields (multi-line stop_desc and
+    the like, blank lines included) is passed through untouched.
+    """
+
+    def __init__(self, raw):
+        self._lines = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+        self._buf = ""
+        self._quoted = False  # inside a quoted field that continues past a line end
+
+    def readable(self):
+        return True
+
+    def _next(self) -> str:
+        for line in self._lines:
+            if not self._quoted and not line.strip():
+                continue
+            # Doubled quotes inside a field cancel out, so parity tracks the state
+            self._quoted ^= line.count('"') % 2 == 1
+            if not self._quoted:
+                line = line.rstrip("\r\n") + "\n"
+            return line
+        return ""
+
+    def readline(self, size=-1):
+        if self._buf:
+            line, sep, self._buf = self._buf.partition("\n")
+            return line + sep
+        return self._next()
+
+    def read(self, size=-1):
+        chunks = [self._buf]
+        n = len(self._buf)
+        while size < 0 or n < size:
+            line = self._next()
+            if not line:
+                break
+            chunks.append(line)
+            n += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            self._buf = ""
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+def header_columns(line: str) -> list[str]:
+    return [c.strip().lower().replace('"', "") for c in next(csv.reader([line]))]
+
+
+def stage_csv(cur, stream: CleanLines, name: str) -> set[str]:
+    """COPY one GTFS file into a TEXT temp table shaped by its own header; returns its columns."""
+    cols = header_columns(stream.readline())
+    ddl = ", ".join(f'"{c}" TEXT' for c in cols)
+    cur.execute(f"CREATE TEMP TABLE stg_{name}({ddl}) ON COMMIT DROP")
+    cur.copy_expert(f"COPY stg_{name} FROM STDIN WITH (FORMAT csv)", stream)
+    return set(cols)
+
+
+def shape_rows(stream):
+    """(shape_id, EWKT LineString) per shape from shapes.txt lines, in one pass."""
+    reader = csv.reader(stream)
+    cols = [c.strip().lower() for c in next(reader)]
+    i_id, i_lat, i_lon, i_seq = (cols.index(c) for c in ("shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"))
+    shapes: dict[str, list[tuple[int, float, float]]] = {}
+    for row in reader:
+        try:
+            pt = (int(row[i_seq]), float(row[i_lon]), float(row[i_lat]))
+        except (ValueError, IndexError):
+            continue
+        shapes.setdefault(row[i_id], []).append(pt)
+    for sid, pts in shapes.items():
+        if len(pts) < 2:
+            continue
+        pts.sort()
+        yield sid, "SRID=4326;LINESTRING(" + ",".join(f"{lon!r} {lat!r}" for _, lon, lat in pts) + ")"
+
+
+def stage_shapes(cur, stream: CleanLines) -> int:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    n = 0
+    for row in shape_rows(stream):
+        w.writerow(row)
+        n += 1
+    buf.seek(0)
+    cur.execute("CREATE TEMP TABLE stg_shapes(shape_id TEXT, geom TEXT) ON COMMIT DROP")
+    cur.copy_expert("COPY stg_shapes FROM STDIN WITH (FORMAT csv)", buf)
+    return n
+
+
+def _col(cols: set[str], name: str, cast: str | None = None) -> str:
+    """Expression for an optional staging column; only known GTFS names are passed in."""
+    if name not in cols:
+        return "NULL"
+    expr = f"NULLIF(s.{name}, '')"
+    return f"{expr}::{cast}" if cast else expr
+
+
+# table -> (primary key, other columns); parents before children
+TABLES = {
+    "stops": (("stop_id",), ("name", "lat", "lon", "geom")),
+    "routes": (("route_id",), ("short_name", "long_name", "color", "text_color", "type")),
+    "shapes": (("shape_id",), ("geom",)),
+    "calendar": (("service_id",), WEEKDAYS + ("start_date", "end_date")),
+    "calendar_dates": (("service_id", "date"), ("exception_type",)),
+    "trips": (("trip_id",), ("route_id", "service_id", "direction_id", "shape_id", "headsign")),
+    "stop_times": (("trip_id", "stop_sequence"), ("arrival_time", "departure_time", "stop_id")),
+}
+
+# Rows of a parent are only deleted once nothing references them any more
+DELETE_GUARDS = {
+    "routes": "NOT EXISTS (SELECT 1 FROM trips t WHERE t.route_id = x.route_id)",
+    "stops": "NOT EXISTS (SELECT 1 FROM stop_times st WHERE st.stop_id = x.stop_id)",
+}
+
+# Children are only inserted when their parents exist
+UPSERT_FILTERS = {
+    "trips": "WHERE EXISTS (SELECT 1 FROM routes r WHERE r.route_id = n.route_id)",
+    "stop_times": (
+        "WHERE EXISTS (SELECT 1 FROM trips t WHERE t.trip_id = n.trip_id)"
+        " AND EXISTS (SELECT 1 FROM stops st WHERE st.stop_id = n.stop_id)"
+    ),
+}
+
+
+def source_sql(table: str, c: set[str]) -> str:
+    """The feed's new rows for `table`, shaped like the table, with IDs prefixed by %(p)s."""
+    if table == "stops":
+        return f"""
+          SELECT DISTINCT ON (stop_id) stop_id, name, lat, lon, ST_SetSRID(ST_MakePoint(lon, lat), 4326) AS geom
+          FROM (
+            SELECT %(p)s || s.stop_id AS stop_id, {_col(c, 'stop_name')} AS name,
+                   {_col(c, 'stop_lat', 'float8')} AS lat, {_col(c, 'stop_lon', 'float8')} AS lon
+            FROM stg_stops s
+          ) s"""
+    if table == "routes":
+        return f"""
+          SELECT DISTINCT ON (1) %(p)s || s.route_id AS route_id,
+                 COALESCE({_col(c, 'route_short_name')}, s.route_id) AS short_name,
+                 {_col(c, 'route_long_name')} AS long_name, {_col(c, 'route_color')} AS color,
+                 {_col(c, 'route_text_color')} AS text_color, {_col(c, 'route_type', 'int')} AS type
+          FROM stg_routes s"""
+    if table == "shapes":
+        return "SELECT DISTINCT ON (1) %(p)s || shape_id AS shape_id, geom::geometry AS geom FROM stg_shapes"
+    if table == "calendar":
+        days = ", ".join(f"trim({_col(c, d)}) = '1' AS {d}" for d in WEEKDAYS)
+        return f"""
+          SELECT DISTINCT ON (1) %(p)s || s.service_id AS service_id, {days},
+                 to_date({_col(c, 'start_date')}, 'YYYYMMDD') AS start_date,
+                 to_date({_col(c, 'end_date')}, 'YYYYMMDD') AS end_date
+          FROM stg_calendar s"""
+    if table == "calendar_dates":
+        return f"""
+          SELECT DISTINCT ON (1, 2) %(p)s || s.service_id AS service_id, to_date(s.date, 'YYYYMMDD') AS date,
+                 {_col(c, 'exception_type', 'int')} AS exception_type
+          FROM stg_calendar_dates s"""
+    if table == "trips":
+        return f"""
+          SELECT DISTINCT ON (1) %(p)s || s.trip_id AS trip_id, %(p)s || s.route_id AS route_id,
+                 %(p)s || {_col(c, 'service_id')} AS service_id, {_col(c, 'direction_id', 'int')} AS direction_id,
+                 %(p)s || {_col(c, 'shape_id')} AS shape_id, {_col(c, 'trip_headsign')} AS headsign
+          FROM stg_trips s"""
+    if table == "stop_times":
+        return f"""
+          SELECT DISTINCT ON (1, 2) %(p)s || s.trip_id AS trip_id, {_col(c, 'stop_sequence', 'int')} AS stop_sequence,
+                 {_col(c, 'arrival_time')} AS arrival_time, {_col(c, 'departure_time')} AS departure_time,
+                 %(p)s || s.stop_id AS stop_id
+          FROM stg_stop_times s"""
+    raise KeyError(table)
+
+
+def _returning(table: str) -> tuple[str, ...]:
+    # Trips also report their route, so a removed or changed trip marks it as changed
+    return TABLES[table][0] + (("route_id",) if table == "trips" else ())
+
+
+def _delete_removed(cur, table: str, p: dict) -> list[dict]:
+    keys, _ = TABLES[table]
+    match = " AND ".join(f"n.{k} = x.{k}" for k in keys)
+    guard = f" AND {DELETE_GUARDS[table]}" if table in DELETE_GUARDS else ""
+    cur.execute(
+        f"""
+        DELETE FROM {table} x
+        WHERE starts_with(x.{keys[0]}, %(p)s)
+          AND NOT EXISTS (SELECT 1 FROM new_{table} n WHERE {match}){guard}
+        RETURNING {', '.join('x.' + k for k in _returning(table))}
+        """,
+        p,
+    )
+    return cur.fetchall()
+
+
+def _upsert_changed(cur, table: str) -> list[dict]:
+    """Insert new rows and update rows whose values differ; untouched rows are not rewritten."""
+    keys, cols = TABLES[table]
+    allc = keys + cols
+    cur.execute(
+        f"""
+        INSERT INTO {table}({', '.join(allc)})
+        SELECT {', '.join('n.' + c for c in allc)} FROM new_{table} n {UPSERT_FILTERS.get(table, '')}
+        ON CONFLICT ({', '.join(keys)}) DO UPDATE
+          SET {', '.join(f'{c} = EXCLUDED.{c}' for c in cols)}
+          WHERE ({', '.join(f'{table}.{c}' for c in cols)}) IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in cols)})
+        RETURNING {', '.join(f'{table}.{k}' for k in _returning(table))}
+        """
+    )
+    return cur.fetchall()
+
+
+def apply_diff(cur, key: str, staged: dict[str, set[str]]) -> dict:
+    """Apply row-level differences between the staged files and the feed's current rows.
+
+    Only tables whose source file was staged are touched. Returns the route_ids whose
+    geometry may have changed (their own row, their trips, or their trips' shapes) and
+    the shape_ids that changed, for re-matching and cache invalidation.
+    """
+    p = {"p": f"{key}:"}
+    tables = [t for t in TABLES if t in staged]
+    for t in tables:
+        cur.execute(f"CREATE TEMP TABLE new_{t} ON COMMIT DROP AS {source_sql(t, staged[t])}", p)
+        cur.execute(f"ANALYZE new_{t}")
+
+    routes: set[str] = set()
+    rows = 0
+    if "trips" in staged:
+        # Trips that move to another route or shape change the old one too
+        cur.execute(
+            """
+            SELECT t.route_id, t.shape_id FROM trips t JOIN new_trips n ON n.trip_id = t.trip_id
+            WHERE (t.route_id, t.shape_id) IS DISTINCT FROM (n.route_id, n.shape_id)
+            """
+        )
+        for row in cur.fetchall():
+            routes.add(row["route_id"])
+    # Children first for deletes, parents first for inserts
+    changed = [_delete_removed(cur, t, p) for t in reversed(tables)]
+    changed += [_upsert_changed(cur, t) for t in tables]
+    for t, hits in zip(list(reversed(tables)) + tables, changed):
+        rows += len(hits)
+        if t in ("trips", "routes"):
+            routes.update(r["route_id"] for r in hits)
+        elif t == "shapes":
+            shapes.update(r["shape_id"] for r in hits)
+    if shapes:
+        cur.execute("SELECT DISTINCT route_id FROM trips WHERE shape_id = ANY(%s)", (list(shapes),))
+        routes.update(r["route_id"] for r in cur.fetchall())
+    # Overlays of routes that no longer exist go with them
+    cur.execute(
+        """
+        DELETE FROM route_streets_geom g
+        WHERE starts_with(g.route_id, %(p)s) AND NOT EXISTS (SELECT 1 FROM routes r WHERE r.route_id = g.route_id)
+        """,
+        p,
+    )
+    if "trips" in staged or "stop_times" in staged:
+        rebuild_departures(cur, p)
+    routes.discard(None)
+    return {"routes": routes, "shapes": shapes, "rows": rows}
+
+
+def rebuild_departures(cur, p: dict):
+    """Regenerate the feed's stop_departures rows from its trips and stop_times."""
+    cur.execute("DELETE FROM stop_departures WHERE starts_with(trip_id, %(p)s)", p)
+    cur.execute(
+        """
+        INSERT INTO stop_departures(stop_id, departure_secs, arrival_secs, trip_id, route_id, service_id, headsign, stop_sequence)
+        SELECT * FROM (
+          SELECT st.stop_id,
+                 gtfs_time_secs(COALESCE(NULLIF(st.departure_time, ''), st.arrival_time)) AS departure_secs,
+                 gtfs_time_secs(st.arrival_time), st.trip_id, t.route_id, t.service_id, t.headsign, st.stop_sequence
+          FROM stop_times st
+          JOIN trips t ON t.trip_id = st.trip_id
+          WHERE starts_with(t.trip_id, %(p)s)
+        ) d
+        WHERE departure_secs IS NOT NULL
+        """,
+        p,
+    )
+
+
+def _download(url: str) -> str:
+    with requests.get(url, stream=True, timeout=120) as resp:
+        resp.raise_for_status()
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as f:
+            for chunk in resp.iter_content(1 << 20):
+                f.write(chunk)
+            return f.name
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _schema_tag(table: str) -> str:
+    # Part of every fingerprint, so files are reloaded when the tables they feed change shape
+    spec = repr(TABLES) if table == "*" else repr(TABLES.get(table))
+    return hashlib.blake2b(spec.encode(), digest_size=4).hexdigest()
+
+
+def file_fingerprint(name: str, info: zipfile.ZipInfo) -> str:
+    return f"{info.CRC:08x}:{info.file_size}:{_schema_tag(name)}"
+
+
+def load_zip(key: str, path: str, full: bool = False) -> dict:
+    """Stage the files of one feed's zip that changed since the last load and apply their
+    row-level diffs, all in one transaction. `full` ignores the stored fingerprints."""
+    t0 = time.time()
+    nothing = {"routes": set(), "shapes": set(), "rows": 0}
+    zip_fp = f"{_sha256(path)}:{_schema_tag('*')}"
+    c = conn()
+    try:
+        with zipfile.ZipFile(path) as zf, c, c.cursor() as cur:
+            cur.execute("SELECT name, fingerprint FROM gtfs_files WHERE feed = %s", (key,))
+            prev = {} if full else {r["name"]: r["fingerprint"] for r in cur.fetchall()}
+            if prev.get(ZIP_NAME) == zip_fp:
+                print(f"[seed] {key}: unchanged")
+                return nothing
+
+            members = {os.path.basename(n): zf.getinfo(n) for n in zf.namelist()}
+            fps = {
+                f"{name}.txt": file_fingerprint(name, members[f"{name}.txt"])
+                for name in STAGED_FILES + ("shapes",)
+                if f"{name}.txt" in members
+            }
+            staged: dict[str, set[str]] = {}
+            for name in STAGED_FILES + ("shapes",):
+                fname = f"{name}.txt"
+                if fname not in members or prev.get(fname) == fps[fname]:
+                    continue
+                t = time.time()
+                with zf.open(members[fname]) as raw:
+                    if name == "shapes":
+                        n = stage_shapes(cur, CleanLines(raw))
+                        staged[name] = {"shape_id", "geom"}
+                        print(f"[seed] {key}: {n} shapes built in {time.time() - t:.1f}s")
+                    else:
+                        staged[name] = stage_csv(cur, CleanLines(raw), name)
+                        print(f"[seed] {key}: {name} staged in {time.time() - t:.1f}s")
+
+            changes = apply_diff(cur, key, staged) if staged else nothing
+            fps[ZIP_NAME] = zip_fp
+            cur.executemany(
+                """
+                INSERT INTO gtfs_files(feed, name, fingerprint, loaded_at) VALUES (%s, %s, %s, now())
+                ON CONFLICT (feed, name) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, loaded_at = now()
+                """,
+                [(key, name, fp) for name, fp in fps.items()],
+            )
+    finally:
+        c.close()
+    print(
+        f"[seed] {key}: {', '.join(staged) or 'no data files'} changed; {changes['rows']} rows written, "
+        f"{len(changes['routes'])} routes / {len(changes['shapes'])} shapes affected in {time.time() - t0:.1f}s"
+    )
+    return changes
+
+
+def load_source(key: str, src: str, full: bool = False) -> dict:
+    if os.path.exists(src):
+        return load_zip(key, src, full)
+    print(f"[seed] {key}: downloading {src}")
+    path = _download(src)
+    try:
+        return load_zip(key, path, full)
+    finally:
+        os.unlink(path)
+
+
+def publish_changes(routes: set[str]):
+    """Record what changed for `make streets` (MATCH_CHANGED) and bump the cache version.
+
+    Only routes are recorded: match_routes keys its cache by shape geometry, so changed
+    shapes are found by hash without a list of their own.
+    """
+    try:
+        rc = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"))
+        pipe = rc.pipeline()
+        if routes:
+            pipe.sadd(CHANGED_ROUTES_KEY, *routes)
+        # API response caches are keyed by this counter
+        pipe.incr(SEED_VERSION_KEY)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"[seed] could not publish changes to Redis: {e}")
+
+
+def apply_schema(text: str):
+    # psql include lines (\i ...) are not SQL; callers concatenate the included files instead
+    body = "\n".join(ln for ln in text.splitlines() if not ln.lstrip().startswith("\\"))
+    c = conn()
+    try:
+        with c, c.cursor() as cur:
+            cur.execute(body)
+    finally:
+        c.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m src.load_gtfs", description=__doc__.splitlines()[0])
+    ap.add_argument("--schema", help="SQL file to apply first ('-' for stdin)")
+    ap.add_argument("--zip", action="append", default=[], metavar="KEY=PATH", help="load a local zip (repeatable)")
+    ap.add_argument("--workers", type=int, default=SEED_WORKERS, help="feeds loaded in parallel")
+    ap.add_argument("--full", action="store_true", help="ignore stored fingerprints and diff every file")
+    args = ap.parse_args(argv)
+
+    if args.schema:
+        apply_schema(sys.stdin.read() if args.schema == "-" else open(args.schema).read())
+        print("[seed] schema applied")
+
+    if args.zip:
+        sources = parse_sources(",".join(args.zip), None)
+    else:
+        sources = parse_sources(os.getenv("GTFS_STATIC_SOURCES"), os.getenv("GTFS_STATIC_URL"))
+    if not sources:
+        print("[seed] Neither GTFS_STATIC_SOURCES nor GTFS_STATIC_URL is set. Skipping static GTFS import.")
+        return 0
+
+    t0 = time.time()
+    failed = []
+    routes: set[str] = set()
+    rows = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(args.workers, len(sources)))) as ex:
+        futs = {ex.submit(load_source, key, src, args.full): key for key, src in sources.items()}
+        for fut in as_completed(futs):
+            try:
+                changes = fut.result()
+            except Exception as e:
+                failed.append(futs[fut])
+                print(f"[seed] {futs[fut]} failed: {e}")
+                continue
+            routes |= changes["routes"]
+            rows += changes["rows"]
+    if rows:
+        publish_changes(routes)
+    print(
+        f"[seed] {len(sources) - len(failed)}/{len(sources)} feeds loaded in {time.time() - t0:.1f}s; "
+        f"{rows} rows changed, {len(routes)} routes to re-match"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
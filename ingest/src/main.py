@@ -1,23 +1,68 @@
-import os, time
-from google.transit import gtfs_realtime_pb2 as gtfs
-from .feeds import fetch_bytes, VEH_FEED, TRIP_FEED, ALERTS_FEED
+import asyncio, os, time
+from functools import partial
+from .feeds import fetch_bytes, forget, last_header_timestamp, close_clients, UNCHANGED, VEH_FEED, TRIP_FEED, ALERTS_FEED
+from .decode import VehicleDecoder, VehicleRecord, decode_vehicles
+from .alerts import decode_alerts, index_alerts
+from .eta import ScheduleCache, build_predictions, decode_trip_updates
+from .projection import ProjectionEngine
+from .history import REPLAY_FRAME_SECONDS, MinuteArchive, MinuteRecorder
+from .archive import PositionArchiver
 from .normalize import mock_vehicles
+from .scheduler import run_every
 from .writers import (
-    write_current_vehicles,
-    mark_ingest_now,
     write_trip_updates_raw,
     write_alerts_raw,
-    write_derived_routes,
     write_current_vehicles_for,
-    update_vehicles_union,
+    write_vehicle_changes_for,
+    touch_current_vehicles_for,
+    touch_trip_updates_raw,
+    touch_alerts_raw,
+    write_alert_index,
+    write_stop_etas,
+    read_seed_version,
     write_derived_routes_for,
     update_derived_routes_union,
+    prune_vehicle_indexes,
+    write_vehicle_snapshot,
+    r as redis_client,
+)
+from .metrics import (
+    serve_metrics,
+    observe_call,
+    INGEST_CYCLE_SECONDS,
+    FEED_BYTES,
+    FEED_ENTITIES,
+    FEED_FETCH_SECONDS,
+    FEED_HEADER_AGE_SECONDS,
+    FEED_PARSE_SECONDS,
+    REDIS_WRITE_SECONDS,
 )
-from .metrics import serve_metrics, INGEST_CYCLE_SECONDS
 
 VEHICLES_POLL_SECONDS = int(os.getenv("VEHICLES_POLL_SECONDS", "6"))  # default 10/min
 TRIP_UPDATES_POLL_SECONDS = int(os.getenv("TRIP_UPDATES_POLL_SECONDS", "60"))  # default 1/min
 ALERTS_POLL_SECONDS = int(os.getenv("ALERTS_POLL_SECONDS", "60"))  # default 1/min
+# Upper bound on a single fetch; a hung feed gives up after this without touching other feeds
+FEED_DEADLINE_SECONDS = float(os.getenv("FEED_DEADLINE_SECONDS", "10"))
+UNION_SECONDS = float(os.getenv("UNION_SECONDS", "1"))
+# How often per-stop predictions are rebuilt from the latest trip updates and vehicles
+ETA_SECONDS = float(os.getenv("ETA_SECONDS", "15"))
+# Trip updates not refreshed for this long are ignored (matches the raw key's TTL)
+TRIP_UPDATES_MAX_AGE = 120
+
+# Per-feed decoders keep the previous snapshot so unchanged vehicles are skipped
+_decoders: dict[str, VehicleDecoder] = {}
+# Per-feed decoded trip updates and when the upstream payload was last confirmed
+_trip_updates: dict[str, tuple[float, list]] = {}
+_schedules: dict[str, ScheduleCache] = {}
+# Per-feed decoded alerts, re-indexed every poll as active periods start and end
+_alerts: dict[str, list] = {}
+# Shapes of every feed, reloaded when the seed version changes
+_projection = ProjectionEngine()
+# Mock fleets stand in for a decoder when a feed has no URL or fails
+_mock_fleets: dict[str, list[VehicleRecord]] = {}
+_recorder = MinuteRecorder()
+_archive = MinuteArchive(redis_client)
+_positions = PositionArchiver()
 
 
 def load_feed_configs():
@@ -59,137 +104,192 @@ def load_feed_configs():
 
 
 def _parse_vehicles(pb_bytes: bytes):
-    feed = gtfs.FeedMessage()
-    feed.ParseFromString(pb_bytes)
-    ts_fallback = int(feed.header.timestamp) if feed.header.timestamp else int(time.time())
-    out = []
-    for ent in feed.entity:
-        if not ent.HasField("vehicle"):
-            continue
-        v = ent.vehicle
-        pos = v.position
-        if not pos or not pos.latitude or not pos.longitude:
-            continue
-        vid = v.vehicle.id if v.vehicle and v.vehicle.id else (ent.id or "")
-        route_id = v.trip.route_id if v.trip and v.trip.route_id else ""
-        ts = int(v.timestamp) if v.timestamp else ts_fallback
-        vehicle_label = v.vehicle.label if (hasattr(v, "vehicle") and v.vehicle and hasattr(v.vehicle, "label")) else None
-        license_plate = v.vehicle.license_plate if (hasattr(v, "vehicle") and v.vehicle and hasattr(v.vehicle, "license_plate")) else None
-        trip_id = v.trip.trip_id if (hasattr(v, "trip") and v.trip and hasattr(v.trip, "trip_id")) else None
-        current_status = int(v.current_status) if hasattr(v, "current_status") and v.current_status is not None else None
-        stop_id = v.stop_id if hasattr(v, "stop_id") else None
-        current_stop_sequence = int(v.current_stop_sequence) if hasattr(v, "current_stop_sequence") and v.current_stop_sequence is not None else None
-        occupancy_status = int(v.occupancy_status) if hasattr(v, "occupancy_status") and v.occupancy_status is not None else None
-        # occupancy_percentage is not guaranteed in all bindings; use getattr defensively
-        occupancy_percentage = getattr(v, "occupancy_percentage", None)
-
-        out.append(
-            {
-                "id": vid or f"veh_{len(out)}",
-                "route_id": route_id or "UNKNOWN",
-                "lat": float(pos.latitude),
-                "lon": float(pos.longitude),
-                "speed": float(pos.speed) if pos.speed else None,
-                "heading": int(pos.bearing) if pos.bearing else None,
-                "ts": ts,
-                "label": vehicle_label,
-                "license_plate": license_plate,
-                "trip_id": trip_id,
-                "current_status": current_status,
-                "stop_id": stop_id,
-                "current_stop_sequence": current_stop_sequence,
-                "occupancy_status": occupancy_status,
-                "occupancy_percentage": occupancy_percentage,
-            }
-        )
-    return out
+    return [rec.to_dict() for rec in decode_vehicles(pb_bytes)]
 
 
-def run_cycle(fetch_due: dict, feeds_cfg: list[dict]):
-    now = time.time()
-    feed_names = [f["name"] for f in feeds_cfg]
+def _auth_headers(f: dict):
+    return (
+        {"Authorization": f.get("api_key"), "X-API-Key": f.get("api_key")}
+        if f.get("api_key")
+        else None
+    )
+
+
+# Metric label for each feed URL key
+KINDS = {"veh": "vehicles", "trip": "trip_updates", "alerts": "alerts"}
+
+
+async def _fetch(f: dict, kind: str):
+    url = f.get(kind)
+    labels = (f["name"], KINDS[kind])
+    t0 = time.perf_counter()
+    try:
+        # The deadline bounds the whole request, not just individual socket reads
+        raw = await asyncio.wait_for(fetch_bytes(url, headers=_auth_headers(f)), timeout=FEED_DEADLINE_SECONDS)
+    finally:
+        if url:
+            FEED_FETCH_SECONDS.labels(*labels).observe(time.perf_counter() - t0)
+    if isinstance(raw, bytes):
+        FEED_BYTES.labels(*labels).observe(len(raw))
+    header_ts = last_header_timestamp(url) if url else None
+    if header_ts:
+        FEED_HEADER_AGE_SECONDS.labels(*labels).observe(max(0.0, time.time() - header_ts))
+    return raw
+
+
+def _store_vehicles(fname: str, vehicles: list[dict]):
+    _mock_fleets[fname] = [VehicleRecord(**v) for v in vehicles]
+    observe_call(REDIS_WRITE_SECONDS, fname, "vehicles", write_current_vehicles_for, fname, vehicles)
+    write_derived_routes_for(fname, [v.get("route_id") for v in vehicles])
+
+
+def _store_vehicle_changes(fname: str, decoder: VehicleDecoder, changed, removed: list[str], full: bool = False):
+    # Only moved vehicles are re-projected; the rest keep their position along the shape
+    _projection.refresh(read_seed_version())
+    _projection.project(fname, changed)
+    _positions.submit(fname, changed)
+    if full:
+        # A fresh decoder knows nothing of what was stored before it (e.g. a mock fleet
+        # written after an error), so its first payload replaces the feed's vehicles
+        observe_call(REDIS_WRITE_SECONDS, fname, "vehicles", write_current_vehicles_for, fname,
+                     [rec.to_dict() for rec in decoder.records.values()])
+    else:
+        observe_call(REDIS_WRITE_SECONDS, fname, "vehicles", write_vehicle_changes_for, fname,
+                     [rec.to_dict() for rec in changed], removed)
+    write_derived_routes_for(fname, [rec.route_id for rec in decoder.records.values()])
+
+
+async def poll_vehicles(f: dict):
+    fname = f["name"]
+    try:
+        raw = await _fetch(f, "veh")
+        if raw is UNCHANGED:
+            # Same payload as last time: keep the stored fleet alive, skip parse and rewrite
+            await asyncio.to_thread(observe_call, REDIS_WRITE_SECONDS, fname, "vehicles", touch_current_vehicles_for, fname)
+        elif raw:
+            fresh = fname not in _decoders
+            decoder = _decoders.setdefault(fname, VehicleDecoder())
+            changed, removed = await asyncio.to_thread(observe_call, FEED_PARSE_SECONDS, fname, "vehicles", decoder.decode, raw)
+            FEED_ENTITIES.labels(fname, "vehicles").observe(len(decoder.records))
+            if fresh or changed or removed:
+                await asyncio.to_thread(_store_vehicle_changes, fname, decoder, changed, removed, fresh)
+            else:
+                await asyncio.to_thread(observe_call, REDIS_WRITE_SECONDS, fname, "vehicles", touch_current_vehicles_for, fname)
+        else:
+            await asyncio.to_thread(_store_vehicles, fname, mock_vehicles())
+    except Exception as e:
+        print(f"{fname} vehicles fetch/parse error:", e or type(e).__name__)
+        forget(f.get("veh"))
+        _decoders.pop(fname, None)
+        await asyncio.to_thread(_store_vehicles, fname, mock_vehicles())
+
 
+async def poll_trip_updates(f: dict):
+    fname = f["name"]
+    try:
+        raw = await _fetch(f, "trip")
+        if raw is UNCHANGED:
+            if fname in _trip_updates:
+                _trip_updates[fname] = (time.time(), _trip_updates[fname][1])
+            await asyncio.to_thread(touch_trip_updates_raw, fname)
+        elif raw:
+            # Decoded once here; the ETA stage reuses it until the next payload
+            records = await asyncio.to_thread(observe_call, FEED_PARSE_SECONDS, fname, "trip_updates", decode_trip_updates, raw, fname)
+            FEED_ENTITIES.labels(fname, "trip_updates").observe(len(records))
+            _trip_updates[fname] = (time.time(), records)
+            await asyncio.to_thread(observe_call, REDIS_WRITE_SECONDS, fname, "trip_updates", write_trip_updates_raw, fname, raw)
+    except Exception as e:
+        print(f"{fname} trip updates fetch/parse error:", e or type(e).__name__)
+        forget(f.get("trip"))
+        _trip_updates.pop(fname, None)
+
+
+def _store_etas(fname: str, trip_updates: list, vehicles: list):
+    schedule = _schedules.setdefault(fname, ScheduleCache())
+    schedule.reset(read_seed_version())
+    by_stop = build_predictions(fname, trip_updates, vehicles, schedule)
+    observe_call(REDIS_WRITE_SECONDS, fname, "etas", write_stop_etas, fname, by_stop)
+
+
+async def update_etas(f: dict):
+    fname = f["name"]
+    at, trip_updates = _trip_updates.get(fname, (0.0, []))
+    if time.time() - at > TRIP_UPDATES_MAX_AGE:
+        trip_updates = []
+    decoder = _decoders.get(fname)
+    vehicles = list(decoder.records.values()) if decoder else []
+    try:
+        await asyncio.to_thread(_store_etas, fname, trip_updates, vehicles)
+    except Exception as e:
+        print(f"{fname} eta error:", e or type(e).__name__)
+
+
+def _store_alerts(fname: str):
+    observe_call(REDIS_WRITE_SECONDS, fname, "alerts", write_alert_index, fname, index_alerts(_alerts[fname], time.time()))
+
+
+async def poll_alerts(f: dict):
+    fname = f["name"]
+    try:
+        raw = await _fetch(f, "alerts")
+        if raw is UNCHANGED:
+            await asyncio.to_thread(touch_alerts_raw, fname)
+        elif raw:
+            _alerts[fname] = await asyncio.to_thread(observe_call, FEED_PARSE_SECONDS, fname, "alerts", decode_alerts, raw, fname)
+            FEED_ENTITIES.labels(fname, "alerts").observe(len(_alerts[fname]))
+            await asyncio.to_thread(write_alerts_raw, fname, raw)
+        if fname in _alerts:
+            await asyncio.to_thread(_store_alerts, fname)
+    except Exception as e:
+        print(f"{fname} alerts fetch/parse error:", e or type(e).__name__)
+        forget(f.get("alerts"))
+        _alerts.pop(fname, None)
+
+
+def _fleet(fname: str):
+    decoder = _decoders.get(fname)
+    return decoder.records.values() if decoder is not None else _mock_fleets.get(fname, [])
+
+
+async def record_history(feed_names: list[str]):
+    """Capture one replay frame of every feed; store the previous minute once it closes."""
+    rows = [(f"{fname}:{v.id}", v.route_id, v.lat, v.lon, v.heading, v.speed) for fname in feed_names for v in _fleet(fname)]
+    closed = _recorder.add(time.time(), rows)
+    if closed is not None:
+        await asyncio.to_thread(_archive.store, *closed)
+
+
+async def sync_unions(feed_names: list[str]):
+    t0 = time.perf_counter()
+    # Vehicles are indexed as they are written; only the derived route list and the
+    # fleet snapshot are built across feeds
+    await asyncio.to_thread(update_derived_routes_union, feed_names)
+    await asyncio.to_thread(prune_vehicle_indexes)
+    await asyncio.to_thread(write_vehicle_snapshot)
+    INGEST_CYCLE_SECONDS.set(time.perf_counter() - t0)
+
+
+async def run(feeds_cfg: list[dict]):
+    feed_names = [f["name"] for f in feeds_cfg]
+    tasks = []
     for f in feeds_cfg:
         fname = f["name"]
-        # Vehicles
-        if now >= fetch_due.get((fname, "veh"), 0):
-            try:
-                headers = (
-                    {"Authorization": f.get("api_key"), "X-API-Key": f.get("api_key")}
-                    if f.get("api_key")
-                    else None
-                )
-                raw = fetch_bytes(f.get("veh"), headers=headers)
-                if raw:
-                    vehicles = _parse_vehicles(raw)
-                    if vehicles:
-                        write_current_vehicles_for(fname, vehicles)
-                        mark_ingest_now()
-                        write_derived_routes_for(fname, [v.get("route_id") for v in vehicles])
-                else:
-                    mv = mock_vehicles()
-                    write_current_vehicles_for(fname, mv)
-                    mark_ingest_now()
-                    write_derived_routes_for(fname, [v.get("route_id") for v in mv])
-            except Exception as e:
-                print(f"{fname} vehicles fetch/parse error:", e)
-                mv = mock_vehicles()
-                write_current_vehicles_for(fname, mv)
-                mark_ingest_now()
-                write_derived_routes_for(fname, [v.get("route_id") for v in mv])
-            finally:
-                fetch_due[(fname, "veh")] = now + max(1, int(f.get("veh_sec") or VEHICLES_POLL_SECONDS))
-
-        # Trip updates
-        if now >= fetch_due.get((fname, "trip"), 0):
-            try:
-                headers = (
-                    {"Authorization": f.get("api_key"), "X-API-Key": f.get("api_key")}
-                    if f.get("api_key")
-                    else None
-                )
-                raw = fetch_bytes(f.get("trip"), headers=headers)
-                if raw:
-                    write_trip_updates_raw(raw)
-            except Exception as e:
-                print(f"{fname} trip updates fetch error:", e)
-            finally:
-                fetch_due[(fname, "trip")] = now + max(5, int(f.get("trip_sec") or TRIP_UPDATES_POLL_SECONDS))
-
-        # Alerts
-        if now >= fetch_due.get((fname, "alerts"), 0):
-            try:
-                headers = (
-                    {"Authorization": f.get("api_key"), "X-API-Key": f.get("api_key")}
-                    if f.get("api_key")
-                    else None
-                )
-                raw = fetch_bytes(f.get("alerts"), headers=headers)
-                if raw:
-                    write_alerts_raw(raw)
-            except Exception as e:
-                print(f"{fname} alerts fetch error:", e)
-            finally:
-                fetch_due[(fname, "alerts")] = now + max(5, int(f.get("alerts_sec") or ALERTS_POLL_SECONDS))
-
-    # Update union keys for API consumption
-    update_vehicles_union(feed_names)
-    update_derived_routes_union(feed_names)
+        # Each (feed, kind) pair runs on its own schedule so a slow endpoint only delays itself
+        tasks.append(run_every(f"{fname} vehicles", max(1, int(f.get("veh_sec") or VEHICLES_POLL_SECONDS)), partial(poll_vehicles, f)))
+        tasks.append(run_every(f"{fname} trip updates", max(5, int(f.get("trip_sec") or TRIP_UPDATES_POLL_SECONDS)), partial(poll_trip_updates, f)))
+        tasks.append(run_every(f"{fname} eta", ETA_SECONDS, partial(update_etas, f)))
+        tasks.append(run_every(f"{fname} alerts", max(5, int(f.get("alerts_sec") or ALERTS_POLL_SECONDS)), partial(poll_alerts, f)))
+    tasks.append(run_every("union", UNION_SECONDS, partial(sync_unions, feed_names)))
+    tasks.append(run_every("history", REPLAY_FRAME_SECONDS, partial(record_history, feed_names)))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await close_clients()
 
 
 def main():
     serve_metrics()
-    feeds_cfg = load_feed_configs()
-    due = {}
-    while True:
-        t0 = time.time()
-        try:
-            run_cycle(due, feeds_cfg)
-        except Exception as e:
-            print("ingest cycle error:", e)
-        INGEST_CYCLE_SECONDS.set(time.time() - t0)
-        # tick every second for due scheduling
-        time.sleep(1)
+    asyncio.run(run(load_feed_configs()))
 
 
 if __name__ == "__main__":
@@ -1,14 +1,9 @@
-import os, json, time, requests, psycopg2
-from psycopg2.extras import RealDictCursor
+import os, json, time, hashlib, threading, redis, requests, psycopg2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
-
-def pg_url():
-    raw = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/transit")
-    return raw.replace("postgresql+psycopg2://", "postgresql://").replace("postgres+psycopg2://", "postgres://")
-
-
-def conn():
-    return psycopg2.connect(pg_url(), cursor_factory=RealDictCursor)
+from .db import conn
+from .polyline import decode6, decode6_many, merge_lines, multilinestring_wkb, simplify
 
 
 VALHALLA_URL = os.getenv("VALHALLA_URL", "http://valhalla:8002")
@@ -16,8 +11,83 @@ SAMPLE_METERS = int(os.getenv("MATCH_SAMPLE_METERS", "40"))
 COSTING = os.getenv("MATCH_COSTING", "auto")
 SEARCH_RADIUS = int(os.getenv("MATCH_SEARCH_RADIUS", "50"))
 VALHALLA_MAX_POINTS = int(os.getenv("VALHALLA_MAX_POINTS", "15000"))
-MATCH_WORKERS = int(os.getenv("MATCH_WORKERS", "2"))
+# Concurrent trace_attributes requests across all routes; match Valhalla's server_threads
+VALHALLA_THREADS = int(os.getenv("VALHALLA_THREADS", "4"))
+# Shapes in flight; each mostly waits on the shared Valhalla pool, so this can exceed it
+MATCH_WORKERS = int(os.getenv("MATCH_WORKERS", str(2 * VALHALLA_THREADS)))
+# Points shared by consecutive windows of a long shape; results are stitched mid-overlap
+MATCH_WINDOW_OVERLAP = int(os.getenv("MATCH_WINDOW_OVERLAP", "50"))
+MATCH_WINDOW_MIN = int(os.getenv("MATCH_WINDOW_MIN", "500"))
+# Windows are sized so one request takes about this long at the observed Valhalla speed
+MATCH_TARGET_SECONDS = float(os.getenv("MATCH_TARGET_SECONDS", "3"))
+# Douglas-Peucker tolerance applied before storing a match; 0 keeps every vertex
+MATCH_SIMPLIFY_METERS = float(os.getenv("MATCH_SIMPLIFY_METERS", "1"))
 MATCH_OVERWRITE = os.getenv("MATCH_OVERWRITE", "false").lower() in ("1", "true", "yes", "y", "on")
+# Only process the routes recorded as changed by incremental seeds (src.load_gtfs)
+MATCH_CHANGED = os.getenv("MATCH_CHANGED", "false").lower() in ("1", "true", "yes", "y", "on")
+CHANGED_ROUTES_KEY = "gtfs:changed_routes"
+
+
+SHAPE_MATCHES_DDL = """
+  CREATE TABLE IF NOT EXISTS shape_matches(
+    hash TEXT PRIMARY KEY,
+    geom geometry(MultiLineString, 4326) NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT now()
+  );
+  ALTER TABLE route_streets_geom ADD COLUMN IF NOT EXISTS source_hash TEXT;
+"""
+
+
+def ensure_tables():
+    # Mirrors sql/schema.sql so databases seeded before the match cache existed still work
+    with conn() as c, c.cursor() as cur:
+        cur.execute(SHAPE_MATCHES_DDL)
+
+
+def shape_hash(geom_md5: str) -> str:
+    """Cache key for one shape: its geometry plus every parameter that affects the match."""
+    key = f"{geom_md5}|{SAMPLE_METERS}|{COSTING}|{SEARCH_RADIUS}|{MATCH_SIMPLIFY_METERS:g}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def route_source_hash(hashes) -> str:
+    """Identity of the set of cached shape matches a route geometry was assembled from."""
+    return hashlib.blake2b("|".join(sorted(set(hashes))).encode(), digest_size=16).hexdigest()
+
+
+def route_shapes(route_ids: list[str]) -> dict[str, dict[str, str]]:
+    """route_id -> {shape_id: shape hash}, hashed in Postgres so no coordinates are shipped."""
+    sql = """
+      SELECT DISTINCT t.route_id, s.shape_id, md5(ST_AsBinary(s.geom)) AS h
+      FROM trips t
+      JOIN shapes s ON s.shape_id = t.shape_id
+      WHERE t.route_id = ANY(%s)
+    """
+    out: dict[str, dict[str, str]] = {rid: {} for rid in route_ids}
+    with conn() as c, c.cursor() as cur:
+        cur.execute(sql, (route_ids,))
+        for row in cur.fetchall():
+            out[row["route_id"]][row["shape_id"]] = shape_hash(row["h"])
+    return out
+
+
+def cached_matches(hashes: list[str]) -> set[str]:
+    if not hashes:
+        return set()
+    with conn() as c, c.cursor() as cur:
+        cur.execute("SELECT hash FROM shape_matches WHERE hash = ANY(%s)", (hashes,))
+        return {r["hash"] for r in cur.fetchall()}
+
+
+def densified_shape_geojson(shape_id: str):
+    sql = """
+      SELECT ST_AsGeoJSON(ST_Segmentize(geom::geography, %s)::geometry) AS g
+      FROM shapes WHERE shape_id = %s
+    """
+    with conn() as c, c.cursor() as cur:
+        cur.execute(sql, (SAMPLE_METERS, shape_id))
+        row = cur.fetchone()
+    return json.loads(row["g"]) if row else None
 
 
 def densified_shapes_geojson(route_id: str):
@@ -51,51 +121,32 @@ def call_valhalla(points):
         "shape_match": "map_snap",
         "filters": {"attributes": ["shape", "edge.way_id", "edge.names"]},
     }
-    r = requests.post(url, json=body, timeout=30)
+    r = _session().post(url, json=body, timeout=30)
     r.raise_for_status()
     return r.json()
 
 
-def decode_polyline6(encoded: str):
-    # Polyline6 decode to list of [lon, lat]
-    result = []
-    index = lat = lon = 0
-    length = len(encoded)
-    factor = 1e-6
-    while index < length:
-        for coord in (lat, lon):
-            shift = result_bits = 0
-            b = 0x20
-            value = 0
-            while b >= 0x20:
-                b = ord(encoded[index]) - 63
-                index += 1
-                value |= (b & 0x1F) << shift
-                shift += 5
-            d = ~(value >> 1) if (value & 1) else (value >> 1)
-            if coord is lat:
-                lat += d
-            else:
-                lon += d
-        result.append([lon * factor, lat * factor])
-    return result
+_local = threading.local()
 
 
-def edges_to_multilines(resp_json):
-    coords_list = []
-    edges = resp_json.get("edges") or []
-    for e in edges:
-        shp = e.get("shape")
-        if not shp:
-            continue
-        coords_list.append(decode_polyline6(shp))
-    if coords_list:
-        return {"type": "MultiLineString", "coordinates": coords_list}
+def _session() -> requests.Session:
+    # One keep-alive session per pool thread; Session is not safe to share across threads
+    sess = getattr(_local, "session", None)
+    if sess is None:
+        sess = _local.session = requests.Session()
+    return sess
+
+
+def edges_to_lines(resp_json) -> list[np.ndarray]:
+    """Matched geometry as [lon, lat] arrays, contiguous edges merged into one line."""
+    shapes = [e["shape"] for e in resp_json.get("edges") or [] if e.get("shape")]
+    if shapes:
+        return merge_lines(decode6_many(shapes))
     # Fallback: top-level shape
     shp = resp_json.get("shape")
     if isinstance(shp, str):
-        return {"type": "MultiLineString", "coordinates": [decode_polyline6(shp)]}
-    return None
+        return merge_lines([decode6(shp)])
+    return []
 
 
 def upsert_route_geom(route_id: str, mls_geojson: dict | None, fallback_lines: list[dict]):
@@ -117,94 +168,260 @@ def upsert_route_geom(route_id: str, mls_geojson: dict | None, fallback_lines: l
         )
 
 
-def chunk_points(points, max_size=15000):
-    """Split points into chunks that respect Valhalla's 16k limit"""
-    for i in range(0, len(points), max_size):
-        yield points[i:i + max_size]
+class WindowSizer:
+    """Picks window sizes from an EWMA of Valhalla's seconds per matched point."""
+
+    def __init__(self, target_seconds: float, lo: int, hi: int, alpha: float = 0.2):
+        self.target = target_seconds
+        self.lo = lo
+        self.hi = hi
+        self.alpha = alpha
+        self.sec_per_point: float | None = None
+        self._lock = threading.Lock()
+
+    def observe(self, points: int, seconds: float):
+        if points <= 0:
+            return
+        sample = seconds / points
+        with self._lock:
+            if self.sec_per_point is None:
+                self.sec_per_point = sample
+            else:
+                self.sec_per_point += self.alpha * (sample - self.sec_per_point)
+
+    def size(self) -> int:
+        if not self.sec_per_point:
+            return self.hi
+        return max(self.lo, min(self.hi, int(self.target / self.sec_per_point)))
+
+
+_sizer = WindowSizer(MATCH_TARGET_SECONDS, MATCH_WINDOW_MIN, VALHALLA_MAX_POINTS)
+_valhalla_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def valhalla_pool() -> ThreadPoolExecutor:
+    """Bounded pool every Valhalla request goes through, shared by all routes and shapes."""
+    global _valhalla_pool
+    with _pool_lock:
+        if _valhalla_pool is None:
+            _valhalla_pool = ThreadPoolExecutor(max_workers=VALHALLA_THREADS, thread_name_prefix="valhalla")
+        return _valhalla_pool
+
+
+def windows(n: int, size: int, overlap: int) -> list[tuple[int, int]]:
+    """[start, end) index ranges covering n points, consecutive ranges sharing `overlap`."""
+    if n <= size:
+        return [(0, n)]
+    overlap = min(overlap, size // 2)
+    step = size - overlap
+    out = []
+    start = 0
+    while True:
+        end = min(start + size, n)
+        out.append((start, end))
+        if end == n:
+            return out
+        start += step
+
+
+def _nearest(line: np.ndarray, lon: float, lat: float, lo: int, hi: int) -> int:
+    d = line[lo:hi] - (lon, lat)
+    d[:, 0] *= np.cos(np.radians(lat))
+    return lo + int((d * d).sum(axis=1).argmin())
+
+
+def stitch(pieces: list[list[np.ndarray]], spans: list[tuple[int, int]], pts) -> list[np.ndarray]:
+    """Join matched windows, cutting each pair at the overlap's midpoint.
+
+    Both neighbours saw the whole overlap, so near its middle they agree on the road; the
+    ends of a window, where the matcher has the least context, are discarded. A window's
+    match can break into several parts (tunnels, unmatched stretches); only the last part
+    of one window is joined to the first part of the next, the rest stay separate.
+    """
+    out = list(pieces[0])
+    base = 0  # where the latest window's part starts in out[-1]
+    for k in range(1, len(pieces)):
+        last, nxt = out[-1], pieces[k][0]
+        mid = pts[(spans[k][0] + spans[k - 1][1]) // 2]
+        lon, lat = mid["lon"], mid["lat"]
+        # Search the tail of the previous piece and the head of the next, so a route that
+        # passes the same spot twice cannot cut at the wrong pass
+        i = _nearest(last, lon, lat, base + (len(last) - base) // 2, len(last))
+        j = _nearest(nxt, lon, lat, 0, max(1, (len(nxt) + 1) // 2))
+        if np.array_equal(nxt[j], last[i]):
+            j += 1
+        out[-1] = np.concatenate([last[:i + 1], nxt[j:]])
+        out.extend(pieces[k][1:])
+        base = i + 1 if len(pieces[k]) == 1 else 0
+    return out
+
+
+def window_line(resp_json) -> list[np.ndarray]:
+    """The matched path of one request, one line per contiguous part."""
+    return edges_to_lines(resp_json)
+
+
+def match_window(chunk) -> list[np.ndarray]:
+    t0 = time.monotonic()
+    lines = window_line(call_valhalla(chunk))
+    _sizer.observe(len(chunk), time.monotonic() - t0)
+    if not lines:
+        raise ValueError(f"no match for window of {len(chunk)} points")
+    return lines
+
+
+def match_points(pts) -> list[np.ndarray]:
+    """Matched lines for one densified shape, one per contiguous part; raises if any
+    window fails so a partial result is never cached.
+
+    Long shapes are cut into overlapping windows that are matched concurrently through
+    the shared Valhalla pool and stitched back together.
+    """
+    spans = windows(len(pts), _sizer.size(), MATCH_WINDOW_OVERLAP)
+    futs = [valhalla_pool().submit(match_window, pts[s:e]) for s, e in spans]
+    pieces = [f.result() for f in futs]
+    return merge_lines(stitch(pieces, spans, pts))
+
+
+def match_shape(shape_id: str, h: str) -> bool:
+    """Match one shape through Valhalla and store it under its hash; False on failure."""
+    t0 = time.time()
+    line = densified_shape_geojson(shape_id)
+    pts = geojson_lines_to_points(line) if line else []
+    if not pts:
+        return False
+    try:
+        segments = match_points(pts)
+    except Exception as e:
+        print(f"  shape {shape_id} error: {e}")
+        return False
+    if not segments:
+        print(f"  shape {shape_id}: no match")
+        return False
+    segments = [simplify(ln, MATCH_SIMPLIFY_METERS) for ln in segments]
+    with conn() as c, c.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO shape_matches(hash, geom, updated_at)
+            VALUES (%s, ST_GeomFromWKB(%s, 4326), now())
+            ON CONFLICT (hash)
+            DO UPDATE SET geom = EXCLUDED.geom, updated_at = now()
+            """,
+            (h, psycopg2.Binary(multilinestring_wkb(segments))),
+        )
+    print(f"  shape {shape_id}: {len(pts)} pts -> {sum(map(len, segments))} matched in {time.time()-t0:.1f}s")
+    return True
+
+
+def assemble_route(route_id: str, hashes: list[str], force: bool = False) -> bool:
+    """Build a route's geometry from its cached shape matches.
+
+    Segments shared by several shapes (both directions, branches) are emitted once. The
+    route row is only rewritten when the set of matches it is built from changed, so
+    unchanged routes keep their updated_at and their cached tiles. Returns True if written.
+    """
+    have = sorted(cached_matches(hashes))
+    source = route_source_hash(have)
+    with conn() as c, c.cursor() as cur:
+        cur.execute("SELECT source_hash FROM route_streets_geom WHERE route_id = %s", (route_id,))
+        row = cur.fetchone()
+        if row and row["source_hash"] == source and not force:
+            return False
+        if not have:
+            # Nothing matched: fall back to the densified GTFS shapes
+            upsert_route_geom(route_id, None, densified_shapes_geojson(route_id))
+            cur.execute("UPDATE route_streets_geom SET source_hash = %s WHERE route_id = %s", (source, route_id))
+            return True
+        cur.execute(
+            """
+            INSERT INTO route_streets_geom(route_id, geom, source_hash, updated_at)
+            SELECT %s, ST_Multi(ST_Collect(d.geom)), %s, now()
+            FROM (
+              SELECT DISTINCT (ST_Dump(m.geom)).geom AS geom
+              FROM shape_matches m
+              WHERE m.hash = ANY(%s)
+            ) d
+            ON CONFLICT (route_id)
+            DO UPDATE SET geom = EXCLUDED.geom, source_hash = EXCLUDED.source_hash, updated_at = now()
+            """,
+            (route_id, source, have),
+        )
+    return True
+
+
+def match_missing(shapes: dict[str, str], overwrite: bool = False) -> int:
+    """Match every shape (shape_id -> hash) without a cached result, each distinct hash once."""
+    todo: dict[str, str] = {}
+    for sid, h in shapes.items():
+        todo.setdefault(h, sid)
+    if not overwrite:
+        for h in cached_matches(list(todo)):
+            del todo[h]
+    if not todo:
+        return 0
+    print(f"matching {len(todo)} shapes ({len(shapes) - len(todo)} shapes reused from cache)")
+    if MATCH_WORKERS <= 1:
+        return sum(match_shape(sid, h) for h, sid in todo.items())
+
+    with ThreadPoolExecutor(max_workers=MATCH_WORKERS) as ex:
+        return sum(ex.map(lambda item: match_shape(item[1], item[0]), todo.items()))
 
 
 def process_route(route_id: str):
     t0 = time.time()
-    lines = densified_shapes_geojson(route_id)
-    if not lines:
+    shapes = route_shapes([route_id])[route_id]
+    if not shapes:
         print(f"no shapes for {route_id}")
         return
+    match_missing(shapes, overwrite=MATCH_OVERWRITE)
+    wrote = assemble_route(route_id, list(shapes.values()), force=MATCH_OVERWRITE)
+    print(f"done {route_id} in {time.time()-t0:.1f}s; {'updated' if wrote else 'unchanged'}")
 
-    total_points = 0
-    for ln in lines:
-        total_points += len(geojson_lines_to_points(ln))
-
-    print(f"processing {route_id}: {total_points} points across {len(lines)} shapes")
 
-    all_segments: list[list[list[float]]] = []
-    for i, ln in enumerate(lines):
-        pts = geojson_lines_to_points(ln)
-        if not pts:
-            continue
-        if len(pts) > VALHALLA_MAX_POINTS:
-            print(f"  shape {i} large ({len(pts)}), chunking...")
-            for chunk_idx, chunk in enumerate(chunk_points(pts, max_size=VALHALLA_MAX_POINTS)):
-                try:
-                    resp = call_valhalla(chunk)
-                    mls = edges_to_multilines(resp)
-                    if mls and mls.get("coordinates"):
-                        all_segments.extend(mls["coordinates"])  # type: ignore
-                    print(f"    chunk {chunk_idx}: {len(chunk)} pts -> matched")
-                except Exception as e:
-                    print(f"    chunk {chunk_idx} error: {e}")
-        else:
-            try:
-                resp = call_valhalla(pts)
-                mls = edges_to_multilines(resp)
-                if mls and mls.get("coordinates"):
-                    all_segments.extend(mls["coordinates"])  # type: ignore
-                print(f"  shape {i}: {len(pts)} pts -> matched")
-            except Exception as e:
-                print(f"  shape {i} error: {e}")
-
-    combined = {"type": "MultiLineString", "coordinates": all_segments} if all_segments else None
-    upsert_route_geom(route_id, combined, lines)
-    print(f"done {route_id} in {time.time()-t0:.1f}s; segments={len(all_segments)}")
+def _redis():
+    return redis.Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"), decode_responses=True)
 
 
 def main():
+    ensure_tables()
     only = os.getenv("ROUTE_IDS")
     if only:
         rids = [x.strip() for x in only.split(",") if x.strip()]
+    elif MATCH_CHANGED:
+        rids = sorted(_redis().smembers(CHANGED_ROUTES_KEY))
+        print(f"{len(rids)} routes changed since the last run")
     else:
         with conn() as c, c.cursor() as cur:
             cur.execute("SELECT DISTINCT route_id FROM trips ORDER BY route_id")
             rids = [r["route_id"] for r in cur.fetchall()]
-
-    # Skip routes that already have geometry unless overwrite requested
-    if not MATCH_OVERWRITE:
-        with conn() as c, c.cursor() as cur:
-            cur.execute("SELECT route_id FROM route_streets_geom")
-            have = {r["route_id"] for r in cur.fetchall()}
-        before = len(rids)
-        rids = [r for r in rids if r not in have]
-        print(f"skipping {before - len(rids)} routes with existing geometry (set MATCH_OVERWRITE=true to reprocess)")
-
     if not rids:
         print("nothing to process")
         return
 
-    # Parallel processing across routes
-    if MATCH_WORKERS <= 1:
-        for rid in rids:
-            process_route(rid)
-    else:
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-
-        print(f"processing {len(rids)} routes with {MATCH_WORKERS} workers")
-        with ThreadPoolExecutor(max_workers=MATCH_WORKERS) as ex:
-            futs = {ex.submit(process_route, rid): rid for rid in rids}
-            for fut in as_completed(futs):
-                rid = futs[fut]
-                try:
-                    fut.result()
-                except Exception as e:
-                    print(f"route {rid} failed: {e}")
+    # Shapes are matched once per distinct hash across all routes, then routes are assembled
+    # from the cache; a minor GTFS update only re-matches the shapes whose geometry changed
+    t0 = time.time()
+    by_route = route_shapes(rids)
+    all_shapes = {sid: h for shapes in by_route.values() for sid, h in shapes.items()}
+    matched = match_missing(all_shapes, overwrite=MATCH_OVERWRITE)
+
+    written = 0
+    done = []
+    for rid in rids:
+        if not by_route.get(rid):
+            print(f"no shapes for {rid}")
+            done.append(rid)
+            continue
+        try:
+            written += assemble_route(rid, list(by_route[rid].values()), force=MATCH_OVERWRITE)
+            done.append(rid)
+        except Exception as e:
+            print(f"route {rid} failed: {e}")
+    if MATCH_CHANGED and done:
+        # Failed routes stay in the set for the next run
+        _redis().srem(CHANGED_ROUTES_KEY, *done)
+    print(f"matched {matched} shapes, updated {written}/{len(rids)} routes in {time.time()-t0:.1f}s")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,41 @@
-from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, generate_latest
 from http.server import BaseHTTPRequestHandler, HTTPServer
-import threading
+import threading, time
 
 registry = CollectorRegistry()
 INGEST_CYCLE_SECONDS = Gauge("ingest_cycle_seconds", "Seconds per ingest loop", registry=registry)
 
+# Per feed and kind (vehicles, trip_updates, alerts, etas)
+_FEED = ["feed", "kind"]
+_FAST = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+FEED_FETCH_SECONDS = Histogram(
+    "feed_fetch_seconds", "Time to fetch a feed, including 304s, unchanged bodies and failures", _FEED,
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), registry=registry,
+)
+FEED_BYTES = Histogram(
+    "feed_bytes", "Size of new feed payloads", _FEED,
+    buckets=(1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7), registry=registry,
+)
+FEED_PARSE_SECONDS = Histogram("feed_parse_seconds", "Time to decode a new feed payload", _FEED, buckets=_FAST, registry=registry)
+FEED_ENTITIES = Histogram(
+    "feed_entities", "Entities decoded from a new feed payload", _FEED,
+    buckets=(0, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000), registry=registry,
+)
+REDIS_WRITE_SECONDS = Histogram("redis_write_seconds", "Time to write a feed's derived keys to Redis", _FEED, buckets=_FAST, registry=registry)
+FEED_HEADER_AGE_SECONDS = Histogram(
+    "feed_header_age_seconds", "Age of the FeedHeader timestamp when the feed was fetched", _FEED,
+    buckets=(1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 1800), registry=registry,
+)
+
+
+def observe_call(histogram: Histogram, feed: str, kind: str, fn, *args):
+    """fn(*args), observing its duration; run it inside to_thread so queueing is excluded."""
+    t0 = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        histogram.labels(feed, kind).observe(time.perf_counter() - t0)
+
 
 class Handler(BaseHTTPRequestHandler):
     def do_GET(self):
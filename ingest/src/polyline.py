@@ -0,0 +1,151 @@
+import struct
+import numpy as np
+
+
+def _varints(b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Zigzag-decoded varints of polyline characters (already minus 63), and the mask of
+    characters that end a varint."""
+    last = (b & 0x20) == 0
+    ends = np.flatnonzero(last)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    # 5-bit chunk position within its varint
+    pos = np.arange(b.size) - np.repeat(starts, ends - starts + 1)
+    values = np.add.reduceat((b & 0x1F) << (5 * pos), starts)
+    return (values >> 1) ^ -(values & 1), last
+
+
+def decode6(encoded: str | bytes) -> np.ndarray:
+    """Decode a polyline6 string into an (n, 2) float64 array of [lon, lat].
+
+    Every character is handled at once: varint boundaries come from the continuation bit,
+    each varint is summed with reduceat, and coordinates are a cumulative sum of deltas.
+    """
+    if isinstance(encoded, str):
+        encoded = encoded.encode("ascii")
+    b = np.frombuffer(encoded, dtype=np.uint8).astype(np.int64) - 63
+    if b.size == 0:
+        return np.empty((0, 2))
+    deltas, _ = _varints(b)
+    n = deltas.size // 2
+    coords = np.cumsum(deltas[:2 * n].reshape(n, 2), axis=0)
+    return coords[:, ::-1] * 1e-6
+
+
+def decode6_many(encoded: list[str]) -> list[np.ndarray]:
+    """decode6 for many strings in one pass (e.g. every edge of a match response)."""
+    if not encoded:
+        return []
+    joined = "".join(encoded).encode("ascii")
+    b = np.frombuffer(joined, dtype=np.uint8).astype(np.int64) - 63
+    if b.size == 0:
+        return [np.empty((0, 2)) for _ in encoded]
+    deltas, last = _varints(b)
+    # points per string: varints ending inside it, two per point
+    char_lens = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    char_ends = np.cumsum(char_lens)
+    counts = np.diff(np.concatenate(([0], np.cumsum(last)[char_ends - 1]))) // 2
+    coords = np.cumsum(deltas[:2 * counts.sum()].reshape(-1, 2), axis=0)
+    # Each string's deltas start from zero: remove the running sum carried in from before it
+    first = np.cumsum(counts) - counts
+    carry = np.zeros((len(encoded), 2), dtype=np.int64)
+    nz = first > 0
+    carry[nz] = coords[first[nz] - 1]
+    coords = coords - np.repeat(carry, counts, axis=0)
+    return np.split(coords[:, ::-1] * 1e-6, np.cumsum(counts)[:-1])
+
+
+def encode6(coords) -> str:
+    """Inverse of decode6, for [lon, lat] pairs (used by tests and benchmarks)."""
+    out = []
+    plat = plon = 0
+    for lon, lat in coords:
+        ilat, ilon = round(lat * 1e6), round(lon * 1e6)
+        for d in (ilat - plat, ilon - plon):
+            v = ~(d << 1) if d < 0 else d << 1
+            while v >= 0x20:
+                out.append(chr((0x20 | (v & 0x1F)) + 63))
+                v >>= 5
+            out.append(chr(v + 63))
+        plat, plon = ilat, ilon
+    return "".join(out)
+
+
+def merge_lines(lines: list[np.ndarray]) -> list[np.ndarray]:
+    """Join consecutive lines where one ends exactly where the next starts."""
+    lines = [ln for ln in lines if len(ln) >= 2]
+    if not lines:
+        return []
+    lens = np.fromiter((len(ln) for ln in lines), dtype=np.int64, count=len(lines))
+    pts = np.concatenate(lines)
+    starts = np.cumsum(lens) - lens
+    joined = np.zeros(len(lines), dtype=bool)
+    joined[1:] = (pts[starts[1:]] == pts[starts[1:] - 1]).all(axis=1)
+    # Drop the duplicated first vertex of joined lines, break before the others
+    keep = np.ones(len(pts), dtype=bool)
+    keep[starts[joined]] = False
+    breaks = starts[1:][~joined[1:]]
+    new_pos = np.cumsum(keep) - 1
+    return np.split(pts[keep], new_pos[breaks])
+
+
+def simplify(line: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Douglas-Peucker on [lon, lat] with a tolerance in meters (local equirectangular).
+
+    Runs breadth-first: each round splits every still-too-coarse span at its farthest
+    vertex, with all spans handled in the same vectorized pass over their vertices.
+    """
+    n = len(line)
+    if tolerance_m <= 0 or n < 3:
+        return line
+    lat0 = np.radians(line[:, 1].mean())
+    x = line[:, 0] * (111_320.0 * np.cos(lat0))
+    y = line[:, 1] * 110_540.0
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    # Interior vertices of spans that may still need splitting
+    pending = ~keep
+    tol2 = tolerance_m * tolerance_m
+    while True:
+        p = np.flatnonzero(pending)
+        if p.size == 0:
+            return line[keep]
+        kept = np.flatnonzero(keep)
+        span = np.searchsorted(kept, p, side="right") - 1
+        i, j = kept[span], kept[span + 1]
+        ax, ay = x[i], y[i]
+        sx, sy = x[j] - ax, y[j] - ay
+        rx, ry = x[p] - ax, y[p] - ay
+        seg2 = sx * sx + sy * sy
+        t = np.clip((rx * sx + ry * sy) / np.where(seg2 == 0, 1, seg2), 0.0, 1.0)
+        ox, oy = rx - t * sx, ry - t * sy
+        d2 = ox * ox + oy * oy
+        # p is sorted, so each span's pending vertices are one contiguous group
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(span)) + 1))
+        group = np.repeat(np.arange(starts.size), np.diff(np.append(starts, p.size)))
+        worst = np.maximum.reduceat(d2, starts)
+        split = (worst > tol2)[group]
+        # Spans within tolerance are final; the others split at their first farthest vertex
+        pending[p[~split]] = False
+        hit = np.flatnonzero(split & (d2 == worst[group]))
+        _, first = np.unique(group[hit], return_index=True)
+        new = p[hit[first]]
+        keep[new] = True
+        pending[new] = False
+
+
+def multilinestring_wkb(lines: list[np.ndarray]) -> bytes:
+    """Little-endian WKB MultiLineString, built from the arrays without a JSON round trip."""
+    parts = [struct.pack("<BII", 1, 5, len(lines))]
+    for ln in lines:
+        parts.append(struct.pack("<BII", 1, 2, len(ln)))
+        parts.append(np.ascontiguousarray(ln, dtype="<f8").tobytes())
+    return b"".join(parts)
+
+
+def linestring_from_wkb(wkb: bytes) -> np.ndarray:
+    """(n, 2) [lon, lat] array from a 2-D WKB LineString (as ST_AsBinary returns it)."""
+    order = "<" if wkb[0] == 1 else ">"
+    n = struct.unpack_from(f"{order}I", wkb, 5)[0]
+    return np.frombuffer(wkb, dtype=f"{order}f8", count=2 * n, offset=9).reshape(n, 2)
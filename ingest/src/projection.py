@@ -0,0 +1,246 @@
+"""Snap vehicles onto their shapes: distance along the shape and distance off it.
+
+Shapes are loaded once per seed into flat segment arrays in a local planar frame
+(meters, equirectangular around the network's mean latitude; well under 1% error
+across a metro area) with the cumulative distance at each segment start. A uniform
+grid keyed by (shape, cell) lists each shape's segments per cell, so each cycle the
+whole fleet is projected in a handful of NumPy operations: gather the segments of
+the vehicle's shape (or of each shape of its route when the trip is unknown) in the
+3x3 cells around it, and take the nearest. That is only guaranteed to be the nearest
+segment when it lies within one cell of the vehicle; vehicles farther than that from
+their shape fall back to a scan of that shape's segments.
+"""
+
+import os, threading, time
+import numpy as np
+import psycopg2
+from .db import conn
+from .polyline import linestring_from_wkb
+
+PROJECTION_CELL_METERS = float(os.getenv("PROJECTION_CELL_METERS", "100"))
+# Retry a failed shape load (e.g. no static GTFS seeded yet) after this long
+PROJECTION_RETRY_SECONDS = 60
+
+EARTH_RADIUS_M = 6_371_008.8
+_KY = np.pi / 180 * EARTH_RADIUS_M
+_OFF = 1 << 20  # keeps cell coordinates positive when packed with the shape into one int64 key
+# Cell coordinates get 21 bits each in the key: |x|, |y| reach ~2e7 m, so cells must be
+# at least 2e7 / 2**20 ~ 19 m wide for them to fit
+MIN_CELL_METERS = 20.0
+
+SHAPES_SQL = "SELECT shape_id, ST_AsBinary(geom) AS wkb FROM shapes WHERE geom IS NOT NULL"
+TRIPS_SQL = "SELECT trip_id, route_id, shape_id FROM trips WHERE shape_id IS NOT NULL"
+
+
+def _cell_key(shape: np.ndarray, cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+    return (shape << 42) | ((cx + _OFF) << 21) | (cy + _OFF)
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Concatenated aranges [starts[i], starts[i] + counts[i]) and the i of each element."""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets, owner
+
+
+class ShapeIndex:
+    """Segments of every shape plus a grid index over them."""
+
+    def __init__(self, shapes: dict[str, np.ndarray], route_shapes: dict[str, list[str]] | None = None,
+                 cell: float = PROJECTION_CELL_METERS):
+        self.cell = max(float(cell), MIN_CELL_METERS)
+        self.shape_ids = [sid for sid, ln in shapes.items() if len(ln) >= 2]
+        self.shape_index = {sid: i for i, sid in enumerate(self.shape_ids)}
+        lines = [np.asarray(shapes[sid], dtype=np.float64) for sid in self.shape_ids]
+        lat0 = float(np.concatenate([ln[:, 1] for ln in lines]).mean()) if lines else 0.0
+        self.kx, self.ky = _KY * np.cos(np.radians(lat0)), _KY
+
+        x0, y0, x1, y1, start, owner = [], [], [], [], [], []
+        self.shape_range = np.zeros((len(lines), 2), dtype=np.int64)
+        self.shape_length = np.zeros(len(lines))
+        n = 0
+        for i, ln in enumerate(lines):
+            x, y = ln[:, 0] * self.kx, ln[:, 1] * self.ky
+            seg = np.hypot(np.diff(x), np.diff(y))
+            cum = np.concatenate(([0.0], np.cumsum(seg)))
+            x0.append(x[:-1]); y0.append(y[:-1]); x1.append(x[1:]); y1.append(y[1:])
+            start.append(cum[:-1])
+            owner.append(np.full(len(seg), i, dtype=np.int64))
+            self.shape_range[i] = (n, n + len(seg))
+            self.shape_length[i] = cum[-1]
+            n += len(seg)
+        cat = (lambda a, dt=np.float64: np.concatenate(a) if a else np.zeros(0, dtype=dt))
+        self.x0, self.y0, self.x1, self.y1 = cat(x0), cat(y0), cat(x1), cat(y1)
+        self.start = cat(start)
+        self.seg_shape = cat(owner, np.int64)
+        self.dx, self.dy = self.x1 - self.x0, self.y1 - self.y0
+        self.len2 = self.dx * self.dx + self.dy * self.dy
+
+        # Route -> shape indexes as CSR arrays, for trips the schedule does not know
+        route_shapes = route_shapes or {}
+        self.route_index = {rid: i for i, rid in enumerate(route_shapes)}
+        per_route = [[self.shape_index[s] for s in route_shapes[rid] if s in self.shape_index] for rid in self.route_index]
+        self.route_count = np.array([len(p) for p in per_route], dtype=np.int64)
+        self.route_start = np.cumsum(self.route_count) - self.route_count
+        self.route_shapes = np.array([s for p in per_route for s in p], dtype=np.int64)
+        self._build_grid()
+
+    def _build_grid(self):
+        c = self.cell
+        cx0 = np.floor(np.minimum(self.x0, self.x1) / c).astype(np.int64)
+        cx1 = np.floor(np.maximum(self.x0, self.x1) / c).astype(np.int64)
+        cy0 = np.floor(np.minimum(self.y0, self.y1) / c).astype(np.int64)
+        cy1 = np.floor(np.maximum(self.y0, self.y1) / c).astype(np.int64)
+        # Every cell of each segment's bounding box; segments are mostly far shorter than a cell
+        nx, ny = cx1 - cx0 + 1, cy1 - cy0 + 1
+        flat, seg = _ranges(np.zeros(len(nx), dtype=np.int64), nx * ny)
+        keys = _cell_key(self.seg_shape[seg], cx0[seg] + flat // ny[seg], cy0[seg] + flat % ny[seg])
+        order = np.argsort(keys, kind="stable")
+        keys, self.cell_segs = keys[order], seg[order]
+        self.cell_keys, self.cell_start, counts = np.unique(keys, return_index=True, return_counts=True)
+        self.cell_end = self.cell_start + counts
+        # Segment geometry copied into cell order, so a lookup reads contiguous rows
+        self.cell_geom = np.stack((self.x0, self.y0, self.dx, self.dy, self.len2), axis=1)[self.cell_segs]
+
+    def _nearest(self, px: np.ndarray, py: np.ndarray, seg: np.ndarray):
+        t = ((px - self.x0[seg]) * self.dx[seg] + (py - self.y0[seg]) * self.dy[seg]) / np.maximum(self.len2[seg], 1e-9)
+        t = np.clip(t, 0.0, 1.0)
+        ex = self.x0[seg] + t * self.dx[seg] - px
+        ey = self.y0[seg] + t * self.dy[seg] - py
+        return t, ex * ex + ey * ey
+
+    def _candidates(self, shape: np.ndarray, route: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(point, shape) pairs, ordered by point: the trip's shape, else every shape of the route."""
+        known = np.flatnonzero(shape >= 0)
+        by_route = np.flatnonzero((shape < 0) & (route >= 0))
+        counts = self.route_count[route[by_route]] if len(self.route_count) else np.zeros(len(by_route), dtype=np.int64)
+        idx, owner = _ranges(self.route_start[route[by_route]] if len(self.route_start) else counts, counts)
+        pt = np.concatenate((known, by_route[owner]))
+        sh = np.concatenate((shape[known], self.route_shapes[idx] if len(idx) else idx))
+        order = np.argsort(pt, kind="stable")
+        return pt[order], sh[order]
+
+    def project(self, lon, lat, shape=None, route=None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Batch projection of points onto shapes.
+
+        `shape`/`route` are per-point indexes into `shape_ids`/`route_index` (-1 when
+        unknown). Points with neither are skipped: the nearest shape could belong to any
+        line. Returns (shape index or -1, meters along the shape, meters off it).
+        """
+        px = np.asarray(lon, dtype=np.float64) * self.kx
+        py = np.asarray(lat, dtype=np.float64) * self.ky
+        n = len(px)
+        shape = np.full(n, -1, dtype=np.int64) if shape is None else np.asarray(shape, dtype=np.int64)
+        route = np.full(n, -1, dtype=np.int64) if route is None else np.asarray(route, dtype=np.int64)
+        out_shape = np.full(n, -1, dtype=np.int64)
+        out_along = np.full(n, np.nan)
+        out_off = np.full(n, np.nan)
+        if n == 0 or len(self.cell_keys) == 0:
+            return out_shape, out_along, out_off
+
+        # Each candidate shape's segments in the 3x3 cells around the point
+        pt, sh = self._candidates(shape, route)
+        cx = np.floor(px[pt] / self.cell).astype(np.int64)
+        cy = np.floor(py[pt] / self.cell).astype(np.int64)
+        d = np.array([-1, 0, 1], dtype=np.int64)
+        keys = _cell_key(sh[:, None, None], cx[:, None, None] + d[None, :, None], cy[:, None, None] + d[None, None, :])
+        keys = keys.reshape(len(pt), 9)
+        pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        hit = self.cell_keys[pos] == keys
+        counts = np.where(hit, self.cell_end[pos] - self.cell_start[pos], 0).ravel()
+        idx, owner = _ranges(self.cell_start[pos].ravel(), counts)
+        veh = pt[owner // 9]
+        seg = self.cell_segs[idx]
+        g = self.cell_geom[idx]
+        vx, vy = px[veh], py[veh]
+        t = np.clip(((vx - g[:, 0]) * g[:, 2] + (vy - g[:, 1]) * g[:, 3]) / np.maximum(g[:, 4], 1e-9), 0.0, 1.0)
+        ex = g[:, 0] + t * g[:, 2] - vx
+        ey = g[:, 1] + t * g[:, 3] - vy
+        d2 = ex * ex + ey * ey
+
+        # Candidates are grouped by point: the first minimum of each group wins
+        if len(veh):
+            starts = np.flatnonzero(np.r_[True, veh[1:] != veh[:-1]])
+            group = np.cumsum(np.r_[True, veh[1:] != veh[:-1]]) - 1
+            best = np.flatnonzero(d2 == np.minimum.reduceat(d2, starts)[group])
+            first = best[np.r_[True, group[best][1:] != group[best][:-1]]]
+            best_veh, best_seg = veh[first], seg[first]
+            out_shape[best_veh] = self.seg_shape[best_seg]
+            out_along[best_veh] = self.start[best_seg] + t[first] * np.sqrt(g[first, 4])
+            out_off[best_veh] = np.sqrt(d2[first])
+
+        # Far off their shape (detour, layover): a nearer segment may lie outside the 3x3
+        # cells, so scan the candidate shapes themselves
+        missed = np.zeros(n, dtype=bool)
+        missed[pt] = True
+        missed &= (out_shape < 0) | (out_off > self.cell)
+        for i in np.flatnonzero(missed):
+            shapes = sh[pt == i]
+            segs = np.concatenate([np.arange(*self.shape_range[s]) for s in shapes])
+            t, d2 = self._nearest(px[i], py[i], segs)
+            j = int(np.argmin(d2))
+            out_shape[i] = self.seg_shape[segs[j]]
+            out_along[i] = self.start[segs[j]] + t[j] * np.sqrt(self.len2[segs[j]])
+            out_off[i] = np.sqrt(d2[j])
+        return out_shape, out_along, out_off
+
+
+def load_shape_index(connect=conn) -> tuple[ShapeIndex, dict[str, str]]:
+    """Every shape in the database, and trip_id -> shape_id."""
+    c = connect()
+    try:
+        with c, c.cursor() as cur:
+            cur.execute(SHAPES_SQL)
+            shapes = {r["shape_id"]: linestring_from_wkb(bytes(r["wkb"])) for r in cur.fetchall()}
+            cur.execute(TRIPS_SQL)
+            trip_shape = {}
+            route_shapes: dict[str, set[str]] = {}
+            for r in cur.fetchall():
+                trip_shape[r["trip_id"]] = r["shape_id"]
+                route_shapes.setdefault(r["route_id"], set()).add(r["shape_id"])
+    finally:
+        c.close()
+    return ShapeIndex(shapes, {rid: sorted(s) for rid, s in route_shapes.items()}), trip_shape
+
+
+class ProjectionEngine:
+    """Keeps a ShapeIndex for the current seed and snaps vehicle records onto it."""
+
+    def __init__(self, connect=conn):
+        self._connect = connect
+        self.index: ShapeIndex | None = None
+        self.trip_shape: dict[str, str] = {}
+        self._seed = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, seed):
+        """Reload shapes when the seed version changed; feeds share one engine."""
+        if self.index is not None and seed == self._seed:
+            return
+        with self._lock:
+            if (self.index is not None and seed == self._seed) or time.monotonic() < self._retry_at:
+                return
+            try:
+                self.index, self.trip_shape = load_shape_index(self._connect)
+                self._seed = seed
+            except psycopg2.Error as e:
+                print("projection shape load error:", e or type(e).__name__)
+                self._retry_at = time.monotonic() + PROJECTION_RETRY_SECONDS
+
+    def project(self, feed: str, records) -> None:
+        """Set shape_id, shape_dist and off_route on each record (None when unknown)."""
+        index = self.index
+        if index is None or not records:
+            return
+        shape = [index.shape_index.get(self.trip_shape.get(f"{feed}:{rec.trip_id}"), -1) if rec.trip_id else -1
+                 for rec in records]
+        route = [index.route_index.get(f"{feed}:{rec.route_id}", -1) for rec in records]
+        sid, along, off = index.project([rec.lon for rec in records], [rec.lat for rec in records], shape, route)
+        for rec, s, a, o in zip(records, sid.tolist(), along.tolist(), off.tolist()):
+            if s < 0:
+                rec.shape_id = rec.shape_dist = rec.off_route = None
+            else:
+                rec.shape_id = index.shape_ids[s]
+                rec.shape_dist = round(a, 1)
+                rec.off_route = round(o, 1)
@@ -0,0 +1,30 @@
+import asyncio
+
+
+def next_deadline(scheduled: float, period: float, now: float) -> float:
+    """Next tick on the fixed grid scheduled + k*period that is still in the future.
+
+    Ticks missed while a job overran are skipped rather than fired back to back.
+    """
+    nxt = scheduled + period
+    if nxt <= now:
+        nxt += ((now - nxt) // period + 1) * period
+    return nxt
+
+
+async def run_every(name: str, period: float, job):
+    """Run `job()` every `period` seconds on a drift-free schedule.
+
+    Each task owns its own schedule, so a slow run only pushes back its own next tick.
+    """
+    loop = asyncio.get_running_loop()
+    scheduled = loop.time()
+    while True:
+        try:
+            await job()
+        except asyncio.TimeoutError:
+            print(f"{name} missed its deadline")
+        except Exception as e:
+            print(f"{name} error:", e)
+        scheduled = next_deadline(scheduled, period, loop.time())
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
@@ -1,30 +1,113 @@
 import json, time, os, redis
 from prometheus_client import Gauge
+from .snapshot import encode_snapshot
 
 r = redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://redis:6379/0"), decode_responses=True)
 
+# Vehicles live in one key each (vehicle:{feed}:{id}) and are listed in the
+# vehicles:index sorted set, scored by the last time ingest saw them.
+# Secondary indexes use the same "{feed}:{id}" members: vehicles:geo (GEO set)
+# and vehicles:route:{route_id} (sorted set scored by last-seen time).
+VEHICLE_TTL = 30
+VEHICLE_INDEX = "vehicles:index"
+VEHICLE_GEO = "vehicles:geo"
+# Bumped whenever the vehicle set changes; lets readers cache anything derived from it
+VEHICLE_GEN = "vehicles:gen"
+# Pub/sub channel carrying {"ts", "upserts": [vehicle], "removes": ["{feed}:{id}"]} per write
+VEHICLE_DELTAS = "vehicles:deltas"
+# Columnar MessagePack encoding of the whole fleet (see snapshot.py), rebuilt once per union
+# tick after vehicles changed; its own generation is bumped in the same transaction
+VEHICLE_SNAPSHOT = "vehicles:snapshot"
+VEHICLE_SNAPSHOT_GEN = "vehicles:snapshot:gen"
 
-def write_current_vehicles(vehicles):
-    r.set("vehicles:current", json.dumps(vehicles), ex=30)
+# Predictions outlive a couple of missed ETA cycles, not more
+ETA_TTL = 180
+# Bumped on every prediction write so the API can cache boards between cycles
+ETA_GEN = "trip_eta:gen"
+
+# Alerts outlive a few missed polls; the index is rewritten from the last payload each poll
+ALERTS_TTL = 300
+
+# feed -> alerts:* key -> body written by the last alerts poll
+_alert_keys: dict[str, dict[str, str]] = {}
+# feed -> trip_eta:{stop_id} keys written by the last ETA cycle
+_eta_keys: dict[str, set[str]] = {}
+# feed -> vehicle id -> when its key was last written or had its TTL extended
+_written: dict[str, dict[str, float]] = {}
+# feed -> vehicle id -> route_id it is currently indexed under
+_route_of: dict[str, dict[str, str]] = {}
+# feed -> vehicle id -> the vehicle as last written, for the snapshot
+_vehicles: dict[str, dict[str, dict]] = {}
+# When any feed last changed its vehicles, and when the snapshot was last built
+_vehicles_changed_at = 0.0
+_snapshot_built_at = 0.0
 
 
 def mark_ingest_now():
     r.set("ingest:last_ts", int(time.time()))
 
 
-def write_trip_updates_raw(raw: bytes | str, ttl=120):
-    # Store raw protobuf (or JSON string) for future processing
-    if isinstance(raw, bytes):
-        r.set("gtfsrt:trip_updates", raw, ex=ttl)
-    else:
-        r.set("gtfsrt:trip_updates", raw, ex=ttl)
+def read_seed_version() -> str | None:
+    # Bumped by load_gtfs whenever static rows change
+    return r.get("gtfs:seed_version")
+
+
+def write_trip_updates_raw(feed: str, raw: bytes | str, ttl=120):
+    # Raw protobuf per feed, kept for debugging; predictions go to trip_eta:{stop_id}
+    r.set(f"gtfsrt:trip_updates:{feed}", raw, ex=ttl)
+
+
+def touch_trip_updates_raw(feed: str, ttl=120):
+    r.expire(f"gtfsrt:trip_updates:{feed}", ttl)
+
+
+def write_stop_etas(feed: str, by_stop: dict[str, list[tuple[int, str]]], ttl=ETA_TTL):
+    """Replace the feed's per-stop prediction sets in one transaction.
 
+    Stops are feed-prefixed, so each trip_eta:{stop_id} key belongs to one feed and
+    can be rebuilt wholesale; stops that lost all predictions are deleted.
+    """
+    keys = {f"trip_eta:{stop}": {m: eta for eta, m in preds} for stop, preds in by_stop.items() if preds}
+    stale = _eta_keys.get(feed, set()) - keys.keys()
+    pipe = r.pipeline(transaction=True)
+    if stale:
+        pipe.delete(*stale)
+    for key, scored in keys.items():
+        pipe.delete(key)
+        pipe.zadd(key, scored)
+        pipe.expire(key, ttl)
+    pipe.incr(ETA_GEN)
+    pipe.execute()
+    _eta_keys[feed] = set(keys)
 
-def write_alerts_raw(raw: bytes | str, ttl=300):
-    if isinstance(raw, bytes):
-        r.set("gtfsrt:alerts", raw, ex=ttl)
-    else:
-        r.set("gtfsrt:alerts", raw, ex=ttl)
+
+def write_alerts_raw(feed: str, raw: bytes | str, ttl=ALERTS_TTL):
+    # Raw protobuf per feed, kept for debugging; lookups go to the alerts:* index
+    r.set(f"gtfsrt:alerts:{feed}", raw, ex=ttl)
+
+
+def touch_alerts_raw(feed: str, ttl=ALERTS_TTL):
+    r.expire(f"gtfsrt:alerts:{feed}", ttl)
+
+
+def write_alert_index(feed: str, index: dict[str, str], ttl=ALERTS_TTL):
+    """Bring the feed's alerts:* keys in line with `index` (key -> JSON array).
+
+    Only keys whose alerts changed are rewritten; the rest just have their TTL extended,
+    and keys whose alerts all ended are deleted.
+    """
+    last = _alert_keys.get(feed, {})
+    pipe = r.pipeline(transaction=True)
+    stale = last.keys() - index.keys()
+    if stale:
+        pipe.delete(*stale)
+    for key, body in index.items():
+        if last.get(key) == body:
+            pipe.expire(key, ttl)
+        else:
+            pipe.set(key, body, ex=ttl)
+    pipe.execute()
+    _alert_keys[feed] = dict(index)
 
 
 def write_derived_routes(route_ids):
@@ -38,26 +121,126 @@ def write_derived_routes(route_ids):
         pass
 
 
-def write_current_vehicles_for(feed: str, vehicles):
-    r.set(f"vehicles:current:{feed}", json.dumps(vehicles), ex=30)
+def _vehicle_key(feed: str, vid: str) -> str:
+    return f"vehicle:{feed}:{vid}"
 
 
-def update_vehicles_union(feeds: list[str]):
-    all_vs = []
-    for f in feeds:
-        raw = r.get(f"vehicles:current:{f}")
-        if not raw:
-            continue
-        try:
-            items = json.loads(raw)
-            # annotate with feed for downstream display
-            for it in items:
-                if isinstance(it, dict):
-                    it.setdefault("feed", f)
-            all_vs.extend(items)
-        except Exception:
-            continue
-    write_current_vehicles(all_vs)
+def _apply_vehicle_changes(feed: str, changed: list[dict], removed: list[str]):
+    """Write changed vehicles, drop removed ones and refresh the index in one round trip.
+
+    Unchanged vehicles are not rewritten; their TTL is only extended once it is half spent.
+    """
+    global _vehicles_changed_at
+    now = time.time()
+    written = _written.setdefault(feed, {})
+    route_of = _route_of.setdefault(feed, {})
+    current = _vehicles.setdefault(feed, {})
+    pipe = r.pipeline(transaction=False)
+    encoded = []
+    for v in changed:
+        vid = v["id"]
+        member = f"{feed}:{vid}"
+        current[vid] = v = {**v, "feed": feed}
+        body = json.dumps(v)
+        encoded.append(body)
+        pipe.set(_vehicle_key(feed, vid), body, ex=VEHICLE_TTL)
+        pipe.geoadd(VEHICLE_GEO, (v["lon"], v["lat"], member))
+        old_route = route_of.get(vid)
+        if old_route is not None and old_route != v["route_id"]:
+            pipe.zrem(f"vehicles:route:{old_route}", member)
+        route_of[vid] = v["route_id"]
+        written[vid] = now
+    if removed:
+        members = [f"{feed}:{vid}" for vid in removed]
+        for vid, member in zip(removed, members):
+            written.pop(vid, None)
+            current.pop(vid, None)
+            route = route_of.pop(vid, None)
+            if route is not None:
+                pipe.zrem(f"vehicles:route:{route}", member)
+        pipe.zrem(VEHICLE_INDEX, *members)
+        pipe.zrem(VEHICLE_GEO, *members)
+        pipe.delete(*[_vehicle_key(feed, vid) for vid in removed])
+    for vid, at in written.items():
+        if now - at > VEHICLE_TTL / 2:
+            pipe.expire(_vehicle_key(feed, vid), VEHICLE_TTL)
+            written[vid] = now
+    if written:
+        pipe.zadd(VEHICLE_INDEX, {f"{feed}:{vid}": now for vid in written})
+        by_route: dict[str, dict[str, float]] = {}
+        for vid, route in route_of.items():
+            by_route.setdefault(route, {})[f"{feed}:{vid}"] = now
+        for route, scored in by_route.items():
+            key = f"vehicles:route:{route}"
+            pipe.zadd(key, scored)
+            pipe.zremrangebyscore(key, "-inf", now - VEHICLE_TTL)
+            pipe.expire(key, VEHICLE_TTL)
+    pipe.set("ingest:last_ts", int(now))
+    if encoded or removed:
+        _vehicles_changed_at = now
+        pipe.incr(VEHICLE_GEN)
+        # Vehicles are already JSON; splice them in rather than encoding twice
+        removes = json.dumps([f"{feed}:{vid}" for vid in removed])
+        pipe.publish(VEHICLE_DELTAS, f'{{"ts":{int(now)},"upserts":[{",".join(encoded)}],"removes":{removes}}}')
+    pipe.execute()
+
+
+def _live_vehicles(now: float) -> list[dict]:
+    # Every feed's vehicles, minus those of feeds that stopped refreshing them. Other feeds
+    # write from their own threads; list() copies each dict in one step under the GIL
+    return [v for feed, vs in list(_vehicles.items()) for vid, v in list(vs.items())
+            if now - _written.get(feed, {}).get(vid, 0) <= VEHICLE_TTL]
+
+
+def write_vehicle_snapshot():
+    """Rebuild vehicles:snapshot if any feed's vehicles changed since the last build, or
+    every half TTL anyway so vehicles of a stalled feed age out of it.
+
+    Feeds write from their own threads; building here, once per union tick, encodes the
+    fleet once however many feeds changed. Blob and generation are set in one transaction,
+    so a reader that fetches both never pairs a snapshot with another one's generation.
+    """
+    global _snapshot_built_at
+    now = time.time()
+    if _vehicles_changed_at < _snapshot_built_at and now - _snapshot_built_at < VEHICLE_TTL / 2:
+        return
+    # Taken before encoding: a write that lands meanwhile triggers the next build
+    _snapshot_built_at = now
+    blob = encode_snapshot(_live_vehicles(now), now)
+    pipe = r.pipeline(transaction=True)
+    pipe.set(VEHICLE_SNAPSHOT, blob, ex=VEHICLE_TTL)
+    pipe.incr(VEHICLE_SNAPSHOT_GEN)
+    pipe.execute()
+
+
+def prune_vehicle_indexes():
+    """Drop index entries for vehicles nobody has refreshed within VEHICLE_TTL (e.g. a feed
+    that stopped or an ingest restart); their keys have already expired."""
+    cutoff = time.time() - VEHICLE_TTL
+    stale = r.zrangebyscore(VEHICLE_INDEX, "-inf", cutoff)
+    if not stale:
+        return
+    pipe = r.pipeline(transaction=False)
+    pipe.zrem(VEHICLE_GEO, *stale)
+    pipe.zremrangebyscore(VEHICLE_INDEX, "-inf", cutoff)
+    pipe.execute()
+
+
+def write_vehicle_changes_for(feed: str, changed: list[dict], removed: list[str]):
+    # Incremental update from VehicleDecoder: only moved vehicles are serialized
+    _apply_vehicle_changes(feed, changed, removed)
+
+
+def write_current_vehicles_for(feed: str, vehicles: list[dict]):
+    # Full replacement (e.g. mock data): anything not in `vehicles` is removed
+    ids = {v["id"] for v in vehicles}
+    removed = [vid for vid in _written.get(feed, {}) if vid not in ids]
+    _apply_vehicle_changes(feed, vehicles, removed)
+
+
+def touch_current_vehicles_for(feed: str):
+    # Payload unchanged upstream; keep the feed's vehicles alive without rewriting them
+    _apply_vehicle_changes(feed, [], [])
 
 
 def write_derived_routes_for(feed: str, route_ids):
@@ -0,0 +1,54 @@
+import json
+from google.transit import gtfs_realtime_pb2 as gtfs
+from ingest.src.alerts import decode_alerts, index_alerts
+
+
+def _feed() -> bytes:
+    msg = gtfs.FeedMessage()
+    msg.header.gtfs_realtime_version = "2.0"
+    a = msg.entity.add(id="detour").alert
+    a.effect = gtfs.Alert.DETOUR
+    a.header_text.translation.add(text="Desvío", language="es")
+    a.header_text.translation.add(text="Detour", language="en")
+    a.active_period.add(start=1000, end=2000)
+    a.informed_entity.add(route_id="22")
+    a.informed_entity.add(stop_id="s1")
+    t = msg.entity.add(id="cancel").alert
+    sel = t.informed_entity.add()
+    sel.trip.trip_id = "t9"
+    sel.trip.route_id = "22"
+    c = msg.entity.add(id="closure").alert
+    c.informed_entity.add(route_id="22", stop_id="s2")
+    w = msg.entity.add(id="weather").alert
+    w.informed_entity.add(agency_id="MTA")
+    w.active_period.add(start=3000)
+    return msg.SerializeToString()
+
+
+def test_decode_builds_prefixed_keys_and_picks_english():
+    alerts = decode_alerts(_feed(), "bus")
+    detour, cancel, closure, weather = alerts
+    assert detour[0]["id"] == "bus:detour" and detour[0]["header"] == "Detour" and detour[0]["effect"] == "DETOUR"
+    assert detour[2] == ["alerts:route:bus:22", "alerts:stop:bus:s1"]
+    assert cancel[2] == ["alerts:trip:bus:t9", "alerts:route:bus:22"]
+    assert weather[2] == ["alerts:agency:bus"]
+
+
+def test_combined_selector_is_indexed_under_its_narrowest_entity():
+    closure = decode_alerts(_feed(), "bus")[2]
+    # One stop of route 22, not the whole route
+    assert closure[2] == ["alerts:stop:bus:s2"]
+    assert closure[0]["informed_entity"] == [{"route_id": "bus:22", "stop_id": "bus:s2"}]
+
+
+def test_index_respects_active_periods():
+    alerts = decode_alerts(_feed(), "bus")
+    at_1500 = index_alerts(alerts, 1500)
+    # The trip's cancellation shows on its route; the single-stop closure does not
+    assert [a["id"] for a in json.loads(at_1500["alerts:route:bus:22"])] == ["bus:detour", "bus:cancel"]
+    assert [a["id"] for a in json.loads(at_1500["alerts:trip:bus:t9"])] == ["bus:cancel"]
+    assert [a["id"] for a in json.loads(at_1500["alerts:stop:bus:s2"])] == ["bus:closure"]
+    assert "alerts:agency:bus" not in at_1500
+    at_3500 = index_alerts(alerts, 3500)
+    assert [a["id"] for a in json.loads(at_3500["alerts:route:bus:22"])] == ["bus:cancel"]
+    assert "alerts:stop:bus:s1" not in at_3500 and "alerts:agency:bus" in at_3500
@@ -0,0 +1,18 @@
+from datetime import date
+from ingest.src.archive import partition_name, position_rows
+from ingest.src.decode import VehicleRecord
+
+
+def test_position_rows_are_copy_text():
+    rec = VehicleRecord("v\t1", "10", 39.29, -76.61, None, 90, 1_700_000_000, trip_id="")
+    rec.shape_id, rec.shape_dist, rec.off_route = "lb:s1", 1234.5, 3.2
+    ((day, line),) = position_rows("lb", [rec])
+    assert day == date(2023, 11, 14)
+    assert line.split("\t") == [
+        "2023-11-14T22:13:20+00:00", "lb", "v\\t1", "lb:10", r"\N", "39.29", "-76.61", r"\N", "90",
+        "lb:s1", "1234.5", "3.2",
+    ]
+
+
+def test_partition_name_is_per_day():
+    assert partition_name(date(2024, 3, 9)) == "vehicle_positions_20240309"
@@ -0,0 +1,62 @@
+from google.transit import gtfs_realtime_pb2 as gtfs
+from ingest.src.decode import VehicleDecoder, decode_vehicles, header_timestamp
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def test_header_timestamp_read_from_wire():
+    # FeedHeader{gtfs_realtime_version="2.0", timestamp=1700000000}
+    header = b"\x0a\x032.0" + b"\x18" + _varint(1700000000)
+    # FeedMessage{header=..., entity=<opaque>}
+    raw = b"\x0a" + _varint(len(header)) + header + b"\x12\x02\x0a\x00"
+    assert header_timestamp(raw) == 1700000000
+
+
+def test_header_timestamp_missing():
+    assert header_timestamp(b"") is None
+    assert header_timestamp(b"\x0a\x05\x0a\x032.0") is None
+
+
+def _feed(positions: dict[str, tuple[float, float]], ts=1700000000) -> bytes:
+    feed = gtfs.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = ts
+    for vid, (lat, lon) in positions.items():
+        ent = feed.entity.add()
+        ent.id = vid
+        ent.vehicle.vehicle.id = vid
+        ent.vehicle.trip.route_id = "10"
+        ent.vehicle.position.latitude = lat
+        ent.vehicle.position.longitude = lon
+        ent.vehicle.timestamp = ts
+    return feed.SerializeToString()
+
+
+def test_decode_vehicles_matches_api_shape():
+    (rec,) = decode_vehicles(_feed({"a": (39.29, -76.61)}))
+    d = rec.to_dict()
+    assert d["id"] == "a" and d["route_id"] == "10" and d["ts"] == 1700000000
+    assert d["speed"] is None and d["heading"] is None
+
+
+def test_decoder_reports_only_changes():
+    dec = VehicleDecoder()
+    changed, removed = dec.decode(_feed({"a": (39.29, -76.61), "b": (39.30, -76.60)}))
+    assert {r.id for r in changed} == {"a", "b"} and removed == []
+
+    changed, removed = dec.decode(_feed({"a": (39.29, -76.61), "b": (39.31, -76.60)}))
+    assert [r.id for r in changed] == ["b"] and removed == []
+
+    changed, removed = dec.decode(_feed({"b": (39.31, -76.60)}))
+    assert changed == [] and removed == ["a"]
+    assert set(dec.records) == {"b"}
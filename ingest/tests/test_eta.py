@@ -0,0 +1,100 @@
+from google.transit import gtfs_realtime_pb2 as gtfs
+from ingest.src.decode import VehicleRecord
+from ingest.src.eta import ScheduleCache, StopTime, build_predictions, decode_trip_updates, predict_from_vehicle, predict_trip, service_day_start
+from datetime import date
+
+DAY = date(2024, 6, 3)
+BASE = service_day_start(DAY)
+# Stops ~1 km apart along a line, 10 minutes apart from 08:00
+STOPS = [StopTime(f"lb:s{i}", i, 8 * 3600 + 600 * i, -76.6 + 0.012 * i, 39.29) for i in range(1, 5)]
+
+
+def _feed(updates: list[dict], canceled=False) -> bytes:
+    msg = gtfs.FeedMessage()
+    msg.header.gtfs_realtime_version = "2.0"
+    ent = msg.entity.add(id="1")
+    tu = ent.trip_update
+    tu.trip.trip_id = "t1"
+    tu.trip.route_id = "10"
+    tu.trip.start_date = DAY.strftime("%Y%m%d")
+    if canceled:
+        tu.trip.schedule_relationship = gtfs.TripDescriptor.CANCELED
+    tu.vehicle.id = "v1"
+    for u in updates:
+        stu = tu.stop_time_update.add(stop_sequence=u["seq"])
+        if "delay" in u:
+            stu.arrival.delay = u["delay"]
+        if "time" in u:
+            stu.arrival.time = u["time"]
+        if u.get("skipped"):
+            stu.schedule_relationship = gtfs.TripUpdate.StopTimeUpdate.SKIPPED
+    return msg.SerializeToString()
+
+
+def test_decode_prefixes_ids():
+    (tu,) = decode_trip_updates(_feed([{"seq": 2, "delay": 60}]), "lb")
+    assert (tu.trip_id, tu.route_id, tu.vehicle_id) == ("lb:t1", "lb:10", "v1")
+    assert tu.updates[0].delay == 60 and tu.updates[0].time is None
+
+
+def test_delay_propagates_until_next_update():
+    now = BASE + 8 * 3600
+    updates = [{"seq": 2, "delay": 120}, {"seq": 3, "skipped": True}, {"seq": 4, "time": BASE + 8 * 3600 + 2400 + 30}]
+    (tu,) = decode_trip_updates(_feed(updates), "lb")
+    preds = predict_trip(tu, STOPS, now)
+    # Stop 1 precedes the first update; stop 3 is skipped
+    assert [(s, eta - BASE - 8 * 3600, d) for s, eta, d in preds] == [("lb:s2", 1320, 120), ("lb:s4", 2430, 30)]
+
+
+def test_canceled_trip_has_no_predictions():
+    (tu,) = decode_trip_updates(_feed([{"seq": 1, "delay": 0}], canceled=True), "lb")
+    assert predict_trip(tu, STOPS, BASE + 8 * 3600) == []
+
+
+def test_vehicle_fallback_is_never_earlier_than_schedule():
+    v = VehicleRecord("v2", "10", 39.29, -76.6, 10.0, 90, 0, trip_id="t2", current_stop_sequence=2)
+    preds = predict_from_vehicle(v, STOPS, BASE + 8 * 3600 + 600)
+    assert [s for s, _, _ in preds] == ["lb:s2", "lb:s3", "lb:s4"]
+    etas = [eta for _, eta, _ in preds]
+    assert etas == sorted(etas) and all(d >= 0 for _, _, d in preds)
+
+
+def test_vehicle_fallback_starts_at_reported_stop():
+    # No stop sequence: the feed's raw stop_id picks the start, not the nearest stop (s1)
+    v = VehicleRecord("v2", "10", 39.29, -76.6, 10.0, 90, 0, trip_id="t2", stop_id="s3")
+    preds = predict_from_vehicle(v, STOPS, BASE + 8 * 3600 + 600, feed="lb")
+    assert [s for s, _, _ in preds] == ["lb:s3", "lb:s4"]
+
+
+def test_schedule_cache_drops_trips_on_a_new_service_day():
+    cache = ScheduleCache(connect=None)
+    cache.reset("1", BASE + 8 * 3600)
+    cache._trips["lb:t1"] = STOPS
+    cache.reset("1", BASE + 20 * 3600)
+    assert cache._trips
+    cache.reset("1", BASE + 32 * 3600)
+    assert not cache._trips
+
+
+class _Schedule:
+    def get(self, trip_ids):
+        return {t: STOPS for t in trip_ids}
+
+
+def test_build_predictions_groups_by_stop():
+    tus = decode_trip_updates(_feed([{"seq": 3, "delay": 0}]), "lb")
+    v = VehicleRecord("v2", "11", 39.29, -76.6, 10.0, 90, 0, trip_id="t2", current_stop_sequence=4)
+    out = build_predictions("lb", tus, [v], _Schedule(), now=BASE + 8 * 3600)
+    assert sorted(out) == ["lb:s3", "lb:s4"]
+    assert sorted(m for _, m in out["lb:s4"]) == ['["lb:t1","lb:10","v1",0,"rt"]', '["lb:t2","lb:11","v2",0,"vehicle"]']
+
+
+def test_baseline_eta_matches_the_api():
+    # ingest keeps its own copy so it does not import the API package; they must agree
+    from app.services import eta as api_eta
+    from ingest.src.eta import baseline_eta
+    for speed in (None, 0, 0.5, 1.4, 8.3, 22, 40):
+        for remaining in (0, 1, 250.5, 1000, 48_000):
+            for scheduled in (None, 0, 1_700_000_000, 1_700_000_600, 1_800_000_000):
+                args = (speed, remaining, scheduled, 1_700_000_300)
+                assert baseline_eta(*args) == api_eta.baseline_eta(*args)
@@ -0,0 +1,28 @@
+from ingest.src.history import MinuteRecorder, decode_minute, encode_minute, minute_key
+
+MINUTE = 1_700_000_040  # 2023-11-14 22:14 UTC
+
+
+def test_minute_round_trip():
+    frames = [
+        (MINUTE + 2, [("lb:1", "lb:10", 39.290001, -76.610002, 90, 8.25), ("lb:2", "lb:11", 39.3, -76.6, None, None)]),
+        # lb:2 drops out, lb:3 appears, lb:1 moves
+        (MINUTE + 8, [("lb:3", "lb:10", 39.28, -76.62, 180, 0.0), ("lb:1", "lb:10", 39.290101, -76.609902, 92, 9.0)]),
+        (MINUTE + 14, []),
+    ]
+    out = decode_minute(encode_minute(MINUTE, frames))
+    assert [ts for ts, _ in out] == [MINUTE + 2, MINUTE + 8, MINUTE + 14]
+    for (_, want), (_, got) in zip(frames, out):
+        want = sorted(want)
+        got = sorted(got)
+        assert [g[:2] + g[4:] for g in got] == [w[:2] + w[4:] for w in want]
+        assert all(abs(g[2] - w[2]) < 1e-6 and abs(g[3] - w[3]) < 1e-6 for g, w in zip(got, want))
+
+
+def test_recorder_closes_minute_on_rollover():
+    rec = MinuteRecorder()
+    assert rec.add(MINUTE + 1, ["a"]) is None
+    assert rec.add(MINUTE + 59, ["b"]) is None
+    minute, frames = rec.add(MINUTE + 61, ["c"])
+    assert minute == MINUTE and [f[1] for f in frames] == [["a"], ["b"]]
+    assert minute_key(MINUTE) == "positions:minute:202311142214"
@@ -0,0 +1,38 @@
+import csv, io, zipfile
+from ingest.src.load_gtfs import CleanLines, header_columns, parse_sources, shape_rows
+
+
+def _member(text: bytes):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("shapes.txt", text)
+    return zipfile.ZipFile(buf).open("shapes.txt")
+
+
+def test_clean_lines_strips_bom_and_blank_records():
+    stream = CleanLines(_member(b"\xef\xbb\xbfshape_id,shape_pt_lat\r\n\r\nA,1\r\n  \r\nB,2\r\n"))
+    assert header_columns(stream.readline()) == ["shape_id", "shape_pt_lat"]
+    assert stream.read(3) == "A,1"
+    assert stream.read() == "\nB,2\n"
+
+
+def test_clean_lines_keeps_quoted_multiline_fields():
+    text = b'stop_id,stop_desc\r\ns1,"north side\r\n\r\nby the ""old"" bank"\r\ns2,plain\r\n\r\n\r\n'
+    data = CleanLines(_member(text)).read()
+    assert data == 'stop_id,stop_desc\ns1,"north side\r\n\r\nby the ""old"" bank"\ns2,plain\n'
+    rows = list(csv.reader(io.StringIO(data)))
+    assert rows[1] == ["s1", 'north side\r\n\r\nby the "old" bank'] and len(rows) == 3
+
+
+def test_shape_rows_orders_points_by_sequence():
+    text = (
+        b"shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence\n"
+        b"s1,39.3,-76.6,2\ns1,39.2,-76.5,1\ns2,39.0,-76.0,1\n"
+    )
+    rows = dict(shape_rows(CleanLines(_member(text))))
+    assert rows == {"s1": "SRID=4326;LINESTRING(-76.5 39.2,-76.6 39.3)"}
+
+
+def test_parse_sources_prefers_multi_feed_setting():
+    assert parse_sources("a=http://x, b = /tmp/b.zip,bad", "http://y") == {"a": "http://x", "b": "/tmp/b.zip"}
+    assert parse_sources("", "http://y") == {"default": "http://y"}
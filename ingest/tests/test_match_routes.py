@@ -0,0 +1,65 @@
+import numpy as np
+from ingest.src import match_routes
+from ingest.src.polyline import encode6
+
+
+def test_route_source_hash_ignores_order_and_duplicates():
+    a = match_routes.route_source_hash(["x", "y", "y"])
+    assert a == match_routes.route_source_hash(["y", "x"])
+    assert a != match_routes.route_source_hash(["x"])
+
+
+def test_shape_hash_depends_on_match_parameters(monkeypatch):
+    before = match_routes.shape_hash("abc")
+    monkeypatch.setattr(match_routes, "SEARCH_RADIUS", match_routes.SEARCH_RADIUS + 10)
+    assert match_routes.shape_hash("abc") != before
+    before = match_routes.shape_hash("abc")
+    # Matches are simplified before they are cached
+    monkeypatch.setattr(match_routes, "MATCH_SIMPLIFY_METERS", match_routes.MATCH_SIMPLIFY_METERS + 1)
+    assert match_routes.shape_hash("abc") != before
+
+
+def test_windows_overlap_and_cover():
+    spans = match_routes.windows(1000, 400, 50)
+    assert spans[0] == (0, 400) and spans[-1][1] == 1000
+    for (s0, e0), (s1, _) in zip(spans, spans[1:]):
+        assert e0 - s1 == 50
+    assert match_routes.windows(10, 400, 50) == [(0, 10)]
+
+
+def test_stitch_cuts_once_at_overlap_midpoint():
+    line = np.array([[-76.6 + i * 1e-4, 39.3] for i in range(100)])
+    pts = [{"lon": lon, "lat": lat} for lon, lat in line]
+    spans = [(0, 60), (40, 100)]
+    pieces = [[line[s:e]] for s, e in spans]
+    out = match_routes.stitch(pieces, spans, pts)
+    assert len(out) == 1 and np.array_equal(out[0], line)
+
+
+def test_stitch_keeps_gaps_within_a_window():
+    line = np.array([[-76.6 + i * 1e-4, 39.3] for i in range(100)])
+    pts = [{"lon": lon, "lat": lat} for lon, lat in line]
+    spans = [(0, 60), (40, 100)]
+    # The first window's match breaks between points 10 and 20, the second's at 80-90
+    pieces = [[line[:10], line[20:60]], [line[40:80], line[90:]]]
+    out = match_routes.stitch(pieces, spans, pts)
+    assert [len(p) for p in out] == [10, 60, 10]
+    assert np.array_equal(out[1], line[20:80]) and np.array_equal(out[2], line[90:])
+
+
+def test_match_points_dedupes_joins_and_keeps_gaps(monkeypatch):
+    line = np.round(np.array([[-76.6 + i * 1e-4, 39.3] for i in range(100)]), 6)
+    pts = [{"lon": lon, "lat": lat} for lon, lat in line]
+    # Edges share their end vertices; the match breaks between points 60 and 70
+    edges = [line[0:31], line[30:61], line[70:100]]
+    monkeypatch.setattr(match_routes, "call_valhalla", lambda chunk: {"edges": [{"shape": encode6(e)} for e in edges]})
+    parts = match_routes.match_points(pts)
+    assert [len(p) for p in parts] == [61, 30]
+    assert np.allclose(np.concatenate(parts), np.concatenate([line[:61], line[70:]]))
+
+
+def test_window_sizer_targets_latency():
+    sizer = match_routes.WindowSizer(target_seconds=2.0, lo=100, hi=10000)
+    assert sizer.size() == 10000
+    sizer.observe(1000, 1.0)  # 1 ms per point
+    assert sizer.size() == 2000
@@ -0,0 +1,48 @@
+import asyncio
+from google.transit import gtfs_realtime_pb2 as gtfs
+from ingest.src import main, writers
+
+
+class _FakeRedis:
+    """Accepts any command and returns nothing; only the writers' own state is checked."""
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _feed() -> bytes:
+    msg = gtfs.FeedMessage()
+    msg.header.gtfs_realtime_version = "2.0"
+    v = msg.entity.add(id="1").vehicle
+    v.vehicle.id = "bus1"
+    v.trip.route_id = "22"
+    v.position.latitude, v.position.longitude = 39.29, -76.61
+    v.timestamp = 1000
+    return msg.SerializeToString()
+
+
+def test_recovery_after_an_error_replaces_the_mock_fleet(monkeypatch):
+    monkeypatch.setattr(writers, "r", _FakeRedis())
+    monkeypatch.setattr(main, "_projection", type("P", (), {"refresh": lambda *a: None, "project": lambda *a: None})())
+    monkeypatch.setattr(main, "_positions", type("A", (), {"submit": lambda *a: None})())
+    results = iter([RuntimeError("feed down"), _feed()])
+
+    async def fetch(f, kind):
+        res = next(results)
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    monkeypatch.setattr(main, "_fetch", fetch)
+    f = {"name": "recover", "veh": "http://feed.invalid/vehicles"}
+    asyncio.run(main.poll_vehicles(f))
+    assert len(writers._written["recover"]) == 12
+    asyncio.run(main.poll_vehicles(f))
+    assert set(writers._written["recover"]) == {"bus1"}
+    assert set(writers._vehicles["recover"]) == {"bus1"} and set(writers._route_of["recover"]) == {"bus1"}
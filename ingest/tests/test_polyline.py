@@ -0,0 +1,40 @@
+import struct
+import numpy as np
+from ingest.src.polyline import decode6, decode6_many, encode6, linestring_from_wkb, merge_lines, simplify
+
+# Valhalla docs example path, [lon, lat]
+PATH = [[-76.6101, 39.2904], [-76.6093, 39.2911], [-76.6071, 39.2899], [-76.6070, 39.2899]]
+
+
+def test_decode6_round_trips():
+    assert np.allclose(decode6(encode6(PATH)), PATH, atol=1e-6)
+    assert decode6("").shape == (0, 2)
+
+
+def test_decode6_many_matches_single_decodes():
+    parts = [encode6(PATH[:2]), "", encode6(PATH[1:])]
+    out = decode6_many(parts)
+    assert [len(a) for a in out] == [2, 0, 3]
+    assert np.allclose(out[2], decode6(parts[2]))
+
+
+def test_merge_lines_joins_contiguous_edges_only():
+    a, b, c = np.array(PATH[:2]), np.array(PATH[1:3]), np.array([[0.0, 0.0], [1.0, 1.0]])
+    merged = merge_lines([a, b, c])
+    assert len(merged) == 2
+    assert np.array_equal(merged[0], np.array(PATH[:3]))
+
+
+def test_simplify_drops_collinear_vertices_and_keeps_corners():
+    line = np.array([[-76.61 + i * 1e-5, 39.29] for i in range(50)] + [[-76.6095, 39.2905]])
+    out = simplify(line, 1.0)
+    assert len(out) == 3
+    assert np.array_equal(out[[0, -1]], line[[0, -1]])
+    assert simplify(line, 0) is line
+
+
+def test_linestring_from_wkb_reads_both_byte_orders():
+    pts = [(-76.61, 39.29), (-76.60, 39.30)]
+    for order, flag in (("<", 1), (">", 0)):
+        wkb = struct.pack(f"{order}BII", flag, 2, 2) + struct.pack(f"{order}4d", *[c for p in pts for c in p])
+        assert np.allclose(linestring_from_wkb(wkb), pts)
@@ -0,0 +1,90 @@
+import numpy as np
+from ingest.src.decode import VehicleRecord
+from ingest.src.projection import ProjectionEngine, ShapeIndex
+
+# Two parallel east-west shapes ~1.1 km apart, and an L-shaped one
+SHAPES = {
+    "a": np.array([[-76.62, 39.29], [-76.60, 39.29], [-76.58, 39.29]]),
+    "b": np.array([[-76.62, 39.30], [-76.58, 39.30]]),
+    "c": np.array([[-76.60, 39.28], [-76.60, 39.31], [-76.59, 39.31]]),
+}
+
+
+def _brute(index: ShapeIndex, lon, lat, shape):
+    px, py = lon * index.kx, lat * index.ky
+    lo, hi = index.shape_range[shape]
+    t, d2 = index._nearest(px, py, np.arange(lo, hi))
+    j = int(np.argmin(d2))
+    return index.start[lo + j] + t[j] * np.sqrt(index.len2[lo + j]), np.sqrt(d2[j])
+
+
+def test_projection_matches_brute_force():
+    index = ShapeIndex(SHAPES, cell=200)
+    rnd = np.random.default_rng(3)
+    lon = rnd.uniform(-76.62, -76.58, 300)
+    lat = rnd.uniform(39.28, 39.31, 300)
+    shape = rnd.integers(0, 3, 300)
+    sid, along, off = index.project(lon, lat, shape)
+    assert (sid == shape).all()
+    for i in range(300):
+        a, o = _brute(index, lon[i], lat[i], shape[i])
+        assert abs(along[i] - a) < 1e-6 and abs(off[i] - o) < 1e-6
+
+
+def test_points_a_few_cells_off_match_brute_force():
+    # Random-walk shapes with diagonal segments; points 1-3 cells away, where the nearest
+    # segment can lie outside the 3x3 neighbourhood
+    rnd = np.random.default_rng(11)
+    shapes = {}
+    for k in range(10):
+        steps = rnd.normal(0, 0.004, (40, 2))
+        shapes[str(k)] = np.array([-76.6, 39.29]) + np.cumsum(steps, axis=0)
+    index = ShapeIndex(shapes, cell=100)
+    n = 2000
+    shape = rnd.integers(0, 10, n)
+    pick = rnd.integers(0, 40, n)
+    base = np.array([shapes[str(s)][p] for s, p in zip(shape, pick)])
+    ang = rnd.uniform(0, 2 * np.pi, n)
+    dist = rnd.uniform(100, 300, n)
+    lon = base[:, 0] + dist * np.cos(ang) / index.kx
+    lat = base[:, 1] + dist * np.sin(ang) / index.ky
+    sid, along, off = index.project(lon, lat, shape)
+    for i in range(n):
+        a, o = _brute(index, lon[i], lat[i], shape[i])
+        assert abs(along[i] - a) < 1e-6 and abs(off[i] - o) < 1e-6
+
+
+def test_tiny_cells_are_clamped():
+    assert ShapeIndex(SHAPES, cell=1).cell >= 19
+
+
+def test_distance_along_and_off_route():
+    index = ShapeIndex(SHAPES)
+    # 10 m north of shape a, halfway along its first segment
+    sid, along, off = index.project([-76.61], [39.29 + 10 / 111_195], [index.shape_index["a"]])
+    assert index.shape_ids[sid[0]] == "a"
+    assert abs(along[0] - index.shape_length[0] / 4) < 1
+    assert abs(off[0] - 10) < 0.1
+
+
+def test_route_constrains_unknown_trips():
+    index = ShapeIndex(SHAPES, {"r1": ["b"], "r2": ["a", "c"]})
+    # Nearer to a, but only b belongs to r1 (found by the fallback scan, beyond the grid
+    # neighbourhood); a point with neither trip nor route is skipped
+    sid, _, off = index.project([-76.61, -76.61], [39.292, 39.292], route=[index.route_index["r1"], -1])
+    assert index.shape_ids[sid[0]] == "b" and off[0] > 800
+    assert sid[1] == -1
+    # Within the grid neighbourhood: right by b, but r2 only runs a and c
+    sid, _, _ = index.project([-76.605], [39.2995], route=[index.route_index["r2"]])
+    assert index.shape_ids[sid[0]] in ("a", "c")
+
+
+def test_engine_sets_record_fields():
+    engine = ProjectionEngine()
+    engine.index = ShapeIndex({f"lb:{k}": v for k, v in SHAPES.items()})
+    engine.trip_shape = {"lb:t1": "lb:c"}
+    on = VehicleRecord("v1", "1", 39.30, -76.60, None, None, 0, trip_id="t1")
+    lost = VehicleRecord("v2", "9", 39.30, -76.60, None, None, 0)
+    engine.project("lb", [on, lost])
+    assert on.shape_id == "lb:c" and on.off_route == 0.0 and on.shape_dist > 0
+    assert lost.shape_id is None and "shape_dist" in lost.to_dict()
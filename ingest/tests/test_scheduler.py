@@ -0,0 +1,11 @@
+from ingest.src.scheduler import next_deadline
+
+
+def test_next_deadline_keeps_fixed_grid():
+    assert next_deadline(100.0, 6.0, 101.5) == 106.0
+
+
+def test_next_deadline_skips_missed_ticks():
+    # a run that overran by 2.5 periods resumes on the grid, not immediately
+    assert next_deadline(100.0, 6.0, 115.0) == 118.0
+    assert next_deadline(100.0, 6.0, 106.0) == 112.0
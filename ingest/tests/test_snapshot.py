@@ -0,0 +1,19 @@
+import msgpack
+from ingest.src.snapshot import decode_snapshot, encode_snapshot
+
+
+def test_snapshot_round_trips_quantized_and_nulls():
+    vehicles = [
+        {"id": "1", "route_id": "22", "lat": 39.2904123, "lon": -76.6122456, "speed": 7.25, "heading": 90, "ts": 995,
+         "trip_id": "t1", "stop_id": None, "current_stop_sequence": 4, "shape_id": "bus:22_0", "shape_dist": 1234.4,
+         "off_route": 3.2, "feed": "bus"},
+        {"id": "2", "route_id": "22", "lat": 39.3, "lon": -76.6, "speed": None, "heading": None, "ts": 1000, "feed": "rail"},
+    ]
+    snap = msgpack.unpackb(encode_snapshot(vehicles, 1000), raw=False)
+    assert snap["routes"] == ["22"] and snap["feeds"] == ["bus", "rail"] and snap["n"] == 2
+    a, b = decode_snapshot(encode_snapshot(vehicles, 1000))
+    assert (a["lat"], a["lon"]) == (39.29041, -76.61225)
+    assert a["speed"] == 7.25 and a["heading"] == 90 and a["ts"] == 995 and a["shape_dist"] == 1234
+    assert a["feed"] == "bus" and a["route_id"] == "22" and a["shape_id"] == "bus:22_0" and a["stop_id"] is None
+    assert b["speed"] is None and b["heading"] is None and b["shape_id"] is None and b["feed"] == "rail"
+    assert decode_snapshot(encode_snapshot([], 1000)) == []
@@ -1 +1,11 @@
--- Placeholder for helper geometry functions if needed later.
+-- Helper functions used by the seed and queries.
+
+-- GTFS "HH:MM:SS" (hours may exceed 23) to seconds since the service day's start; NULL if blank
+CREATE OR REPLACE FUNCTION gtfs_time_secs(t TEXT) RETURNS INT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT CASE WHEN t ~ '^\s*\d+:\d{2}:\d{2}\s*$' THEN
+    split_part(trim(t), ':', 1)::int * 3600
+    + split_part(trim(t), ':', 2)::int * 60
+    + split_part(trim(t), ':', 3)::int
+  END
+$$;
@@ -37,10 +37,78 @@ CREATE TABLE IF NOT EXISTS shapes(
   geom geometry(LineString, 4326)
 );
 
+ALTER TABLE trips ADD COLUMN IF NOT EXISTS headsign TEXT;
+
+CREATE TABLE IF NOT EXISTS calendar(
+  service_id TEXT PRIMARY KEY,
+  monday BOOLEAN,
+  tuesday BOOLEAN,
+  wednesday BOOLEAN,
+  thursday BOOLEAN,
+  friday BOOLEAN,
+  saturday BOOLEAN,
+  sunday BOOLEAN,
+  start_date DATE,
+  end_date DATE
+);
+
+CREATE TABLE IF NOT EXISTS calendar_dates(
+  service_id TEXT,
+  date DATE,
+  exception_type INT,
+  PRIMARY KEY (service_id, date)
+);
+
+-- stop_times with integer seconds since service-day start, denormalized with the trip's
+-- route, service and headsign; rebuilt per feed by the seed whenever trips or stop_times
+-- change, so a stop's next departures are one index range scan
+CREATE TABLE IF NOT EXISTS stop_departures(
+  stop_id TEXT NOT NULL,
+  departure_secs INT NOT NULL,
+  arrival_secs INT,
+  trip_id TEXT NOT NULL,
+  route_id TEXT,
+  service_id TEXT,
+  headsign TEXT,
+  stop_sequence INT
+);
+
+-- One zstd-compressed blob of vehicle positions per minute (format in ingest/src/history.py);
+-- the last hours also live in Redis as positions:minute:{YYYYMMDDHHmm}
+CREATE TABLE IF NOT EXISTS position_minutes(
+  minute TIMESTAMPTZ PRIMARY KEY,
+  frames INT NOT NULL,
+  vehicles INT NOT NULL,
+  blob BYTEA NOT NULL
+);
+
+-- Every observed vehicle position, for analytics. Partitioned by UTC day; ingest creates
+-- partitions (vehicle_positions_YYYYMMDD) as it writes and drops expired ones
+CREATE TABLE IF NOT EXISTS vehicle_positions(
+  ts TIMESTAMPTZ NOT NULL,
+  feed TEXT NOT NULL,
+  vehicle_id TEXT NOT NULL,
+  route_id TEXT,
+  trip_id TEXT,
+  lat DOUBLE PRECISION NOT NULL,
+  lon DOUBLE PRECISION NOT NULL,
+  speed REAL,
+  heading SMALLINT,
+  shape_id TEXT,
+  shape_dist REAL,
+  off_route REAL
+) PARTITION BY RANGE (ts);
+
 CREATE INDEX IF NOT EXISTS idx_stops_geom ON stops USING GIST(geom);
 CREATE INDEX IF NOT EXISTS idx_routes_type ON routes(type);
 CREATE INDEX IF NOT EXISTS idx_trips_route ON trips(route_id);
 CREATE INDEX IF NOT EXISTS idx_stop_times_trip ON stop_times(trip_id);
+CREATE INDEX IF NOT EXISTS idx_calendar_dates_date ON calendar_dates(date);
+CREATE INDEX IF NOT EXISTS idx_stop_departures_stop_secs ON stop_departures(stop_id, departure_secs) INCLUDE (service_id);
+CREATE INDEX IF NOT EXISTS idx_vehicle_positions_route_ts ON vehicle_positions(route_id, ts);
+CREATE INDEX IF NOT EXISTS idx_vehicle_positions_ts ON vehicle_positions USING BRIN(ts);
+-- Realtime ETAs look up whole trips
+CREATE INDEX IF NOT EXISTS idx_stop_departures_trip ON stop_departures(trip_id, stop_sequence);
 
 -- Overlay streets geometry (map-matched polylines per route)
 CREATE TABLE IF NOT EXISTS route_streets_geom(
@@ -48,3 +116,30 @@ CREATE TABLE IF NOT EXISTS route_streets_geom(
   geom geometry(MultiLineString, 4326),
   updated_at TIMESTAMPTZ DEFAULT now()
 );
+
+-- Web-mercator copy for vector tiles, kept in sync by Postgres and indexed on its own
+-- so tile queries do not transform every row before the bbox test
+ALTER TABLE route_streets_geom
+  ADD COLUMN IF NOT EXISTS geom_3857 geometry(MultiLineString, 3857)
+  GENERATED ALWAYS AS (ST_Transform(geom, 3857)) STORED;
+CREATE INDEX IF NOT EXISTS idx_route_streets_geom_3857 ON route_streets_geom USING GIST(geom_3857);
+
+-- Map-matched geometry per distinct shape, keyed by a hash of the shape and the matching
+-- parameters. Route geometry is assembled from these, and source_hash records which set of
+-- matches a route was built from, so unchanged shapes and routes are never re-matched.
+CREATE TABLE IF NOT EXISTS shape_matches(
+  hash TEXT PRIMARY KEY,
+  geom geometry(MultiLineString, 4326) NOT NULL,
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
+ALTER TABLE route_streets_geom ADD COLUMN IF NOT EXISTS source_hash TEXT;
+
+-- Fingerprints of each seeded feed archive and member file (CRC:size:layout tag; '*.zip' is the
+-- archive's sha256), so re-seeding only stages and diffs files that changed
+CREATE TABLE IF NOT EXISTS gtfs_files(
+  feed TEXT,
+  name TEXT,
+  fingerprint TEXT NOT NULL,
+  loaded_at TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (feed, name)
+);
@@ -25,6 +25,9 @@ export interface Vehicle {
   occupancy_percentage?: number;
 }
 
+export interface VehicleDelta { ts: number; upserts: Vehicle[]; removes: string[]; }
+export type VehicleStreamEvent = { type: 'snapshot'; vehicles: Vehicle[] } | { type: 'delta'; delta: VehicleDelta };
+
 @Injectable({ providedIn: 'root' })
 export class ApiService {
   private http = inject(HttpClient);
@@ -37,6 +40,25 @@ export class ApiService {
     return this.http.get<Vehicle[]>(`${API_BASE}/vehicles`);
   }
 
+  /** Server-sent snapshot + delta stream; errors if EventSource is unavailable or the stream drops. */
+  vehicleStream(params: { bbox?: string; route_id?: string } = {}): Observable<VehicleStreamEvent> {
+    return new Observable<VehicleStreamEvent>(sub => {
+      if (typeof EventSource === 'undefined') {
+        sub.error(new Error('EventSource unsupported'));
+        return;
+      }
+      const qs = new URLSearchParams(Object.entries(params).filter(([, v]) => !!v) as [string, string][]).toString();
+      const es = new EventSource(`${API_BASE}/vehicles/stream${qs ? `?${qs}` : ''}`);
+      es.addEventListener('snapshot', (e: MessageEvent) => sub.next({ type: 'snapshot', vehicles: JSON.parse(e.data) }));
+      es.addEventListener('delta', (e: MessageEvent) => sub.next({ type: 'delta', delta: JSON.parse(e.data) }));
+      es.onerror = () => {
+        es.close();
+        sub.error(new Error('vehicle stream closed'));
+      };
+      return () => es.close();
+    });
+  }
+
   routeShape(routeId: string) {
     return this.http.get<any>(`${API_BASE}/routes/${routeId}/shape`);
   }
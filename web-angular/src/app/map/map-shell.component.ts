@@ -74,10 +74,8 @@ export class MapShellComponent {
     // Note: You may see console warnings "Expected value to be of type number, but found null instead"
     // These come from the vector tile data in OpenFreeMap styles and are harmless - they don't affect functionality
     
-    // Initial poll
-    this.poll();
-    // Poll every 5s
-    setInterval(() => this.poll(), 5000);
+    // Live updates via the server-sent stream; fall back to polling every 5s if it fails
+    this.stream();
     // Load route colors
     this.loadRoutes();
   }
@@ -290,6 +288,31 @@ export class MapShellComponent {
     this.map.on('click', this.onMapClick);
   }
 
+  private pollTimer: any = null;
+
+  private stream() {
+    const byKey = new Map<string, Vehicle>();
+    const key = (v: Vehicle) => `${v.feed}:${v.id}`;
+    this.api.vehicleStream().subscribe({
+      next: ev => {
+        if (ev.type === 'snapshot') {
+          byKey.clear();
+          ev.vehicles.forEach(v => byKey.set(key(v), v));
+        } else {
+          ev.delta.upserts.forEach(v => byKey.set(key(v), v));
+          ev.delta.removes.forEach(k => byKey.delete(k));
+        }
+        this.vehicles.set(Array.from(byKey.values()));
+        this.updateVehicleLayer();
+      },
+      error: () => {
+        if (this.pollTimer) return;
+        this.poll();
+        this.pollTimer = setInterval(() => this.poll(), 5000);
+      },
+    });
+  }
+
   private poll() {
   this.api.vehicles().subscribe((vs: Vehicle[]) => {
       this.vehicles.set(vs);